@@ -1,16 +1,23 @@
-from fastapi import APIRouter
+import json
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from app.db.mongodb import db
-from app.services.ollama_ai import generate_student_report
+from app.services.ollama_ai import generate_student_report, stream_student_report, UNAVAILABLE_MESSAGE
+from app.services.ai.ollama_client import OllamaUnavailableError
+from app.services.analytics_engine import predictive_analytics, trend_analyzer
+from app.services import rollups
+from app.services.risk import bulk_risk
+from app.services.frame_processor import frame_processor
 from datetime import datetime, timedelta
+from typing import Optional
 
 router = APIRouter()
 
-@router.get("/student/{student_id}/report")
-async def get_student_report(student_id: str):
-    # Fetch student info
+async def _report_inputs(student_id: str):
+    """Student document and the attendance/engagement numbers the AI report is based on"""
     student = await db["students"].find_one({"student_id": student_id})
     if not student:
-        return {"error": "Student not found"}
+        return None, None
 
     # Fetch last 30 days attendance
     last_month = datetime.utcnow() - timedelta(days=30)
@@ -19,32 +26,114 @@ async def get_student_report(student_id: str):
         "timestamp": {"$gte": last_month}
     }).to_list(100)
 
-    attendance_pct = (len(logs) / 20) * 100 # Assuming 20 sessions per month
+    # Share of the student's scheduled sessions attended, from the presence matrix
+    attendance = frame_processor.recorder.presence.consistency(student_id, start=datetime.now() - timedelta(days=30))
+    attendance_pct = attendance["attendance_rate"] or 0.0
     engagement_scores = [log["engagement_score"] for log in logs]
     avg_engagement = sum(engagement_scores) / len(engagement_scores) if engagement_scores else 0
+    return student, {
+        "student_name": student["name"],
+        "attendance": attendance_pct,
+        "days_present": attendance["attended"],
+        "avg_engagement": avg_engagement,
+        "engagement_trends": engagement_scores[-5:],
+    }
+
+@router.get("/student/{student_id}/report")
+async def get_student_report(student_id: str):
+    student, numbers = await _report_inputs(student_id)
+    if not student:
+        return {"error": "Student not found"}
 
     # AI Analysis
-    ai_summary = generate_student_report(
-        attendance_data={"percentage": attendance_pct, "days_present": len(logs)},
-        engagement_trends=engagement_scores[-5:]
+    ai_summary = await generate_student_report(
+        attendance_data={"percentage": numbers["attendance"], "days_present": numbers["days_present"]},
+        engagement_trends=numbers["engagement_trends"]
     )
 
     return {
-        "student_name": student["name"],
-        "attendance": attendance_pct,
-        "avg_engagement": avg_engagement,
+        "student_name": numbers["student_name"],
+        "attendance": numbers["attendance"],
+        "avg_engagement": numbers["avg_engagement"],
         "ai_analysis": ai_summary
     }
 
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@router.get("/student/{student_id}/report/stream")
+async def stream_student_report_sse(student_id: str):
+    """
+    Server-Sent Events: a `metrics` event with the computed numbers as soon as
+    the database answers, `token` events while the model writes, then `done`
+    (or `error` if Ollama is unavailable).
+    """
+    student, numbers = await _report_inputs(student_id)
+    if not student:
+        raise HTTPException(status_code=404, detail="Student not found")
+
+    async def events():
+        yield _sse("metrics", numbers)
+        try:
+            async for fragment in stream_student_report(
+                attendance_data={"percentage": numbers["attendance"], "days_present": numbers["days_present"]},
+                engagement_trends=numbers["engagement_trends"]
+            ):
+                yield _sse("token", fragment)
+        except OllamaUnavailableError:
+            yield _sse("error", UNAVAILABLE_MESSAGE)
+            return
+        yield _sse("done", {})
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @router.get("/dashboard/stats")
 async def get_dashboard_stats():
     total_students = await db["students"].count_documents({})
     # simplified today stats
-    today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-    present_today = await db["attendance"].distinct("student_id", {"timestamp": {"$gte": today_start}})
+    present_today = await rollups.students_seen_on(db, datetime.now())
+    attendance_30d = frame_processor.recorder.presence.attendance(start=datetime.now() - timedelta(days=30))
     
     return {
         "total_students": total_students,
-        "present_today": len(present_today),
-        "absent_today": total_students - len(present_today)
+        "present_today": present_today,
+        "absent_today": total_students - present_today,
+        "attendance_rate": attendance_30d["attendance_rate"]
     }
+
+@router.get("/forecast")
+async def get_engagement_forecast():
+    # Latest 30 days, oldest first
+    daily_data = await rollups.latest_rows(db, grain="day", limit=30)
+    historical = [rollups.row_stats(d)["mean"] for d in daily_data]
+    if len(historical) < 3:
+        return {"forecast": [], "msg": "Insufficient data"}
+    return {"historical": historical, "forecast": predictive_analytics.forecast_engagement(historical, periods=7)}
+
+@router.get("/forecast/all")
+async def get_engagement_forecast_all(scope: str = "student", days: int = 30, periods: int = 7):
+    return await rollups.forecast_all(db, scope, days, periods)
+
+@router.get("/trends")
+async def get_engagement_trends(scope: str = "all", key: str = "*", days: int = 30):
+    return await rollups.engagement_trends(db, scope, key, days)
+
+@router.get("/class-trends")
+async def get_class_trends(class_name: Optional[str] = None, start: Optional[datetime] = None,
+                           end: Optional[datetime] = None):
+    query = {"class_name": class_name} if class_name else {}
+    if start or end:
+        query["timestamp"] = {**({"$gte": start} if start else {}), **({"$lt": end} if end else {})}
+    # Iterated in batches; memory does not grow with the number of records
+    cursor = db["attendance"].find(
+        query, {"_id": 0, "engagement_score": 1, "is_present": 1, "timestamp": 1}
+    ).sort("timestamp", 1).batch_size(1000)
+    return await trend_analyzer.analyze_class_trends_async(cursor)
+
+
+@router.get("/risk")
+async def get_bulk_risk(class_name: Optional[str] = None, page: int = 1, page_size: int = 50, order: str = "desc"):
+    recorder = frame_processor.recorder
+    return await bulk_risk(db, recorder.features, recorder.presence, class_name, page, page_size,
+                           descending=order != "asc", active_sessions=recorder.sessions.active_sessions())
@@ -1,53 +1,121 @@
-from fastapi import APIRouter, File, UploadFile, HTTPException
-import cv2
-import numpy as np
-from datetime import datetime
-from app.services.face_recog import recognize_faces
-from app.services.engagement import engagement_detector
+from fastapi import APIRouter, File, Form, UploadFile, HTTPException, WebSocket, WebSocketDisconnect
+from app.services.camera_session import CameraSession, camera_sessions
+from app.services.frame_processor import frame_processor, InvalidFrameError, MAX_BATCH_FRAMES
+from app.services.stream_session import StreamSession
+from app.services.vision_pool import PoolSaturatedError
+from app.services.video_processing import VideoJob, VideoReader, VideoOpenError, VIDEO_SAMPLE_FPS, running_jobs, start_background, upload_path
 from app.db.mongodb import db
-from app.db.models import AttendanceLog
+from datetime import datetime
+from typing import List, Optional
 
 router = APIRouter()
 
 @router.post("/process-frame")
-async def process_frame(image: UploadFile = File(...)):
+async def process_frame(image: UploadFile = File(...), camera_id: str = Form("default")):
     """
     Receives a frame from the frontend, identifies students and calculates engagement.
     """
     contents = await image.read()
-    nparr = np.frombuffer(contents, np.uint8)
-    frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-    # 1. Fetch all known face encodings
-    students_cursor = db["students"].find({}, {"student_id": 1, "face_encoding": 1})
-    known_ids = []
-    known_encodings = []
-    async for student in students_cursor:
-        known_ids.append(student["student_id"])
-        known_encodings.append(student["face_encoding"])
-
-    if not known_encodings:
-        return {"status": "no_students_registered"}
-
-    # 2. Recognize faces
-    found_ids = recognize_faces(frame, known_encodings, known_ids)
-
-    # 3. Detect Engagement
-    engagement_metrics = engagement_detector.detect_engagement(frame)
-
-    # 4. Log Attendance (if any recognized)
-    results = []
-    for i, student_id in enumerate(found_ids):
-        # Match metrics with face index (simplified logic for demo)
-        score = engagement_metrics[i]["engagement_score"] if i < len(engagement_metrics) else 100.0
-        
-        log = {
-            "student_id": student_id,
-            "timestamp": datetime.utcnow(),
-            "engagement_score": score,
-            "is_present": True
-        }
-        await db["attendance"].insert_one(log)
-        results.append(log)
-
-    return {"recognized_students": found_ids, "count": len(found_ids)}
+    session = camera_sessions.get(camera_id)
+    try:
+        return await frame_processor.process(contents, session)
+    except PoolSaturatedError:
+        raise HTTPException(status_code=503, detail="Vision workers busy, frame dropped", headers={"Retry-After": "1"})
+    except InvalidFrameError:
+        raise HTTPException(status_code=400, detail="Invalid image")
+
+@router.post("/process-batch")
+async def process_batch(images: List[UploadFile] = File(...), captured_at: Optional[List[datetime]] = Form(None),
+                        camera_id: str = Form("default")):
+    """
+    Buffered frames of one camera (e.g. a lecture recorder catching up), one
+    captured_at per image; without timestamps the upload order is used.
+    """
+    if len(images) > MAX_BATCH_FRAMES:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_FRAMES} frames per batch")
+    if captured_at and len(captured_at) != len(images):
+        raise HTTPException(status_code=400, detail="captured_at must have one entry per image")
+    now = datetime.now()
+    times = [t.astimezone().replace(tzinfo=None) if t.tzinfo else t for t in captured_at] if captured_at else [now] * len(images)
+    frames = [(await image.read(), t) for image, t in zip(images, times)]
+    session = camera_sessions.get(camera_id)
+    try:
+        return await frame_processor.process_batch(frames, session)
+    except PoolSaturatedError:
+        raise HTTPException(status_code=503, detail="Vision workers busy, batch dropped", headers={"Retry-After": "1"})
+
+@router.post("/sessions/start")
+async def start_class_session(class_name: str = Form(...), camera_id: str = Form("default")):
+    """Starts a class session for a camera; detections are attributed to it until stopped"""
+    session = await frame_processor.recorder.sessions.start_session(class_name, camera_id)
+    return session.to_dict()
+
+@router.post("/sessions/{session_id}/stop")
+async def stop_class_session(session_id: str):
+    session = await frame_processor.recorder.sessions.stop_session(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="No active session with this id")
+    return session.to_dict()
+
+@router.get("/sessions")
+async def list_class_sessions():
+    return [s.to_dict() for s in frame_processor.recorder.sessions.active_sessions()]
+
+@router.get("/sessions/{session_id}/absent")
+async def list_absent_students(session_id: str):
+    return {"session_id": session_id, "absent": frame_processor.recorder.presence.absent_from(session_id)}
+
+@router.get("/presence")
+async def get_presence(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                       class_name: Optional[str] = None, student_id: Optional[str] = None):
+    presence = frame_processor.recorder.presence
+    if student_id:
+        return {"student_id": student_id, **presence.consistency(student_id, start, end)}
+    return presence.attendance(start=start, end=end, class_name=class_name)
+
+@router.post("/video-jobs")
+async def start_video_job(path: str = Form(...), class_name: Optional[str] = Form(None),
+                          session_id: Optional[str] = Form(None), sample_fps: float = Form(VIDEO_SAMPLE_FPS),
+                          recorded_at: Optional[datetime] = Form(None), job_id: Optional[str] = Form(None)):
+    """
+    Processes a recorded lecture from the upload directory (VIDEO_UPLOAD_DIR,
+    path is relative to it) in the background, into the given active session
+    or a new session for class_name. Starting a job id that was interrupted
+    resumes it; poll GET /video-jobs/{job_id} for progress.
+    """
+    if not (class_name or session_id):
+        raise HTTPException(status_code=400, detail="class_name or session_id is required")
+    if recorded_at is not None and recorded_at.tzinfo:
+        recorded_at = recorded_at.astimezone().replace(tzinfo=None)
+    try:
+        path = upload_path(path)
+        job = VideoJob(db, frame_processor, path, job_id=job_id, class_name=class_name, session_id=session_id,
+                       sample_fps=sample_fps, recorded_at=recorded_at)
+        VideoReader(path, sample_fps)  # an unreadable video fails the request, not the background task
+    except (OSError, VideoOpenError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not start_background(job):
+        raise HTTPException(status_code=409, detail="Video job is already running")
+    return {"job_id": job.job_id, "started": True}
+
+@router.get("/video-jobs/{job_id}")
+async def get_video_job(job_id: str):
+    job = await db.video_jobs.find_one({"job_id": job_id}, {"_id": 0})
+    if job is None:
+        raise HTTPException(status_code=404, detail="Video job not found")
+    job["running"] = job_id in running_jobs
+    return job
+
+@router.websocket("/stream")
+async def attendance_stream(websocket: WebSocket, camera_id: str = "default"):
+    """
+    Long-lived camera feed: the client sends binary JPEG frames, the server pushes
+    JSON results back as each frame is analysed. Tracker and rate limit live on the connection.
+    """
+    await websocket.accept()
+    # Per-connection tracker and gallery snapshot, not shared with HTTP frames from the same camera_id
+    stream = StreamSession(websocket, CameraSession(camera_id), frame_processor)
+    try:
+        await stream.run()
+    except WebSocketDisconnect:
+        pass
@@ -2,7 +2,9 @@ from fastapi import APIRouter, UploadFile, File, Form, HTTPException
 from datetime import datetime
 import aiofiles
 import uuid
-from app.services.face_recog import encode_face
+from app.services.face_gallery import face_gallery
+from app.services.face_encoding import encoding_fields
+from app.services.vision_pool import vision_pool, encode_image, PoolSaturatedError
 from app.db.mongodb import db
 
 router = APIRouter()
@@ -26,17 +28,30 @@ async def register_student(
     async with aiofiles.open(path, "wb") as out_file:
         content = await image.read()
         await out_file.write(content)
-    # encode
-    encoding = encode_face(path)
+    # encode on a warm vision worker, off the event loop
+    try:
+        encoding = await vision_pool.run(encode_image, content)
+    except PoolSaturatedError:
+        raise HTTPException(status_code=503, detail="Vision workers busy, retry shortly", headers={"Retry-After": "1"})
     if encoding is None:
         raise HTTPException(status_code=400, detail="No face detected")
     doc = {
         "student_id": student_id,
         "name": name,
         "class": class_name,
-        "face_encoding": encoding,
+        **encoding_fields(encoding),
         "image_path": path,
         "registered_at": datetime.utcnow(),
     }
     await db["students"].insert_one(doc)
+    face_gallery.upsert(student_id, encoding)
+    return {"status": "ok", "student_id": student_id}
+
+
+@router.delete("/{student_id}")
+async def delete_student(student_id: str):
+    result = await db["students"].delete_one({"student_id": student_id})
+    face_gallery.remove(student_id)
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Student not found")
     return {"status": "ok", "student_id": student_id}
@@ -1,20 +1,36 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import List, Optional, Union
 from datetime import datetime
 
 class StudentSchema(BaseModel):
     student_id: str
     name: str
     class_name: str = Field(alias="class")
-    face_encoding: List[float]
+    face_encoding: Union[bytes, List[float]]  # little-endian float32 blob; legacy documents hold a list
+    face_encoding_v: Optional[int] = None  # storage format version, None for legacy arrays
+    face_encoding_model: Optional[str] = None
     image_path: str
     registered_at: datetime = Field(default_factory=datetime.utcnow)
 
+class ClassSessionSchema(BaseModel):
+    session_id: str
+    class_name: Optional[str] = None
+    camera_id: str = "default"
+    started_at: datetime = Field(default_factory=datetime.utcnow)
+    ended_at: Optional[datetime] = None
+    auto: bool = False  # implicit daily session for a camera with no explicit session
+    status: str = "active"  # active | closed
+
 class AttendanceLog(BaseModel):
+    """One document per student per class session"""
     student_id: str
-    timestamp: datetime = Field(default_factory=datetime.utcnow)
+    timestamp: datetime = Field(default_factory=datetime.utcnow)  # same as first_seen
     session_id: str
-    engagement_score: float  # 0 to 100
+    first_seen: datetime = Field(default_factory=datetime.utcnow)
+    last_seen: datetime = Field(default_factory=datetime.utcnow)
+    detections: int = 0
+    engagement_score: float  # 0 to 100, mean over the session's detections
+    emotion: str = "neutral"  # most frequent emotion in the session
     is_present: bool = True
 
 class EngagementLog(BaseModel):
@@ -25,3 +41,21 @@ class EngagementLog(BaseModel):
     head_pose: dict  # {"pitch": x, "yaw": y, "roll": z}
     is_missing: bool
     engagement_snapshot: float
+
+class EngagementBucket(BaseModel):
+    """Packed engagement samples of one student in one session (see services/engagement_buckets.py)"""
+    student_id: str
+    session_id: str
+    seq: int  # bucket number within the session
+    v: int = 1  # packing format version
+    start: datetime
+    end: datetime
+    count: int
+    dt: bytes  # uint16 timestamp deltas in deciseconds, first one relative to start
+    score: bytes  # uint8, engagement score * 2
+    base: bytes  # uint8, base score * 2
+    posture: bytes  # uint8, posture score * 2
+    emotion: bytes  # uint8 emotion codes
+    score_sum: float
+    score_min: float
+    score_max: float
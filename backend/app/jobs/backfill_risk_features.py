@@ -0,0 +1,44 @@
+"""
+Risk Feature Backfill
+Rebuilds the risk_features collection by replaying every closed class
+session, oldest first, through the same O(1) update the live server applies
+when a session closes.
+
+Usage (from backend/):
+    python -m app.jobs.backfill_risk_features
+
+Run while the server is stopped; the collection is cleared before it is rebuilt.
+"""
+
+import asyncio
+import logging
+from typing import Dict
+
+from app.db.mongodb import db
+from app.services.class_sessions import ClassSessionManager
+from app.services.risk_features import RiskFeatureStore
+
+logger = logging.getLogger(__name__)
+
+
+async def backfill(database=db) -> Dict:
+    await database.risk_features.delete_many({})
+    sessions = ClassSessionManager(database)
+    store = RiskFeatureStore(database)
+    await store.start()
+    replayed = 0
+    async for doc in database.class_sessions.find({"status": "closed"}).sort("started_at", 1):
+        await store.session_closed(await sessions.load_session(doc))
+        replayed += 1
+    await store.stop()
+    return {"sessions": replayed, "students": len(store.features)}
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    result = asyncio.run(backfill())
+    logger.info(f"Risk feature backfill complete: {result['sessions']} session(s), {result['students']} student(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Rollup Backfill
+Rebuilds the engagement_rollups collection from stored samples: packed
+engagement buckets plus legacy per-frame attendance documents.
+
+Usage (from backend/):
+    python -m app.jobs.backfill_rollups
+
+Rollups are incremented by the live server, so run this while the server is
+stopped; the collection is cleared before it is rebuilt.
+"""
+
+import asyncio
+import logging
+from typing import Dict
+
+from app.db.mongodb import db
+from app.services.engagement_buckets import decode_bucket
+from app.services.rollups import ALL_SCOPE, RollupAccumulator, ensure_indexes
+from app.services.write_behind import WriteBehindBuffer
+
+logger = logging.getLogger(__name__)
+
+# Accumulated cells written out once this many are pending
+FLUSH_CELLS = 20000
+
+
+async def backfill(database=db) -> Dict:
+    classes = {s["student_id"]: s.get("class") or None
+               async for s in database.students.find({}, {"student_id": 1, "class": 1})}
+    session_classes = {s["session_id"]: s.get("class_name")
+                       async for s in database.class_sessions.find({}, {"session_id": 1, "class_name": 1})}
+
+    def scopes(student_id: str, class_name=None):
+        result = [ALL_SCOPE, ("student", student_id)]
+        cls = class_name or classes.get(student_id)
+        if cls:
+            result.append(("class", cls))
+        return result
+
+    await database.engagement_rollups.delete_many({})
+    await ensure_indexes(database)
+    writer = WriteBehindBuffer(database.engagement_rollups, bulk=True)
+    writer.start()
+    acc = RollupAccumulator()
+    samples = 0
+
+    # Packed samples (current format)
+    async for doc in database.engagement_buckets.find({}):
+        series = decode_bucket(doc)
+        acc.add_array(scopes(doc["student_id"], session_classes.get(doc["session_id"])),
+                      series["timestamp"], series["score"])
+        samples += len(series["score"])
+        if len(acc) >= FLUSH_CELLS:
+            await writer.add_many(acc.drain())
+
+    # Per-frame documents written before sessions existed
+    async for log in database.attendance.find({"session_id": {"$exists": False}},
+                                              {"student_id": 1, "timestamp": 1, "engagement_score": 1}):
+        if log.get("timestamp") is None or log.get("engagement_score") is None:
+            continue
+        acc.add(scopes(log["student_id"]), log["timestamp"], float(log["engagement_score"]))
+        samples += 1
+        if len(acc) >= FLUSH_CELLS:
+            await writer.add_many(acc.drain())
+
+    await writer.add_many(acc.drain())
+    await writer.stop()
+    return {"samples": samples, "rows": writer.written}
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    result = asyncio.run(backfill())
+    logger.info(f"Rollup backfill complete: {result['samples']} sample(s) -> {result['rows']} row update(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Face Encoding Migration
+Converts student documents whose face_encoding is still a BSON array of
+doubles into the packed float32 Binary format (see services/face_encoding.py).
+Documents already migrated are left untouched, so the job can be re-run.
+
+Usage (from backend/):
+    python -m app.jobs.migrate_face_encodings
+
+Safe to run while the server is up: readers accept both formats.
+"""
+
+import asyncio
+import logging
+from typing import Dict
+
+from pymongo import UpdateOne
+
+from app.db.mongodb import db
+from app.services.face_encoding import encoding_fields
+
+logger = logging.getLogger(__name__)
+
+# Updates sent per bulk write
+BATCH_SIZE = 500
+
+
+async def migrate(database=db) -> Dict:
+    converted = 0
+    ops = []
+    cursor = database.students.find({"face_encoding": {"$type": "array"}}, {"_id": 1, "face_encoding": 1})
+    async for doc in cursor:
+        # Matching on the array type keeps a concurrent re-registration from being overwritten
+        ops.append(UpdateOne({"_id": doc["_id"], "face_encoding": {"$type": "array"}},
+                             {"$set": encoding_fields(doc["face_encoding"])}))
+        if len(ops) >= BATCH_SIZE:
+            converted += (await database.students.bulk_write(ops, ordered=False)).modified_count
+            ops = []
+    if ops:
+        converted += (await database.students.bulk_write(ops, ordered=False)).modified_count
+    remaining = await database.students.count_documents({"face_encoding": {"$type": "array"}})
+    return {"converted": converted, "remaining": remaining}
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    result = asyncio.run(migrate())
+    logger.info(f"Face encoding migration complete: {result['converted']} converted, {result['remaining']} legacy left")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Video Processing
+Runs a recorded lecture through the vision pipeline and records attendance
+and engagement for it (see services/video_processing.py).
+
+Usage (from backend/):
+    python -m app.jobs.process_video lecture.mp4 --class-name CS101
+    python -m app.jobs.process_video lecture.mp4 --class-name CS101 --fps 2 --recorded-at 2024-03-04T09:00
+
+Re-running the same command resumes an interrupted job from its last saved
+frame. Presence and risk state held in memory by a running server is not
+refreshed by this job; use POST /api/v1/attendance/video-jobs for that, or run
+this while the server is stopped.
+"""
+
+import argparse
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict
+
+from app.db.mongodb import db
+from app.services.face_gallery import face_gallery
+from app.services.frame_processor import FrameProcessor
+from app.services.video_processing import VideoJob, VIDEO_SAMPLE_FPS, VIDEO_CHUNK_FRAMES
+from app.services.vision_pool import vision_pool
+
+logger = logging.getLogger(__name__)
+
+
+async def process(args: argparse.Namespace, database=db) -> Dict:
+    vision_pool.start()
+    processor = FrameProcessor(database)
+    await processor.start()
+    try:
+        loaded = await face_gallery.load(database.students)
+        logger.info(f"Face gallery loaded: {loaded} encoding(s)")
+        job = VideoJob(database, processor, args.path, job_id=args.job_id, class_name=args.class_name,
+                       session_id=args.session, sample_fps=args.fps, recorded_at=args.recorded_at,
+                       chunk_frames=args.chunk_frames)
+        logger.info(f"Processing {args.path} as job {job.job_id}")
+        return await job.run()
+    finally:
+        await processor.stop()
+        vision_pool.shutdown()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Process a recorded lecture into attendance and engagement")
+    parser.add_argument("path", help="video file")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--class-name", help="start (and close) a class session for this class")
+    target.add_argument("--session", help="record into this active class session")
+    parser.add_argument("--fps", type=float, default=VIDEO_SAMPLE_FPS, help="frames analysed per second of video")
+    parser.add_argument("--recorded-at", type=datetime.fromisoformat, default=None,
+                        help="wall-clock start of the recording (default: now minus the video length)")
+    parser.add_argument("--job-id", default=None, help="job id (default: derived from the file)")
+    parser.add_argument("--chunk-frames", type=int, default=VIDEO_CHUNK_FRAMES)
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    result = asyncio.run(process(parse_args()))
+    logger.info(f"Video job {result['job_id']} {result['status']}: {result['frames_analyzed']} frames, "
+                f"{result['detections']} detections in {result.get('processing_seconds')}s")
+
+
+if __name__ == "__main__":
+    main()
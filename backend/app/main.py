@@ -2,6 +2,11 @@ from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from app.api.v1.routes import router as api_router
+from app.db.mongodb import db
+from app.services.face_gallery import face_gallery
+from app.services.vision_pool import vision_pool
+from app.services.ai.ollama_client import ollama_client
+from app.services.frame_processor import frame_processor
 import logging
 
 # Setup Logging
@@ -32,6 +37,23 @@ async def global_exception_handler(request: Request, exc: Exception):
         content={"message": "Internal Server Error", "detail": str(exc)},
     )
 
+@app.on_event("startup")
+async def startup_event():
+    vision_pool.start()
+    await frame_processor.start()
+    try:
+        loaded = await face_gallery.load(db["students"])
+        logger.info(f"Face gallery loaded: {loaded} encoding(s)")
+    except Exception as e:
+        logger.error(f"Face gallery load failed: {str(e)}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await frame_processor.stop()
+    face_gallery.save_index()
+    vision_pool.shutdown()
+    await ollama_client.aclose()
+
 # Include API Router
 app.include_router(api_router, prefix="/api/v1")
 
@@ -41,9 +63,18 @@ async def health_check():
         "status": "healthy", 
         "engine": "FastAPI",
         "db": "MongoDB (Local)",
-        "ai": ["OpenCV", "MediaPipe", "Ollama"]
+        "ai": ["OpenCV", "MediaPipe", "Ollama"],
+        "vision_pool": vision_pool.stats(),
+        "writes": frame_processor.recorder.stats(),
+        "ollama": ollama_client.stats()
     }
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness probe: 200 once every vision worker has loaded and warmed its models, 503 until then"""
+    readiness = vision_pool.readiness()
+    return JSONResponse(readiness, status_code=200 if readiness["ready"] else 503)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -8,13 +8,6 @@ import numpy as np
 from typing import Dict, List, Tuple, Optional
 import mediapipe as mp
 
-try:
-    from deepface import DeepFace
-    DEEPFACE_AVAILABLE = True
-except ImportError:
-    DEEPFACE_AVAILABLE = False
-    print("⚠️  DeepFace not installed. Emotion recognition will be limited.")
-
 
 class EmotionRecognitionEngine:
     """
@@ -24,7 +17,15 @@ class EmotionRecognitionEngine:
     
     def __init__(self):
         self.emotions = ['angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral']
-        self.enabled = DEEPFACE_AVAILABLE
+        # Imported here so TensorFlow only loads when an engine is created
+        try:
+            from deepface import DeepFace
+            self._deepface = DeepFace
+            self.enabled = True
+        except ImportError:
+            self._deepface = None
+            self.enabled = False
+            print("⚠️  DeepFace not installed. Emotion recognition will be limited.")
         
     def analyze_emotions(self, frame: np.ndarray, face_locations: List[Tuple]) -> List[Dict]:
         """
@@ -46,7 +47,7 @@ class EmotionRecognitionEngine:
                     continue
                     
                 # Analyze with DeepFace
-                analysis = DeepFace.analyze(
+                analysis = self._deepface.analyze(
                     face_roi,
                     actions=['emotion'],
                     enforce_detection=False,
@@ -93,16 +94,18 @@ class PostureAnalyzer:
             print(f"⚠️  Pose detection initialization failed: {e}")
             self.enabled = False
     
-    def analyze_posture(self, frame: np.ndarray) -> List[Dict]:
+    def analyze_posture(self, frame: np.ndarray, rgb: Optional[np.ndarray] = None) -> List[Dict]:
         """
         Analyze posture for all people in frame
-        Returns: List of posture analysis dictionaries
+        rgb may be passed when the caller already converted the frame
+        Returns: List of posture analysis dictionaries; 'anchor' is the nose
+        position in pixels, used to attach the result to a face box
         """
         if not self.enabled:
             return []
         
         try:
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            rgb_frame = rgb if rgb is not None else cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
             results = self.pose.process(rgb_frame)
             
             if not results.pose_landmarks:
@@ -127,6 +130,10 @@ class PostureAnalyzer:
                 score -= 20
             
             posture_data['posture_score'] = max(0, min(100, score))
+
+            h, w = rgb_frame.shape[:2]
+            nose = landmarks[self.mp_pose.PoseLandmark.NOSE.value]
+            posture_data['anchor'] = (int(nose.x * w), int(nose.y * h))
             
             return [posture_data]
             
@@ -271,7 +278,4 @@ class AttentionHeatmapGenerator:
         return zones
 
 
-# Initialize global instances
-emotion_engine = EmotionRecognitionEngine()
-posture_analyzer = PostureAnalyzer()
-attention_heatmap = AttentionHeatmapGenerator()
+# Engine and analyzer instances are created on demand by app.services.model_registry
@@ -1,21 +1,221 @@
-import subprocess
+"""
+Ollama Client
+Single async client for the local Ollama server. Requests share a keep-alive
+connection pool, are limited by a concurrency semaphore with a bounded wait
+queue, and pass through a circuit breaker so that a stopped model fails in
+milliseconds instead of after the full timeout. Per-call latency and token
+rate are recorded for /health.
+"""
+
+import os
+import time
 import json
-import requests
-from typing import Optional
-
-OLLAMA_HTTP = "http://127.0.0.1:11434/v1/generate"
-
-def generate_with_ollama(prompt: str, model: str = "mistral") -> str:
-    # try HTTP API
-    try:
-        resp = requests.post(OLLAMA_HTTP, json={"model": model, "prompt": prompt}, timeout=10)
-        data = resp.json()
-        return data.get("text") or json.dumps(data)
-    except Exception:
-        # fallback to CLI
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "mistral")  # or deepseek-r1:7b
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "30"))
+OLLAMA_MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "2"))
+# Calls allowed to wait for a slot; beyond this they are rejected immediately
+OLLAMA_MAX_QUEUE = int(os.getenv("OLLAMA_MAX_QUEUE", "16"))
+OLLAMA_BREAKER_THRESHOLD = int(os.getenv("OLLAMA_BREAKER_THRESHOLD", "3"))
+OLLAMA_BREAKER_COOLDOWN = float(os.getenv("OLLAMA_BREAKER_COOLDOWN", "30"))
+
+
+class OllamaUnavailableError(RuntimeError):
+    """Raised when a call is not attempted (breaker open, queue full) or fails"""
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `threshold` consecutive failures; after `cooldown`
+    seconds one trial call is let through (half-open) and its outcome decides.
+    """
+
+    def __init__(self, threshold: int = OLLAMA_BREAKER_THRESHOLD, cooldown: float = OLLAMA_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def abandon(self):
+        """A call ended without an outcome (e.g. the client went away)"""
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+
+class OllamaClient:
+    def __init__(self, base_url: str = OLLAMA_BASE_URL, model: str = OLLAMA_MODEL,
+                 timeout: float = OLLAMA_TIMEOUT, max_concurrency: int = OLLAMA_MAX_CONCURRENCY,
+                 max_queue: int = OLLAMA_MAX_QUEUE, breaker: Optional[CircuitBreaker] = None):
+        self.base_url = base_url
+        self.model = model
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.breaker = breaker or CircuitBreaker()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._waiting = 0
+        self._latencies: Deque[float] = deque(maxlen=200)
+        self._token_rates: Deque[float] = deque(maxlen=200)
+        self._first_token: Deque[float] = deque(maxlen=200)
+        self.calls = 0
+        self.failures = 0
+        self.fast_fails = 0
+        self.rejected = 0
+
+    def _http(self) -> httpx.AsyncClient:
+        # Created lazily so the pool and semaphore bind to the running event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout, connect=2.0),
+                limits=httpx.Limits(max_connections=self.max_concurrency,
+                                    max_keepalive_connections=self.max_concurrency),
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    @asynccontextmanager
+    async def _slot(self):
+        """Admission control shared by all calls: queue bound, breaker, concurrency limit"""
+        if self._waiting >= self.max_queue:
+            self.rejected += 1
+            raise OllamaUnavailableError("Ollama request queue full")
+        if not self.breaker.allow():
+            self.fast_fails += 1
+            raise OllamaUnavailableError("Ollama circuit open")
+
+        self._waiting += 1
         try:
-            cmd = ["ollama", "generate", model, "--prompt", prompt]
-            proc = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            return proc.stdout
-        except Exception as e:
-            return f"OLLAMA_ERROR: {e}"
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        self.calls += 1
+        try:
+            yield
+        except (httpx.HTTPError, ValueError) as e:
+            self.failures += 1
+            self.breaker.record_failure()
+            raise OllamaUnavailableError(f"Ollama request failed: {str(e)}") from e
+        except BaseException:
+            self.breaker.abandon()
+            raise
+        finally:
+            self._semaphore.release()
+        self.breaker.record_success()
+
+    def _record(self, started: float, data: Dict):
+        self._latencies.append(time.perf_counter() - started)
+        # eval_duration is in nanoseconds
+        if data.get("eval_count") and data.get("eval_duration"):
+            self._token_rates.append(data["eval_count"] / (data["eval_duration"] / 1e9))
+
+    async def generate(self, prompt: str, model: Optional[str] = None) -> str:
+        """Completes a prompt. Raises OllamaUnavailableError instead of waiting on a dead server"""
+        client = self._http()
+        async with self._slot():
+            started = time.perf_counter()
+            response = await client.post("/api/generate", json={
+                "model": model or self.model,
+                "prompt": prompt,
+                "stream": False,
+            })
+            response.raise_for_status()
+            data = response.json()
+            self._record(started, data)
+            return data.get("response", "")
+
+    async def generate_stream(self, prompt: str, model: Optional[str] = None) -> AsyncIterator[str]:
+        """Yields response fragments as Ollama produces them"""
+        client = self._http()
+        async with self._slot():
+            started = time.perf_counter()
+            async with client.stream("POST", "/api/generate", json={
+                "model": model or self.model,
+                "prompt": prompt,
+                "stream": True,
+            }) as response:
+                response.raise_for_status()
+                first = True
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if first:
+                        self._first_token.append(time.perf_counter() - started)
+                        first = False
+                    if chunk.get("response"):
+                        yield chunk["response"]
+                    if chunk.get("done"):
+                        self._record(started, chunk)
+                        break
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> Dict:
+        latencies = sorted(self._latencies)
+
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1)
+
+        return {
+            "breaker": self.breaker.state,
+            "calls": self.calls,
+            "failures": self.failures,
+            "fast_fails": self.fast_fails,
+            "rejected": self.rejected,
+            "waiting": self._waiting,
+            "latency_p50_ms": percentile(0.5),
+            "latency_p95_ms": percentile(0.95),
+            "first_token_avg_ms": round(sum(self._first_token) / len(self._first_token) * 1000, 1)
+            if self._first_token else None,
+            "tokens_per_second": round(sum(self._token_rates) / len(self._token_rates), 1)
+            if self._token_rates else None,
+        }
+
+
+# Initialize global instance
+ollama_client = OllamaClient()
@@ -4,10 +4,10 @@ Features: Predictive Analytics, Risk Scoring, Trend Analysis
 """
 
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import AsyncIterable, Dict, Iterable, List, Optional
 import numpy as np
-from scipy import stats
-from collections import defaultdict
+
+from app.services.online_stats import EndpointWindows, HourlyMeans, P2Quantile, RunningStats, hour_of
 
 
 class PredictiveAnalytics:
@@ -80,6 +80,46 @@ class PredictiveAnalytics:
             'recommendations': PredictiveAnalytics._generate_recommendations(risk_factors)
         }
     
+    # (factor, weight, mask) rules of calculate_dropout_risk, in the same order
+    @staticmethod
+    def _risk_rules(attendance_rate: np.ndarray, engagement_trend: np.ndarray,
+                    negative_emotion_rate: np.ndarray, attendance_variance: np.ndarray) -> List:
+        return [
+            ('Low attendance', 40, attendance_rate < 70),
+            ('Moderate attendance', 20, (attendance_rate >= 70) & (attendance_rate < 85)),
+            ('Declining engagement', 30, engagement_trend < -10),
+            ('Slight engagement decline', 15, (engagement_trend >= -10) & (engagement_trend < 0)),
+            ('High negative emotions', 20, negative_emotion_rate > 0.4),
+            ('Moderate negative emotions', 10, (negative_emotion_rate > 0.25) & (negative_emotion_rate <= 0.4)),
+            ('Inconsistent attendance', 10, attendance_variance > 0.3),
+        ]
+
+    @staticmethod
+    def calculate_dropout_risk_batch(attendance_rate: np.ndarray, engagement_trend: np.ndarray,
+                                     negative_emotion_rate: np.ndarray, attendance_variance: np.ndarray) -> Dict:
+        """
+        Vectorised calculate_dropout_risk over aligned feature arrays (one row per student)
+
+        Returns:
+            risk_score (int array), risk_level (str array) and factor_masks
+            (factor name -> bool array) for building per-row factor lists
+        """
+        rules = PredictiveAnalytics._risk_rules(
+            np.asarray(attendance_rate, dtype=float), np.asarray(engagement_trend, dtype=float),
+            np.asarray(negative_emotion_rate, dtype=float), np.asarray(attendance_variance, dtype=float))
+        risk_score = np.zeros(len(rules[0][2]), dtype=int)
+        for _, weight, mask in rules:
+            risk_score += weight * mask
+        risk_score = np.minimum(risk_score, 100)
+        risk_level = np.select(
+            [risk_score >= 70, risk_score >= 40, risk_score >= 20],
+            ['critical', 'high', 'moderate'], default='low')
+        return {
+            'risk_score': risk_score,
+            'risk_level': risk_level,
+            'factor_masks': {name: mask for name, _, mask in rules},
+        }
+
     @staticmethod
     def _generate_recommendations(risk_factors: List[str]) -> List[str]:
         """Generate actionable recommendations based on risk factors"""
@@ -127,7 +167,8 @@ class PredictiveAnalytics:
         x = np.arange(len(historical_data))
         y = np.array(historical_data)
         
-        # Linear regression
+        # Linear regression (scipy imported on first use to keep startup light)
+        from scipy import stats
         slope, intercept, r_value, p_value, std_err = stats.linregress(x, y)
         
         # Generate forecast
@@ -157,6 +198,124 @@ class PredictiveAnalytics:
             'r_squared': r_value ** 2
         }
 
+    # Slope thresholds of the forecast trend labels, strongest first
+    @staticmethod
+    def _trend_labels(slope: np.ndarray) -> np.ndarray:
+        return np.select(
+            [slope > 2, slope > 0.5, slope > -0.5, slope > -2],
+            ['strongly_improving', 'improving', 'stable', 'declining'], default='strongly_declining')
+
+    @staticmethod
+    def forecast_engagement_batch(values: np.ndarray, mask: Optional[np.ndarray] = None,
+                                  periods: int = 7) -> Dict:
+        """
+        Vectorised forecast_engagement over many series at once
+
+        Args:
+            values: (series x time) array, chronological along axis 1
+            mask: same shape, True where a value is present; defaults to ~isnan(values).
+                Each row's valid values are treated as consecutive points, exactly as
+                forecast_engagement treats its list.
+            periods: Number of periods to forecast
+
+        Returns:
+            forecast, confidence_lower, confidence_upper (series x periods; NaN for rows
+            with fewer than 3 points), slope, r_squared, n_points and trend per series
+        """
+        y = np.asarray(values, dtype=float)
+        if mask is None:
+            mask = ~np.isnan(y)
+        mask = np.asarray(mask, dtype=bool)
+        y = np.where(mask, y, 0.0)
+        # x = position among the row's valid points
+        x = np.where(mask, np.cumsum(mask, axis=1) - 1, 0).astype(float)
+
+        n = mask.sum(axis=1).astype(float)
+        valid = n >= 3
+        safe_n = np.where(valid, n, 1.0)
+        mean_x = x.sum(axis=1) / safe_n
+        mean_y = y.sum(axis=1) / safe_n
+        # Population (co)variances, as scipy.stats.linregress computes them
+        ssxm = (x * x).sum(axis=1) / safe_n - mean_x ** 2
+        ssym = (y * y).sum(axis=1) / safe_n - mean_y ** 2
+        ssxym = (x * y).sum(axis=1) / safe_n - mean_x * mean_y
+        ssxm = np.where(valid, ssxm, 1.0)
+        ssym = np.maximum(ssym, 0.0)
+
+        slope = ssxym / ssxm
+        intercept = mean_y - slope * mean_x
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r = np.where(ssym > 0, ssxym / np.sqrt(ssxm * ssym), 0.0)
+        r = np.clip(r, -1.0, 1.0)
+        df = np.where(valid, n - 2, 1.0)
+        std_err = np.sqrt((1 - r ** 2) * ssym / ssxm / df)
+
+        future_x = n[:, None] + np.arange(periods)[None, :]
+        forecast = slope[:, None] * future_x + intercept[:, None]
+        # 95% prediction interval, same form as forecast_engagement
+        confidence_interval = 1.96 * std_err[:, None] * np.sqrt(
+            1 + 1 / safe_n[:, None] + (future_x - mean_x[:, None]) ** 2 / (safe_n * ssxm)[:, None])
+
+        invalid = ~valid[:, None]
+        trend = np.where(valid, PredictiveAnalytics._trend_labels(slope), 'insufficient_data')
+        return {
+            'forecast': np.where(invalid, np.nan, forecast),
+            'confidence_lower': np.where(invalid, np.nan, forecast - confidence_interval),
+            'confidence_upper': np.where(invalid, np.nan, forecast + confidence_interval),
+            'slope': np.where(valid, slope, np.nan),
+            'r_squared': np.where(valid, r ** 2, np.nan),
+            'n_points': n.astype(int),
+            'trend': trend,
+        }
+
+
+class ClassTrendAccumulator:
+    """
+    Single-pass, constant-memory state behind TrendAnalyzer's streaming
+    analysis. The median is exact up to P2_EXACT_SAMPLES records and a P²
+    estimate beyond; everything else is exact.
+    """
+
+    def __init__(self):
+        self.engagement = RunningStats()
+        self.median = P2Quantile(0.5)
+        self.endpoints = EndpointWindows(window=5)
+        self.present = 0
+        self.hourly = HourlyMeans()
+
+    def add(self, record: Dict):
+        score = record.get('engagement_score', 0)
+        self.engagement.add(score)
+        self.median.add(score)
+        self.endpoints.add(score)
+        if record.get('is_present', False):
+            self.present += 1
+        if 'engagement_score' in record:
+            hour = hour_of(record.get('timestamp'))
+            if hour is not None:
+                self.hourly.add(hour, score)
+
+    def result(self) -> Dict:
+        count = self.engagement.count
+        if not count:
+            return {}
+        return {
+            'engagement': {
+                'mean': self.engagement.mean,
+                'median': self.median.value,
+                'std': self.engagement.std,
+                'min': self.engagement.min,
+                'max': self.engagement.max,
+                'trend': TrendAnalyzer._calculate_trend(self.endpoints.series())
+            },
+            'attendance': {
+                'rate': self.present / count * 100,
+                'total_present': self.present,
+                'total_absent': count - self.present
+            },
+            'time_analysis': TrendAnalyzer._summarize_hours(self.hourly.means())
+        }
+
 
 class TrendAnalyzer:
     """
@@ -198,6 +357,25 @@ class TrendAnalyzer:
         }
         
         return analysis
+
+    @staticmethod
+    def analyze_class_trends_stream(records: Iterable[Dict]) -> Dict:
+        """
+        analyze_class_trends over any iterator in one pass and constant
+        memory; the median is approximate (P²)
+        """
+        accumulator = ClassTrendAccumulator()
+        for record in records:
+            accumulator.add(record)
+        return accumulator.result()
+
+    @staticmethod
+    async def analyze_class_trends_async(records: AsyncIterable[Dict]) -> Dict:
+        """analyze_class_trends_stream over an async iterator, e.g. a Motor cursor"""
+        accumulator = ClassTrendAccumulator()
+        async for record in records:
+            accumulator.add(record)
+        return accumulator.result()
     
     @staticmethod
     def _calculate_trend(data: List[float]) -> str:
@@ -225,28 +403,17 @@ class TrendAnalyzer:
     @staticmethod
     def _analyze_time_patterns(data: List[Dict]) -> Dict:
         """Analyze patterns by time of day"""
-        hourly_engagement = defaultdict(list)
-        
+        hourly = HourlyMeans()
         for record in data:
             if 'timestamp' in record and 'engagement_score' in record:
-                try:
-                    if isinstance(record['timestamp'], str):
-                        dt = datetime.fromisoformat(record['timestamp'])
-                    else:
-                        dt = record['timestamp']
-                    
-                    hour = dt.hour
-                    hourly_engagement[hour].append(record['engagement_score'])
-                except:
-                    continue
-        
-        # Calculate average engagement by hour
-        hourly_avg = {
-            hour: np.mean(scores)
-            for hour, scores in hourly_engagement.items()
-        }
-        
-        # Find peak and low hours
+                hour = hour_of(record['timestamp'])
+                if hour is not None:
+                    hourly.add(hour, record['engagement_score'])
+        return TrendAnalyzer._summarize_hours(hourly.means())
+
+    @staticmethod
+    def _summarize_hours(hourly_avg: Dict[int, float]) -> Dict:
+        """Peak and low hours from average engagement by hour"""
         if hourly_avg:
             peak_hour = max(hourly_avg, key=hourly_avg.get)
             low_hour = min(hourly_avg, key=hourly_avg.get)
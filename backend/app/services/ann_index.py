@@ -0,0 +1,195 @@
+"""
+Approximate Nearest-Neighbour Index
+IVF-flat index over face encodings, built with NumPy only.
+Vectors are bucketed by a k-means coarse quantizer; a search only scans the
+nprobe closest buckets, with exact distances inside them.
+"""
+
+import os
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Galleries smaller than this are matched by exact scan
+ANN_MIN_GALLERY_SIZE = int(os.getenv("FACE_ANN_MIN_GALLERY", "5000"))
+# Recall knob: number of buckets scanned per query
+ANN_NPROBE = int(os.getenv("FACE_ANN_NPROBE", "8"))
+ANN_INDEX_PATH = os.getenv("FACE_ANN_INDEX_PATH", "face_index.npz")
+
+
+def _squared_distances(queries: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+    q_sq = np.einsum("ij,ij->i", queries, queries)[:, None]
+    v_sq = np.einsum("ij,ij->i", vectors, vectors)[None, :]
+    dist = q_sq + v_sq - 2.0 * (queries @ vectors.T)
+    np.maximum(dist, 0.0, out=dist)
+    return dist
+
+
+class IVFFlatIndex:
+    """
+    Inverted-file index with flat (uncompressed) storage.
+
+    Supports incremental add/remove after training, persistence to a .npz
+    file, and a per-search nprobe to trade speed for recall.
+    """
+
+    def __init__(self, dim: int = 128, n_lists: Optional[int] = None, nprobe: int = ANN_NPROBE):
+        self.dim = dim
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.centroids = np.empty((0, dim), dtype=np.float32)
+        self._vectors = np.empty((0, dim), dtype=np.float32)
+        self._ids = np.empty(0, dtype=object)
+        self._assignments = np.empty(0, dtype=np.int32)
+        self._lists: List[np.ndarray] = []
+        self._rows: Dict[str, int] = {}
+        self._used = 0
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    @property
+    def ready(self) -> bool:
+        return len(self.centroids) > 0
+
+    def train(self, vectors: np.ndarray, ids: Sequence[str], n_iter: int = 10, seed: int = 0):
+        """Fit the coarse quantizer with k-means and (re)populate the index"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        n_lists = self.n_lists or max(1, int(np.sqrt(len(vectors))))
+        n_lists = min(n_lists, len(vectors))
+        rng = np.random.default_rng(seed)
+
+        centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)].copy()
+        for _ in range(n_iter):
+            assignments = self._assign(vectors, centroids)
+            counts = np.bincount(assignments, minlength=n_lists)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, vectors)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+            # Re-seed empty buckets so every list stays useful
+            empty = np.flatnonzero(~filled)
+            if len(empty):
+                centroids[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+
+        self.centroids = centroids
+        self.n_lists = n_lists
+        self._populate(vectors, list(ids), self._assign(vectors, centroids))
+
+    def add(self, student_id: str, vector: Sequence[float]):
+        """Insert or replace one vector, assigning it to its nearest bucket"""
+        if student_id in self._rows:
+            self.remove(student_id)
+        vector = np.asarray(vector, dtype=np.float32).reshape(1, self.dim)
+        bucket = int(self._assign(vector, self.centroids)[0])
+
+        if self._used == len(self._vectors):
+            self._grow()
+        row = self._used
+        self._vectors[row] = vector[0]
+        self._ids[row] = student_id
+        self._assignments[row] = bucket
+        self._lists[bucket] = np.append(self._lists[bucket], row)
+        self._rows[student_id] = row
+        self._used += 1
+
+    def remove(self, student_id: str) -> bool:
+        row = self._rows.pop(student_id, None)
+        if row is None:
+            return False
+        bucket = self._assignments[row]
+        self._lists[bucket] = self._lists[bucket][self._lists[bucket] != row]
+        self._ids[row] = None
+        # Compact once dead rows outnumber live ones
+        if self._used - len(self._rows) > max(64, len(self._rows)):
+            self._compact()
+        return True
+
+    def search(self, queries: np.ndarray, k: int = 2, nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (squared_distances, ids), both shaped (queries, k), sorted ascending.
+        Missing neighbours are padded with inf / None.
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        out_dist = np.full((len(queries), k), np.inf, dtype=np.float32)
+        out_ids = np.empty((len(queries), k), dtype=object)
+        if len(queries) == 0 or not self.ready:
+            return out_dist, out_ids
+
+        centroid_dist = _squared_distances(queries, self.centroids)
+        if nprobe < len(self.centroids):
+            probes = np.argpartition(centroid_dist, nprobe - 1, axis=1)[:, :nprobe]
+        else:
+            probes = np.broadcast_to(np.arange(len(self.centroids)), centroid_dist.shape)
+
+        for i, query in enumerate(queries):
+            rows = np.concatenate([self._lists[p] for p in probes[i]])
+            if len(rows) == 0:
+                continue
+            dist = _squared_distances(query[None, :], self._vectors[rows])[0]
+            top = min(k, len(rows))
+            nearest = np.argpartition(dist, top - 1)[:top] if top < len(rows) else np.arange(len(rows))
+            nearest = nearest[np.argsort(dist[nearest])]
+            out_dist[i, :top] = dist[nearest]
+            out_ids[i, :top] = self._ids[rows[nearest]]
+        return out_dist, out_ids
+
+    def save(self, path: str = ANN_INDEX_PATH):
+        self._compact()
+        offsets = np.cumsum([0] + [len(lst) for lst in self._lists])
+        np.savez(
+            path,
+            centroids=self.centroids,
+            vectors=self._vectors[:self._used],
+            ids=np.array(self._ids[:self._used], dtype=str),
+            lists=np.concatenate(self._lists).astype(np.int64) if self._lists else np.empty(0, dtype=np.int64),
+            offsets=offsets,
+            nprobe=np.array(self.nprobe)
+        )
+
+    @classmethod
+    def load(cls, path: str = ANN_INDEX_PATH) -> "IVFFlatIndex":
+        data = np.load(path, allow_pickle=False)
+        centroids = data["centroids"]
+        index = cls(dim=centroids.shape[1], n_lists=len(centroids), nprobe=int(data["nprobe"]))
+        index.centroids = centroids.astype(np.float32)
+        offsets = data["offsets"]
+        lists = data["lists"]
+        assignments = np.empty(len(data["vectors"]), dtype=np.int32)
+        for bucket in range(len(centroids)):
+            assignments[lists[offsets[bucket]:offsets[bucket + 1]]] = bucket
+        index._populate(data["vectors"].astype(np.float32), data["ids"].tolist(), assignments)
+        return index
+
+    def _populate(self, vectors: np.ndarray, ids: List[str], assignments: np.ndarray):
+        self._vectors = np.ascontiguousarray(vectors, dtype=np.float32).copy()
+        self._ids = np.array(ids, dtype=object)
+        self._assignments = assignments.astype(np.int32)
+        self._rows = {student_id: row for row, student_id in enumerate(ids)}
+        self._used = len(ids)
+        order = np.argsort(self._assignments, kind="stable")
+        bounds = np.searchsorted(self._assignments[order], np.arange(len(self.centroids) + 1))
+        self._lists = [order[bounds[b]:bounds[b + 1]] for b in range(len(self.centroids))]
+
+    def _compact(self):
+        live = np.fromiter(self._rows.values(), dtype=np.int64, count=len(self._rows))
+        live.sort()
+        self._populate(self._vectors[live], self._ids[live].tolist(), self._assignments[live])
+
+    def _grow(self):
+        capacity = max(64, len(self._vectors) * 2)
+        vectors = np.empty((capacity, self.dim), dtype=np.float32)
+        vectors[:self._used] = self._vectors[:self._used]
+        ids = np.empty(capacity, dtype=object)
+        ids[:self._used] = self._ids[:self._used]
+        assignments = np.zeros(capacity, dtype=np.int32)
+        assignments[:self._used] = self._assignments[:self._used]
+        self._vectors, self._ids, self._assignments = vectors, ids, assignments
+
+    @staticmethod
+    def _assign(vectors: np.ndarray, centroids: np.ndarray, chunk: int = 8192) -> np.ndarray:
+        assignments = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), chunk):
+            block = vectors[start:start + chunk]
+            assignments[start:start + chunk] = np.argmin(_squared_distances(block, centroids), axis=1)
+        return assignments
@@ -0,0 +1,86 @@
+"""
+Attendance Recorder
+Single write path for everything produced by frame processing. Detections
+are attributed to the camera's class session, which deduplicates presence,
+the per-frame engagement samples go to compact bucket documents and are
+folded into hourly/daily rollups, and closed sessions update the presence
+matrix and per-student risk features. All of them hand their writes to write-behind buffers, so request
+latency does not depend on per-record MongoDB round trips.
+"""
+
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from app.services.class_sessions import ClassSession, ClassSessionManager
+from app.services.engagement_buckets import EngagementBucketStore
+from app.services.rollups import RollupStore
+from app.services.risk_features import RiskFeatureStore
+from app.services.presence_matrix import PresenceMatrix
+
+logger = logging.getLogger(__name__)
+
+
+class AttendanceRecorder:
+    def __init__(self, db):
+        self.db = db
+        self.sessions = ClassSessionManager(db)
+        self.samples = EngagementBucketStore(db)
+        self.rollups = RollupStore(db)
+        self.features = RiskFeatureStore(db)
+        self.presence = PresenceMatrix()
+        self.sessions.close_listeners.append(self._session_closed)
+
+    async def start(self):
+        await self.features.start()
+        try:
+            await self.presence.load(self.db)
+        except Exception as e:
+            logger.error(f"Presence matrix load failed: {str(e)}")
+        await self.sessions.start()
+        await self.samples.start()
+        await self.rollups.start()
+
+    async def stop(self):
+        await self.sessions.stop()
+        await self.samples.stop()
+        await self.rollups.stop()
+        await self.features.stop()
+
+    async def record(self, camera_id: str, logs: List[Dict]) -> ClassSession:
+        """Attributes per-frame detection logs to the camera's class session"""
+        session = await self.sessions.session_for(camera_id)
+        newly_present = False
+        for log in logs:
+            log["session_id"] = session.session_id
+            if session.mark_present(log["student_id"], log["timestamp"], log["engagement_score"], log.get("emotion")):
+                newly_present = True
+        if newly_present:
+            # Newly present students are written promptly; the rest on the flush timer
+            await self.sessions.queue_presence(session)
+        await self.samples.add(session.session_id, logs)
+        await self.rollups.add(logs, session.class_name)
+        return session
+
+    async def roster(self, class_name: Optional[str], started_at: datetime) -> List[str]:
+        """
+        Students expected at a session of the class that started at started_at:
+        those registered by then, as PresenceMatrix.load() does after a restart
+        """
+        query = {"$or": [{"registered_at": None}, {"registered_at": {"$lte": started_at}}]}
+        if class_name:
+            query["class"] = class_name
+        return await self.db.students.distinct("student_id", query)
+
+    async def _session_closed(self, session: ClassSession):
+        # Implicit per-camera sessions are not scheduled classes; counting them would
+        # mark everyone absent from every camera but the one they were seen on
+        if not session.auto:
+            self.presence.add_session(session.session_id, session.class_name, session.started_at,
+                                      session.presence, await self.roster(session.class_name, session.started_at))
+        await self.features.session_closed(session)
+
+    def stats(self) -> Dict:
+        return {"sessions": self.sessions.stats(), "samples": self.samples.stats(),
+                "rollups": self.rollups.stats(), "risk_features": self.features.stats(),
+                "presence": self.presence.stats()}
@@ -0,0 +1,92 @@
+"""
+Camera Sessions
+Per-camera state kept between frames (tracker and friends), looked up by the
+camera_id the client sends with each frame.
+"""
+
+import time
+from typing import Dict, List
+
+from app.services.face_gallery import face_gallery
+from app.services.face_recog import match_encodings
+from app.services.tracking import FaceTracker
+from app.services.motion_gate import MotionGate
+
+# Sessions idle for longer than this are dropped
+CAMERA_SESSION_TTL = 600
+
+
+class CameraSession:
+    def __init__(self, camera_id: str):
+        self.camera_id = camera_id
+        self.tracker = FaceTracker()
+        self.motion_gate = MotionGate()
+        self.created_at = time.time()
+        self.last_seen = self.created_at
+        self.frames = 0
+        # Gallery view reused until the gallery changes
+        self._gallery_version = -1
+        self._gallery = None
+
+    def gallery(self):
+        """(encodings, ids) snapshot of the face gallery, refreshed when its version changes"""
+        version = face_gallery.version
+        if self._gallery_version != version:
+            # Version read first: a change during the snapshot triggers another refresh
+            self._gallery = face_gallery.snapshot()
+            self._gallery_version = version
+        return self._gallery
+
+    def identify(self, faces: List[Dict]) -> List[Dict]:
+        """
+        Matches the freshly encoded faces against the gallery and lets the tracker
+        carry identities forward for the rest. Returns one identity per face.
+        """
+        encoded = [i for i, face in enumerate(faces) if face["encoding"] is not None]
+        matches = [None] * len(faces)
+        if encoded:
+            known_encodings, known_ids = self.gallery()
+            found = match_encodings([faces[i]["encoding"] for i in encoded], known_encodings, known_ids,
+                                    index=face_gallery.index)
+            for i, match in zip(encoded, found):
+                matches[i] = match
+        return self.tracker.update(faces, matches)
+
+    def touch(self):
+        self.last_seen = time.time()
+        self.frames += 1
+
+    def stats(self) -> Dict:
+        return {
+            "camera_id": self.camera_id,
+            "frames": self.frames,
+            "tracking": self.tracker.stats(),
+            "motion": self.motion_gate.stats(),
+        }
+
+
+class CameraSessionRegistry:
+    def __init__(self, ttl: float = CAMERA_SESSION_TTL):
+        self.ttl = ttl
+        self._sessions: Dict[str, CameraSession] = {}
+
+    def get(self, camera_id: str) -> CameraSession:
+        self._evict_idle()
+        session = self._sessions.get(camera_id)
+        if session is None:
+            session = CameraSession(camera_id)
+            self._sessions[camera_id] = session
+        session.touch()
+        return session
+
+    def stats(self) -> Dict:
+        return {camera_id: s.stats() for camera_id, s in self._sessions.items()}
+
+    def _evict_idle(self):
+        cutoff = time.time() - self.ttl
+        for camera_id in [c for c, s in self._sessions.items() if s.last_seen < cutoff]:
+            del self._sessions[camera_id]
+
+
+# Initialize global instance
+camera_sessions = CameraSessionRegistry()
@@ -0,0 +1,263 @@
+"""
+Class Sessions
+Explicit class-session lifecycle with in-memory presence tracking.
+Detections update a per-session presence table; MongoDB receives one
+attendance document per student per session (first/last seen, detection
+count, mean engagement) instead of one document per frame.
+"""
+
+import os
+import uuid
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from pymongo import UpdateOne
+
+from app.services.write_behind import WriteBehindBuffer
+
+logger = logging.getLogger(__name__)
+
+# How often changed presence entries are pushed to MongoDB
+PRESENCE_FLUSH_INTERVAL = float(os.getenv("PRESENCE_FLUSH_INTERVAL", "15"))
+
+
+class Presence:
+    def __init__(self, student_id: str, first_seen: datetime):
+        self.student_id = student_id
+        self.first_seen = first_seen
+        self.last_seen = first_seen
+        self.detections = 0
+        self.engagement_sum = 0.0
+        self.emotions: Counter = Counter()
+
+    def update(self, timestamp: datetime, engagement_score: float, emotion: Optional[str]):
+        self.last_seen = max(self.last_seen, timestamp)
+        self.first_seen = min(self.first_seen, timestamp)
+        self.detections += 1
+        self.engagement_sum += engagement_score
+        if emotion:
+            self.emotions[emotion] += 1
+
+    @property
+    def engagement_score(self) -> float:
+        return round(self.engagement_sum / self.detections, 2) if self.detections else 0.0
+
+    @property
+    def emotion(self) -> str:
+        return self.emotions.most_common(1)[0][0] if self.emotions else "neutral"
+
+
+class ClassSession:
+    def __init__(self, session_id: str, class_name: Optional[str], camera_id: str,
+                 started_at: datetime, auto: bool = False):
+        self.session_id = session_id
+        self.class_name = class_name
+        self.camera_id = camera_id
+        self.started_at = started_at
+        self.ended_at: Optional[datetime] = None
+        self.auto = auto
+        self.presence: Dict[str, Presence] = {}
+        self.dirty: set = set()
+
+    def mark_present(self, student_id: str, timestamp: datetime, engagement_score: float,
+                     emotion: Optional[str] = None) -> bool:
+        """Records a detection. Returns True the first time a student is seen in this session"""
+        entry = self.presence.get(student_id)
+        first = entry is None
+        if first:
+            entry = Presence(student_id, timestamp)
+            self.presence[student_id] = entry
+        entry.update(timestamp, engagement_score, emotion)
+        self.dirty.add(student_id)
+        return first
+
+    def to_dict(self) -> Dict:
+        return {
+            "session_id": self.session_id,
+            "class_name": self.class_name,
+            "camera_id": self.camera_id,
+            "started_at": self.started_at.isoformat(),
+            "ended_at": self.ended_at.isoformat() if self.ended_at else None,
+            "auto": self.auto,
+            "present": len(self.presence),
+        }
+
+
+class ClassSessionManager:
+    """
+    Owns the active sessions per camera and the presence write path.
+
+    Frames from a camera without an explicitly started session are attributed
+    to an implicit daily session for that camera, so presence deduplication
+    applies to every feed.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.presence_writer = WriteBehindBuffer(db.attendance, bulk=True)
+        self._active: Dict[str, ClassSession] = {}  # camera_id -> session
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        # Awaited with each session once it is closed
+        self.close_listeners: List[Callable[[ClassSession], Awaitable]] = []
+
+    async def start(self):
+        self.presence_writer.start()
+        try:
+            await self.db.attendance.create_index(
+                [("session_id", 1), ("student_id", 1)],
+                unique=True,
+                partialFilterExpression={"session_id": {"$exists": True}},
+            )
+            await self._restore_active()
+        except Exception as e:
+            logger.error(f"Class session restore failed: {str(e)}")
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush_presence()
+        await self.presence_writer.stop()
+
+    # Lifecycle ---------------------------------------------------------------
+
+    async def start_session(self, class_name: Optional[str], camera_id: str = "default",
+                            auto: bool = False) -> ClassSession:
+        current = self._active.get(camera_id)
+        if current is not None:
+            await self.stop_session(current.session_id)
+
+        session = ClassSession(
+            session_id=uuid.uuid4().hex,
+            class_name=class_name,
+            camera_id=camera_id,
+            started_at=datetime.now(),
+            auto=auto,
+        )
+        await self.db.class_sessions.insert_one({
+            "session_id": session.session_id,
+            "class_name": class_name,
+            "camera_id": camera_id,
+            "started_at": session.started_at,
+            "ended_at": None,
+            "auto": auto,
+            "status": "active",
+        })
+        self._active[camera_id] = session
+        return session
+
+    async def stop_session(self, session_id: str) -> Optional[ClassSession]:
+        session = next((s for s in self._active.values() if s.session_id == session_id), None)
+        if session is None:
+            return None
+        session.ended_at = datetime.now()
+        await self.queue_presence(session)
+        del self._active[session.camera_id]
+        await self.db.class_sessions.update_one(
+            {"session_id": session_id},
+            {"$set": {
+                "ended_at": session.ended_at,
+                "status": "closed",
+                "present_count": len(session.presence),
+                "present_students": sorted(session.presence),
+            }},
+        )
+        for listener in self.close_listeners:
+            try:
+                await listener(session)
+            except Exception as e:
+                logger.error(f"Session close listener failed: {str(e)}")
+        return session
+
+    def active_sessions(self) -> List[ClassSession]:
+        return list(self._active.values())
+
+    async def session_for(self, camera_id: str) -> ClassSession:
+        """Explicit session for the camera, else today's implicit session"""
+        async with self._lock:
+            session = self._active.get(camera_id)
+            today = datetime.now().date()
+            if session is not None and session.auto and session.started_at.date() != today:
+                await self.stop_session(session.session_id)
+                session = None
+            if session is None:
+                session = await self.start_session(None, camera_id, auto=True)
+            return session
+
+    # Presence ----------------------------------------------------------------
+
+    async def flush_presence(self):
+        for session in list(self._active.values()):
+            await self.queue_presence(session)
+
+    async def queue_presence(self, session: ClassSession):
+        if not session.dirty:
+            return
+        ops = []
+        for student_id in session.dirty:
+            entry = session.presence[student_id]
+            ops.append(UpdateOne(
+                {"session_id": session.session_id, "student_id": student_id},
+                {
+                    "$setOnInsert": {
+                        "class_name": session.class_name,
+                        "camera_id": session.camera_id,
+                        "is_present": True,
+                    },
+                    "$set": {
+                        "first_seen": entry.first_seen,
+                        "last_seen": entry.last_seen,
+                        # timestamp keeps date-range queries on attendance working
+                        "timestamp": entry.first_seen,
+                        "detections": entry.detections,
+                        "engagement_score": entry.engagement_score,
+                        "emotion": entry.emotion,
+                        "emotion_counts": dict(entry.emotions),
+                    },
+                },
+                upsert=True,
+            ))
+        session.dirty.clear()
+        await self.presence_writer.add_many(ops)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(PRESENCE_FLUSH_INTERVAL)
+            try:
+                await self.flush_presence()
+            except Exception as e:
+                logger.error(f"Presence flush failed: {str(e)}")
+
+    async def load_session(self, doc: Dict) -> ClassSession:
+        """Rebuilds a session and its presence table from its stored documents"""
+        session = ClassSession(doc["session_id"], doc.get("class_name"), doc.get("camera_id", "default"),
+                               doc["started_at"], auto=doc.get("auto", False))
+        session.ended_at = doc.get("ended_at")
+        async for row in self.db.attendance.find({"session_id": session.session_id}):
+            entry = Presence(row["student_id"], row.get("first_seen", row.get("timestamp")))
+            entry.last_seen = row.get("last_seen", entry.first_seen)
+            entry.detections = row.get("detections", 0)
+            entry.engagement_sum = row.get("engagement_score", 0.0) * entry.detections
+            entry.emotions = Counter(row.get("emotion_counts", {}))
+            session.presence[entry.student_id] = entry
+        return session
+
+    async def _restore_active(self):
+        """Reload sessions left active by a previous process, with their presence"""
+        async for doc in self.db.class_sessions.find({"status": "active"}):
+            self._active[doc.get("camera_id", "default")] = await self.load_session(doc)
+
+    def stats(self) -> Dict:
+        return {
+            "active_sessions": len(self._active),
+            "presence_writes": self.presence_writer.stats(),
+        }
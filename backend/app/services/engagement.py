@@ -13,9 +13,11 @@ import numpy as np
 class EngagementDetector:
     def __init__(self):
         self.mp_face_mesh = mp_face_mesh
-        self.face_mesh = self.mp_face_mesh.FaceMesh(
-            static_image_mode=False,
-            max_num_faces=5,
+        # Single-face instance run on per-face crops; static mode so crops of
+        # different students never share tracking state
+        self.roi_face_mesh = self.mp_face_mesh.FaceMesh(
+            static_image_mode=True,
+            max_num_faces=1,
             refine_landmarks=True,
             min_detection_confidence=0.5
         )
@@ -28,39 +30,53 @@ class EngagementDetector:
         h = np.linalg.norm(np.array(landmarks[eye_indices[0]]) - np.array(landmarks[eye_indices[3]]))
         return (lv + rv) / (2.0 * h)
 
-    def detect_engagement(self, frame):
+    def detect_engagement_rois(self, rgb, face_locations, padding: float = 0.25):
         """
-        Analyzes frame for eye closure and head pose.
-        Returns a list of dicts with metrics per face.
+        Runs FaceMesh on each face box (top, right, bottom, left) of an RGB frame.
+        Returns one entry per box, in the same order; None where no mesh was found.
         """
-        results = self.face_mesh.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        h, w = rgb.shape[:2]
         metrics = []
+        for (top, right, bottom, left) in face_locations:
+            pad_y = int((bottom - top) * padding)
+            pad_x = int((right - left) * padding)
+            y0, y1 = max(0, top - pad_y), min(h, bottom + pad_y)
+            x0, x1 = max(0, left - pad_x), min(w, right + pad_x)
+            crop = rgb[y0:y1, x0:x1]
+            if crop.size == 0:
+                metrics.append(None)
+                continue
 
-        if not results.multi_face_landmarks:
-            return []
+            results = self.roi_face_mesh.process(crop)
+            if not results.multi_face_landmarks:
+                metrics.append(None)
+                continue
 
-        for face_landmarks in results.multi_face_landmarks:
-            landmarks = [(lm.x, lm.y, lm.z) for lm in face_landmarks.landmark]
-            
-            # Simplified Eye Indices (Left: 362, 385, 387, 263, 373, 380 | Right: 33, 160, 158, 133, 153, 144)
-            left_eye_ear = self.calculate_ear(landmarks, [362, 385, 387, 263, 373, 380])
-            right_eye_ear = self.calculate_ear(landmarks, [33, 160, 158, 133, 153, 144])
-            ear = (left_eye_ear + right_eye_ear) / 2.0
-
-            # Simplistic Head Pose (using nose and eye centers)
-            # More complex PnP solver could be used here
-            nose_tip = landmarks[1]
-            engagement_score = 100.0
-            
-            if ear < 0.2: # Threshold for eye closure
-                engagement_score -= 50
-            
-            metrics.append({
-                "ear": ear,
-                "is_sleeping": ear < 0.2,
-                "engagement_score": max(0, engagement_score)
-            })
-            
+            ch, cw = crop.shape[:2]
+            face_landmarks = results.multi_face_landmarks[0]
+            landmarks = [(lm.x * cw, lm.y * ch, lm.z * cw) for lm in face_landmarks.landmark]
+            metrics.append(self._metrics_from_landmarks(landmarks))
         return metrics
 
-engagement_detector = EngagementDetector()
+    def _metrics_from_landmarks(self, landmarks):
+        """Engagement metrics from pixel-space landmarks"""
+        # Simplified Eye Indices (Left: 362, 385, 387, 263, 373, 380 | Right: 33, 160, 158, 133, 153, 144)
+        left_eye_ear = self.calculate_ear(landmarks, [362, 385, 387, 263, 373, 380])
+        right_eye_ear = self.calculate_ear(landmarks, [33, 160, 158, 133, 153, 144])
+        ear = (left_eye_ear + right_eye_ear) / 2.0
+
+        # Simplistic Head Pose (using nose and eye centers)
+        # More complex PnP solver could be used here
+        nose_tip = landmarks[1]
+        engagement_score = 100.0
+
+        if ear < 0.2: # Threshold for eye closure
+            engagement_score -= 50
+
+        return {
+            "ear": ear,
+            "is_sleeping": ear < 0.2,
+            "engagement_score": max(0, engagement_score)
+        }
+
+# Instances are created on demand by app.services.model_registry
@@ -0,0 +1,282 @@
+"""
+Engagement Sample Buckets
+Compact time-series storage for per-frame engagement samples. Samples of one
+student in one class session are packed into bucket documents holding binary
+arrays: scores as uint8 (half-point resolution), emotions as uint8 codes and
+timestamps as uint16 delta offsets in deciseconds. About 6 bytes per sample
+instead of a ~150 byte BSON document.
+"""
+
+import os
+import time
+import asyncio
+import logging
+import numpy as np
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from bson.binary import Binary
+from pymongo import UpdateOne
+
+from app.services.write_behind import WriteBehindBuffer
+
+logger = logging.getLogger(__name__)
+
+BUCKET_FORMAT_VERSION = 1
+# Samples per bucket before it is sealed and a new one started
+BUCKET_MAX_SAMPLES = int(os.getenv("BUCKET_MAX_SAMPLES", "720"))
+# How often open buckets are upserted
+BUCKET_FLUSH_INTERVAL = float(os.getenv("BUCKET_FLUSH_INTERVAL", "30"))
+# Open buckets without new samples for this long are written and released from memory
+BUCKET_IDLE_SECONDS = float(os.getenv("BUCKET_IDLE_SECONDS", "300"))
+
+EMOTION_CODES = ['angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral']
+EMOTION_INDEX = {name: code for code, name in enumerate(EMOTION_CODES)}
+UNKNOWN_EMOTION = 255
+# Largest gap representable by one uint16 decisecond delta (~109 minutes);
+# a longer gap, like a sample older than the previous one, starts a new bucket
+MAX_DELTA_DS = np.iinfo(np.uint16).max
+
+
+def _pack_scores(values: List[float]) -> bytes:
+    return np.clip(np.round(np.asarray(values, dtype=np.float32) * 2), 0, 200).astype(np.uint8).tobytes()
+
+
+def _unpack_scores(blob: bytes) -> np.ndarray:
+    return np.frombuffer(blob, dtype=np.uint8).astype(np.float32) / 2.0
+
+
+def _offset_ds(start: datetime, timestamp: datetime) -> int:
+    return round((timestamp - start) / timedelta(milliseconds=100))
+
+
+def encode_bucket(start: datetime, timestamps: List[datetime], scores: List[float], base_scores: List[float],
+                  posture_scores: List[float], emotions: List[str]) -> Dict:
+    """Packs parallel sample lists into the binary fields of a bucket document"""
+    offsets_ds = np.array([(t - start) / timedelta(milliseconds=100) for t in timestamps], dtype=np.float64)
+    deltas = np.diff(np.round(offsets_ds), prepend=0.0)
+    deltas = np.clip(deltas, 0, MAX_DELTA_DS).astype(np.uint16)
+    codes = np.array([EMOTION_INDEX.get(e, UNKNOWN_EMOTION) for e in emotions], dtype=np.uint8)
+    return {
+        "v": BUCKET_FORMAT_VERSION,
+        "start": start,
+        "end": timestamps[-1],
+        "count": len(timestamps),
+        "dt": Binary(deltas.tobytes()),
+        "score": Binary(_pack_scores(scores)),
+        "base": Binary(_pack_scores(base_scores)),
+        "posture": Binary(_pack_scores(posture_scores)),
+        "emotion": Binary(codes.tobytes()),
+        # Pre-computed so coarse queries never need to unpack
+        "score_sum": float(np.sum(scores)),
+        "score_min": float(np.min(scores)),
+        "score_max": float(np.max(scores)),
+    }
+
+
+def decode_bucket(doc: Dict) -> Dict[str, np.ndarray]:
+    """
+    Unpacks a bucket into NumPy arrays: timestamp (datetime64[ms]), score,
+    base_score, posture_score (float32) and emotion (uint8 codes, see EMOTION_CODES).
+    """
+    deltas = np.frombuffer(doc["dt"], dtype=np.uint16).astype(np.int64)
+    start = np.datetime64(doc["start"], "ms")
+    return {
+        "timestamp": start + (np.cumsum(deltas) * 100).astype("timedelta64[ms]"),
+        "score": _unpack_scores(doc["score"]),
+        "base_score": _unpack_scores(doc["base"]),
+        "posture_score": _unpack_scores(doc["posture"]),
+        "emotion": np.frombuffer(doc["emotion"], dtype=np.uint8),
+    }
+
+
+def concat_buckets(docs: List[Dict]) -> Dict[str, np.ndarray]:
+    """Decodes and concatenates buckets (ordered by start) into one set of arrays"""
+    decoded = [decode_bucket(d) for d in docs]
+    if not decoded:
+        return {
+            "timestamp": np.empty(0, dtype="datetime64[ms]"),
+            "score": np.empty(0, dtype=np.float32),
+            "base_score": np.empty(0, dtype=np.float32),
+            "posture_score": np.empty(0, dtype=np.float32),
+            "emotion": np.empty(0, dtype=np.uint8),
+        }
+    return {key: np.concatenate([d[key] for d in decoded]) for key in decoded[0]}
+
+
+class OpenBucket:
+    def __init__(self, student_id: str, session_id: str, seq: int, start: datetime):
+        self.student_id = student_id
+        self.session_id = session_id
+        self.seq = seq
+        self.start = start
+        self.timestamps: List[datetime] = []
+        self.scores: List[float] = []
+        self.base_scores: List[float] = []
+        self.posture_scores: List[float] = []
+        self.emotions: List[str] = []
+        self.dirty = False
+        self.touched_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def fits(self, timestamp: datetime) -> bool:
+        """
+        False if the sample cannot be stored as a non-negative uint16 delta:
+        it is older than the bucket start or the last sample (out-of-order
+        batch or video frames), or the gap since the last sample is too long.
+        """
+        if timestamp < self.start:
+            return False
+        if not self.timestamps:
+            return True
+        if timestamp < self.timestamps[-1]:
+            return False
+        return _offset_ds(self.start, timestamp) - _offset_ds(self.start, self.timestamps[-1]) <= MAX_DELTA_DS
+
+    def append(self, log: Dict):
+        self.timestamps.append(log["timestamp"])
+        self.scores.append(log["engagement_score"])
+        self.base_scores.append(log.get("base_score", log["engagement_score"]))
+        self.posture_scores.append(log.get("posture_score", 70))
+        self.emotions.append(log.get("emotion", "neutral"))
+        self.dirty = True
+        self.touched_at = time.monotonic()
+
+    def to_update(self) -> UpdateOne:
+        doc = encode_bucket(self.start, self.timestamps, self.scores, self.base_scores,
+                            self.posture_scores, self.emotions)
+        return UpdateOne(
+            {"student_id": self.student_id, "session_id": self.session_id, "seq": self.seq},
+            {"$set": doc},
+            upsert=True,
+        )
+
+
+class EngagementBucketStore:
+    """
+    Accumulates samples in open in-memory buckets and upserts them through a
+    write-behind buffer; full buckets are sealed and replaced by a new one.
+    """
+
+    def __init__(self, db, max_samples: int = BUCKET_MAX_SAMPLES):
+        self.db = db
+        self.collection = db.engagement_buckets
+        self.max_samples = max_samples
+        self.writer = WriteBehindBuffer(self.collection, bulk=True)
+        self._open: Dict[Tuple[str, str], OpenBucket] = {}
+        self._next_seq: Dict[Tuple[str, str], int] = {}
+        # Released keys whose next seq is kept until their last write has reached the database
+        self._released: set = set()
+        # Serializes add() and flush(), so a release never interleaves with an append
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.samples = 0
+
+    async def start(self):
+        self.writer.start()
+        try:
+            await self.collection.create_index(
+                [("student_id", 1), ("session_id", 1), ("seq", 1)], unique=True)
+            await self.collection.create_index([("student_id", 1), ("start", 1)])
+        except Exception as e:
+            logger.error(f"Engagement bucket index creation failed: {str(e)}")
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        await self.writer.stop()
+
+    async def add(self, session_id: str, logs: List[Dict]):
+        async with self._lock:
+            sealed = []
+            for log in logs:
+                key = (log["student_id"], session_id)
+                bucket = self._open.get(key)
+                if bucket is not None and not bucket.fits(log["timestamp"]):
+                    sealed.append(bucket.to_update())
+                    del self._open[key]
+                    bucket = None
+                if bucket is None:
+                    bucket = await self._open_bucket(key, log["timestamp"])
+                bucket.append(log)
+                self.samples += 1
+                if len(bucket) >= self.max_samples:
+                    sealed.append(bucket.to_update())
+                    del self._open[key]
+            if sealed:
+                await self.writer.add_many(sealed)
+
+    async def _open_bucket(self, key: Tuple[str, str], start: datetime) -> OpenBucket:
+        seq = self._next_seq.get(key)
+        if seq is None:
+            seq = await self._last_seq(*key) + 1
+        self._released.discard(key)
+        bucket = OpenBucket(key[0], key[1], seq, start)
+        self._open[key] = bucket
+        self._next_seq[key] = seq + 1
+        return bucket
+
+    async def flush(self):
+        """Upserts changed open buckets and releases idle ones"""
+        async with self._lock:
+            if not len(self.writer):
+                # Every released bucket is stored, so a later sample can resume from the stored seq
+                for key in self._released:
+                    self._next_seq.pop(key, None)
+                self._released.clear()
+            ops = []
+            now = time.monotonic()
+            for key, bucket in list(self._open.items()):
+                if bucket.dirty:
+                    ops.append(bucket.to_update())
+                    bucket.dirty = False
+                if now - bucket.touched_at >= BUCKET_IDLE_SECONDS:
+                    # Ended session or student gone
+                    del self._open[key]
+                    self._released.add(key)
+            if ops:
+                await self.writer.add_many(ops)
+
+    async def load_series(self, student_id: str, since: Optional[datetime] = None,
+                          session_id: Optional[str] = None) -> Dict[str, np.ndarray]:
+        """Reads a student's samples as NumPy arrays, decoding buckets directly"""
+        query: Dict = {"student_id": student_id}
+        if session_id is not None:
+            query["session_id"] = session_id
+        if since is not None:
+            query["end"] = {"$gte": since}
+        docs = await self.collection.find(query).sort("start", 1).to_list(None)
+        series = concat_buckets(docs)
+        if since is not None and len(series["timestamp"]):
+            keep = series["timestamp"] >= np.datetime64(since, "ms")
+            series = {k: v[keep] for k, v in series.items()}
+        return series
+
+    async def _last_seq(self, student_id: str, session_id: str) -> int:
+        doc = await self.collection.find_one(
+            {"student_id": student_id, "session_id": session_id}, {"seq": 1}, sort=[("seq", -1)])
+        return doc["seq"] if doc else -1
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(BUCKET_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Engagement bucket flush failed: {str(e)}")
+
+    def stats(self) -> Dict:
+        return {
+            "samples": self.samples,
+            "open_buckets": len(self._open),
+            "writes": self.writer.stats(),
+        }
@@ -0,0 +1,40 @@
+"""
+Face Encoding Storage
+Student documents store `face_encoding` as a single little-endian float32
+BSON Binary (512 bytes for 128 dimensions) next to a format version and the
+model that produced it. Readers also accept the legacy BSON array of doubles
+until app.jobs.migrate_face_encodings has converted every document.
+"""
+
+import numpy as np
+from typing import Dict, Optional, Sequence
+
+from bson.binary import Binary
+
+ENCODING_FORMAT_VERSION = 1
+# face_recognition's dlib ResNet embedding
+ENCODING_MODEL = "dlib_resnet_128"
+ENCODING_DTYPE = np.dtype("<f4")
+
+
+def encoding_fields(encoding: Sequence[float], model: str = ENCODING_MODEL) -> Dict:
+    """Document fields ($set-ready) for storing one encoding"""
+    vector = np.asarray(encoding, dtype=ENCODING_DTYPE)
+    return {
+        "face_encoding": Binary(vector.tobytes()),
+        "face_encoding_v": ENCODING_FORMAT_VERSION,
+        "face_encoding_model": model,
+    }
+
+
+def decode_encoding(value) -> Optional[np.ndarray]:
+    """
+    float32 vector from a stored face_encoding. Binary values are wrapped
+    without copying (the result is read-only); legacy arrays are converted.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return np.frombuffer(value, dtype=ENCODING_DTYPE)
+    return np.asarray(value, dtype=np.float32)
+
@@ -0,0 +1,181 @@
+"""
+Face Gallery Cache
+Keeps every registered face encoding in memory as one contiguous float32
+matrix with a parallel id array, so frame processing never re-reads MongoDB.
+"""
+
+import os
+import threading
+import numpy as np
+from typing import Dict, Optional, Sequence, Tuple
+from app.services.ann_index import IVFFlatIndex, ANN_MIN_GALLERY_SIZE, ANN_INDEX_PATH
+from app.services.face_encoding import decode_encoding
+
+ENCODING_DIM = 128
+
+
+class FaceGallery:
+    """
+    In-memory gallery of known faces.
+
+    Loaded once at startup and updated incrementally on register/delete.
+    Appends grow the matrix in place (amortised by doubling capacity), while
+    replacements and deletions build a new matrix, so a snapshot handed to
+    a running recognition call is never mutated underneath it.
+
+    Once the gallery reaches ANN_MIN_GALLERY_SIZE an IVF-flat index is built
+    (or restored from disk) and kept in sync with every upsert/remove.
+    """
+
+    def __init__(self, dim: int = ENCODING_DIM, ann_min_size: int = ANN_MIN_GALLERY_SIZE,
+                 index_path: Optional[str] = ANN_INDEX_PATH):
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._buffer = np.empty((0, dim), dtype=np.float32)
+        self._ids = np.empty(0, dtype=object)
+        self._rows: Dict[str, int] = {}
+        self._size = 0
+        self.version = 0
+        self.loaded = False
+        self.ann_min_size = ann_min_size
+        self.index_path = index_path
+        self.index: Optional[IVFFlatIndex] = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, student_id: str) -> bool:
+        return student_id in self._rows
+
+    async def load(self, collection) -> int:
+        """Load all encodings from the students collection, replacing the current contents"""
+        ids = []
+        encodings = []
+        cursor = collection.find({}, {"student_id": 1, "face_encoding": 1})
+        async for student in cursor:
+            # Zero-copy view for binary encodings, converted for legacy arrays
+            encoding = decode_encoding(student.get("face_encoding"))
+            if encoding is None or len(encoding) != self.dim:
+                continue
+            ids.append(student["student_id"])
+            encodings.append(encoding)
+
+        if encodings:
+            matrix = np.stack(encodings).astype(np.float32, copy=False)
+        else:
+            matrix = np.empty((0, self.dim), dtype=np.float32)
+        with self._lock:
+            self._buffer = np.ascontiguousarray(matrix)
+            self._ids = np.array(ids, dtype=object)
+            self._rows = {student_id: row for row, student_id in enumerate(ids)}
+            self._size = len(ids)
+            self.version += 1
+            self.loaded = True
+            self.index = None
+            if self._size >= self.ann_min_size:
+                self._restore_or_build_index()
+        return self._size
+
+    def upsert(self, student_id: str, encoding: Sequence[float]) -> None:
+        """Insert a new encoding or replace the one stored for student_id"""
+        vector = np.asarray(encoding, dtype=np.float32).reshape(self.dim)
+        with self._lock:
+            row = self._rows.get(student_id)
+            if row is not None:
+                buffer = self._buffer.copy()
+                buffer[row] = vector
+                self._buffer = buffer
+            else:
+                if self._size == len(self._buffer):
+                    self._grow()
+                row = self._size
+                self._buffer[row] = vector
+                self._ids[row] = student_id
+                self._rows[student_id] = row
+                self._size += 1
+            self.version += 1
+
+            if self.index is not None:
+                self.index.add(student_id, vector)
+            elif self._size >= self.ann_min_size:
+                self._build_index()
+
+    def remove(self, student_id: str) -> bool:
+        """Remove a student's encoding. Returns False if it was not in the gallery"""
+        with self._lock:
+            row = self._rows.pop(student_id, None)
+            if row is None:
+                return False
+            last = self._size - 1
+            buffer = self._buffer.copy()
+            ids = self._ids.copy()
+            if row != last:
+                # Move the last row into the hole to keep the matrix dense
+                buffer[row] = buffer[last]
+                ids[row] = ids[last]
+                self._rows[ids[row]] = row
+            ids[last] = None
+            self._buffer = buffer
+            self._ids = ids
+            self._size = last
+            self.version += 1
+
+            if self.index is not None:
+                self.index.remove(student_id)
+            return True
+
+    def snapshot(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (encodings, ids) for the current gallery.
+        encodings is a C-contiguous (N, dim) float32 view; ids is a parallel object array.
+        """
+        with self._lock:
+            return self._buffer[:self._size], self._ids[:self._size]
+
+    def get(self, student_id: str) -> Optional[np.ndarray]:
+        row = self._rows.get(student_id)
+        if row is None:
+            return None
+        return self._buffer[row]
+
+    def save_index(self):
+        """Persist the ANN index (if any) so the next startup can skip training"""
+        with self._lock:
+            if self.index is not None and self.index_path:
+                self.index.save(self.index_path)
+
+    def _build_index(self):
+        index = IVFFlatIndex(dim=self.dim)
+        index.train(self._buffer[:self._size], self._ids[:self._size])
+        self.index = index
+        if self.index_path:
+            index.save(self.index_path)
+
+    def _restore_or_build_index(self):
+        if self.index_path and os.path.exists(self.index_path):
+            try:
+                index = IVFFlatIndex.load(self.index_path)
+                if len(index) == self._size and all(sid in index._rows for sid in self._rows):
+                    # Refresh vectors in case encodings were replaced since the save
+                    index_rows = [index._rows[sid] for sid in self._ids[:self._size]]
+                    stale = np.any(index._vectors[index_rows] != self._buffer[:self._size], axis=1)
+                    for row in np.flatnonzero(stale):
+                        index.add(self._ids[row], self._buffer[row])
+                    self.index = index
+                    return
+            except Exception as e:
+                print(f"⚠️  Face index at {self.index_path} unusable, rebuilding: {e}")
+        self._build_index()
+
+    def _grow(self):
+        capacity = max(64, len(self._buffer) * 2)
+        buffer = np.empty((capacity, self.dim), dtype=np.float32)
+        buffer[:self._size] = self._buffer[:self._size]
+        ids = np.empty(capacity, dtype=object)
+        ids[:self._size] = self._ids[:self._size]
+        self._buffer = buffer
+        self._ids = ids
+
+
+# Initialize global instance
+face_gallery = FaceGallery()
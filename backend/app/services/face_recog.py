@@ -1,36 +1,108 @@
-import face_recognition
 import cv2
 import numpy as np
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple
+from app.services.ann_index import IVFFlatIndex, ANN_MIN_GALLERY_SIZE
+from app.services.model_registry import model_registry
+
+MATCH_TOLERANCE = 0.6
 
 def encode_face(image_path: str) -> Optional[List[float]]:
     """Encodes a single face from an image file."""
+    face_recognition = model_registry.get("face_recognition")
     image = face_recognition.load_image_file(image_path)
     encodings = face_recognition.face_encodings(image)
     if len(encodings) > 0:
         return encodings[0].tolist()
     return None
 
-def recognize_faces(frame: np.ndarray, known_encodings: List[List[float]], known_ids: List[str]) -> List[str]:
+def match_encodings(
+    face_encodings: np.ndarray,
+    known_encodings: np.ndarray,
+    known_ids: Sequence[str],
+    tolerance: float = MATCH_TOLERANCE,
+    index: Optional[IVFFlatIndex] = None
+) -> List[Dict]:
     """
-    Detects and identifies faces in a video frame.
-    Returns a list of student_ids matched.
+    Matches every detected face against the gallery in a single pass.
+    Small galleries use an exact scan: one (faces x gallery) euclidean distance
+    matrix from a single matrix product, with argmin and tolerance vectorized.
+    Galleries of ANN_MIN_GALLERY_SIZE or more go through the IVF index when given.
+    Returns one dict per face: student_id (None if no match), distance and margin
+    (gap to the second-best gallery entry, None when the gallery has one entry).
+    """
+    if len(face_encodings) == 0:
+        return []
+    faces = np.asarray(face_encodings, dtype=np.float32).reshape(len(face_encodings), -1)
+    if len(known_ids) == 0:
+        return [{"student_id": None, "distance": None, "margin": None} for _ in range(len(faces))]
+
+    if index is not None and index.ready and len(known_ids) >= ANN_MIN_GALLERY_SIZE:
+        sq_top, ids_top = index.search(faces, k=2)
+        best_ids = ids_top[:, 0]
+        best = np.sqrt(sq_top[:, 0])
+        margins = np.sqrt(sq_top[:, 1]) - best
+        margins = np.where(np.isfinite(margins), margins, np.nan)
+    else:
+        # ||a - b||^2 = ||a||^2 + ||b||^2 - 2ab, with the cross term as one BLAS call
+        face_sq = np.einsum("ij,ij->i", faces, faces)[:, None]
+        known = np.asarray(known_encodings, dtype=np.float32)
+        known_sq = np.einsum("ij,ij->i", known, known)[None, :]
+        sq_dist = face_sq + known_sq - 2.0 * (faces @ known.T)
+        np.maximum(sq_dist, 0.0, out=sq_dist)
+
+        rows = np.arange(len(faces))
+        if sq_dist.shape[1] > 1:
+            nearest = np.argpartition(sq_dist, 1, axis=1)[:, :2]
+            first = sq_dist[rows, nearest[:, 0]]
+            second = sq_dist[rows, nearest[:, 1]]
+            best_index = np.where(second < first, nearest[:, 1], nearest[:, 0])
+            best = np.sqrt(np.minimum(first, second))
+            margins = np.sqrt(np.maximum(first, second)) - best
+        else:
+            best_index = np.zeros(len(faces), dtype=np.intp)
+            best = np.sqrt(sq_dist[:, 0])
+            margins = np.full(len(faces), np.nan)
+        best_ids = [known_ids[i] for i in best_index]
+    accepted = best <= tolerance
+
+    matches = []
+    for i in range(len(faces)):
+        matches.append({
+            "student_id": best_ids[i] if accepted[i] else None,
+            "distance": float(best[i]),
+            "margin": None if np.isnan(margins[i]) else float(margins[i])
+        })
+    return matches
+
+def detect_and_encode(frame: np.ndarray, scale: float = 0.25) -> Tuple[List[Tuple[int, int, int, int]], List[np.ndarray]]:
+    """
+    Detects faces on a downscaled copy of a BGR frame and computes their 128-d encodings.
+    Returns (face_locations, face_encodings); locations are (top, right, bottom, left)
+    in full-frame pixel coordinates.
     """
     # Resize frame for faster processing
-    small_frame = cv2.resize(frame, (0, 0), fx=0.25, fy=0.25)
+    small_frame = cv2.resize(frame, (0, 0), fx=scale, fy=scale) if scale != 1.0 else frame
     rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
 
+    face_recognition = model_registry.get("face_recognition")
     face_locations = face_recognition.face_locations(rgb_small_frame)
     face_encodings = face_recognition.face_encodings(rgb_small_frame, face_locations)
 
-    found_ids = []
-    for face_encoding in face_encodings:
-        matches = face_recognition.compare_faces(known_encodings, face_encoding, tolerance=0.6)
-        face_distances = face_recognition.face_distance(known_encodings, face_encoding)
-        
-        if len(face_distances) > 0:
-            best_match_index = np.argmin(face_distances)
-            if matches[best_match_index]:
-                found_ids.append(known_ids[best_match_index])
-    
-    return found_ids
+    full_locations = [tuple(int(round(v / scale)) for v in loc) for loc in face_locations]
+    return full_locations, face_encodings
+
+def recognize_faces(
+    frame: np.ndarray,
+    known_encodings: np.ndarray,
+    known_ids: Sequence[str],
+    index: Optional[IVFFlatIndex] = None
+) -> List[str]:
+    """
+    Detects and identifies faces in a video frame.
+    known_encodings is the (N, 128) float32 gallery matrix, known_ids the parallel ids;
+    index is the gallery's optional ANN index for large galleries.
+    Returns a list of student_ids matched.
+    """
+    _, face_encodings = detect_and_encode(frame)
+    matches = match_encodings(face_encodings, known_encodings, known_ids, index=index)
+    return [m["student_id"] for m in matches if m["student_id"] is not None]
@@ -0,0 +1,198 @@
+"""
+Frame Processor
+Shared per-frame flow used by the HTTP and WebSocket ingestion endpoints:
+motion gate, vision pipeline in the worker pool, identification through the
+camera's tracker, engagement scoring and attendance logging. Buffered frames
+go through the same flow as one batch: one pool job and one recorder write.
+"""
+
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from app.db.mongodb import db
+from app.services.attendance_recorder import AttendanceRecorder
+from app.services.camera_session import CameraSession
+from app.services.face_gallery import face_gallery
+from app.services.vision_pool import vision_pool, analyze_frame, analyze_frames
+from app.services.analytics_engine import engagement_scorer
+
+# Most frames accepted by one process-batch request
+MAX_BATCH_FRAMES = int(os.getenv("MAX_BATCH_FRAMES", "64"))
+
+
+class InvalidFrameError(ValueError):
+    """Raised when the uploaded bytes cannot be decoded as an image"""
+
+
+class FrameProcessor:
+    """
+    Processes one JPEG frame for a camera session.
+    Raises PoolSaturatedError when the vision pool is full and
+    InvalidFrameError when the frame cannot be decoded.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.recorder = AttendanceRecorder(db)
+
+    async def start(self):
+        await self.recorder.start()
+
+    async def stop(self):
+        await self.recorder.stop()
+
+    async def process(self, data: bytes, session: CameraSession) -> Dict:
+        if len(face_gallery) == 0:
+            return {"recognized_students": [], "count": 0, "message": "No students registered"}
+
+        # Static scene: reuse the last result, skip the pipeline and the DB writes
+        gate = session.motion_gate
+        signature = gate.signature(data)
+        should_analyze, _ = gate.check(signature)
+        if not should_analyze:
+            return gate.reuse(datetime.now().isoformat())
+        started = time.perf_counter()
+
+        # Detection, encoding, engagement, emotion and posture run in the vision pool
+        analysis = await vision_pool.run(analyze_frame, data, session.tracker.reusable_boxes())
+        if "error" in analysis:
+            raise InvalidFrameError(analysis["error"])
+
+        # Recognize new/stale faces, carry tracked identities forward
+        faces = analysis["faces"]
+        identities = session.identify(faces)
+        recognized = [(face, ident["student_id"]) for face, ident in zip(faces, identities) if ident["student_id"] is not None]
+        found_ids = [student_id for _, student_id in recognized]
+
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] 🔍 Analyzed frame ({session.camera_id}): {len(found_ids)} student(s) detected.")
+
+        # Log in DB; every metric comes from the recognized face's own box
+        logs, results = self.score_faces(recognized, datetime.now())
+
+        # One presence document per student per class session, written behind
+        class_session = await self.recorder.record(session.camera_id, logs)
+
+        result = {
+            "recognized_students": found_ids,
+            "count": len(found_ids),
+            "details": results,
+            "timestamp": datetime.now().isoformat(),
+            "session_id": class_session.session_id,
+            "skipped": False,
+            "tracking": session.tracker.stats(),
+            "motion": gate.stats()
+        }
+        gate.record(signature, result, (time.perf_counter() - started) * 1000)
+        return result
+
+    async def process_batch(self, frames: List[Tuple[bytes, datetime]], session: CameraSession) -> Dict:
+        """
+        Processes buffered (JPEG, capture time) frames of one camera in capture
+        order: one vision-pool job for every frame the motion gate selects, and
+        one recorder write for all of them. Per-frame results are returned in
+        the order the frames were given; undecodable frames get an error entry.
+        """
+        if len(face_gallery) == 0:
+            return {"frames": [], "count": 0, "message": "No students registered"}
+
+        order = sorted(range(len(frames)), key=lambda i: frames[i][1])
+        gate = session.motion_gate
+        signatures = [gate.signature(frames[i][0]) for i in order]
+        selected = gate.select(signatures, [frames[i][1].timestamp() for i in order])
+        analyze = [i for i, keep in zip(order, selected) if keep]
+
+        started = time.perf_counter()
+        analyses = {}
+        if analyze:
+            batch = await vision_pool.run(analyze_frames, [frames[i][0] for i in analyze],
+                                          session.tracker.reusable_boxes())
+            analyses = dict(zip(analyze, batch))
+        per_frame_ms = (time.perf_counter() - started) * 1000 / max(1, len(analyze))
+
+        class_session = await self.recorder.sessions.session_for(session.camera_id)
+        results: List[Dict] = [None] * len(frames)
+        logs = []
+        for signature, i in zip(signatures, order):
+            captured_at = frames[i][1]
+            analysis = analyses.get(i)
+            if analysis is None:
+                results[i] = (gate.reuse(captured_at.isoformat()) if gate.has_result
+                              else {"skipped": True, "timestamp": captured_at.isoformat()})
+                continue
+            if "error" in analysis:
+                results[i] = {"error": analysis["error"], "timestamp": captured_at.isoformat()}
+                continue
+
+            faces = analysis["faces"]
+            identities = session.identify(faces)
+            recognized = [(face, ident["student_id"]) for face, ident in zip(faces, identities) if ident["student_id"] is not None]
+            frame_logs, details = self.score_faces(recognized, captured_at)
+            logs.extend(frame_logs)
+            result = {
+                "recognized_students": [student_id for _, student_id in recognized],
+                "count": len(recognized),
+                "details": details,
+                "timestamp": captured_at.isoformat(),
+                "session_id": class_session.session_id,
+                "skipped": False,
+            }
+            gate.record(signature, result, per_frame_ms)
+            results[i] = result
+
+        # Presence, samples and rollups for the whole batch in one pass
+        await self.recorder.record(session.camera_id, logs)
+        present = sorted({log["student_id"] for log in logs})
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] 🔍 Analyzed batch ({session.camera_id}): "
+              f"{len(analyze)}/{len(frames)} frame(s), {len(present)} student(s) detected.")
+        return {
+            "frames": results,
+            "count": len(frames),
+            "analyzed": len(analyze),
+            "recognized_students": present,
+            "session_id": class_session.session_id,
+            "tracking": session.tracker.stats(),
+            "motion": gate.stats(),
+        }
+
+    @staticmethod
+    def score_faces(recognized: List[Tuple[Dict, str]], timestamp: datetime) -> Tuple[List[Dict], List[Dict]]:
+        """Attendance logs and response details for the recognized faces of one frame"""
+        logs = []
+        results = []
+        for face, student_id in recognized:
+            engagement = face["engagement"] or {}
+            # Base engagement score
+            base_score = engagement.get("engagement_score", 100.0)
+
+            # Comprehensive Enterprise Score
+            metrics = {
+                'eye_aspect_ratio': base_score / 100,
+                'head_pose': engagement.get('head_pose', 0),
+                'emotion': (face["emotion"] or {}).get('dominant_emotion', 'neutral'),
+                'posture_score': (face["posture"] or {}).get('posture_score', 70),
+                'attention_duration': 10  # Placeholder for session tracking
+            }
+            comprehensive_score = engagement_scorer.calculate_comprehensive_score(metrics)
+
+            logs.append({
+                "student_id": student_id,
+                "timestamp": timestamp,
+                "engagement_score": comprehensive_score,
+                "base_score": base_score,
+                "emotion": metrics['emotion'],
+                "posture_score": metrics['posture_score'],
+                "is_present": True
+            })
+            results.append({
+                "student_id": student_id,
+                "score": comprehensive_score,
+                "emotion": metrics['emotion'],
+                "bbox": list(face["bbox"])
+            })
+        return logs, results
+
+
+# Initialize global instance (shared by the API routers, started by app.main)
+frame_processor = FrameProcessor(db)
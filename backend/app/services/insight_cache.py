@@ -0,0 +1,129 @@
+"""
+Insight Cache
+Keeps LLM-generated dashboard insights off the request path. Insights are
+produced by a background refresh task and cached with TTL and LRU eviction,
+keyed by a hash of the (quantised) input metrics; requests always get the
+latest available insight immediately, together with its age.
+"""
+
+import os
+import time
+import json
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from app.services.ollama_ai import generate_student_report
+
+logger = logging.getLogger(__name__)
+
+INSIGHT_TTL = float(os.getenv("INSIGHT_TTL", "900"))
+INSIGHT_CACHE_SIZE = int(os.getenv("INSIGHT_CACHE_SIZE", "64"))
+# Engagement values are bucketed to this step before hashing, so jitter does not force a refresh
+INSIGHT_SCORE_STEP = float(os.getenv("INSIGHT_SCORE_STEP", "2.0"))
+PLACEHOLDER_INSIGHT = "System gathering data for analysis..."
+
+
+def metrics_key(attendance_data: Dict, engagement_trends: List[float], step: float = INSIGHT_SCORE_STEP) -> str:
+    """Stable hash of the inputs, insensitive to changes smaller than `step`"""
+    quantised = {
+        "attendance": attendance_data,
+        "trends": [round(v / step) for v in engagement_trends],
+    }
+    blob = json.dumps(quantised, sort_keys=True, default=str)
+    return hashlib.sha1(blob.encode()).hexdigest()
+
+
+class TTLCache:
+    """Small LRU cache whose entries also expire after `ttl` seconds"""
+
+    def __init__(self, max_entries: int = INSIGHT_CACHE_SIZE, ttl: float = INSIGHT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        """(value, created_at) for a live entry, else None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry[1] > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, value: str):
+        self._entries[key] = (value, time.time())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class InsightRefresher:
+    """
+    Serves cached insights and regenerates them in the background.
+
+    A request whose metrics hash is not cached gets the most recent insight
+    (marked stale) and schedules one refresh for its hash; concurrent requests
+    with the same hash share that refresh.
+    """
+
+    def __init__(self, cache: Optional[TTLCache] = None):
+        self.cache = cache or TTLCache()
+        self._latest: Optional[Tuple[str, float]] = None
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.failures = 0
+
+    def get(self, attendance_data: Dict, engagement_trends: List[float]) -> Dict:
+        key = metrics_key(attendance_data, engagement_trends)
+        entry = self.cache.get(key)
+        if entry is not None:
+            self.hits += 1
+            return self._response(entry, stale=False)
+
+        self.misses += 1
+        if key not in self._refreshing:
+            self._refreshing[key] = asyncio.create_task(self._refresh(key, attendance_data, engagement_trends))
+        if self._latest is None:
+            return {"insight": PLACEHOLDER_INSIGHT, "age_seconds": None, "stale": True}
+        return self._response(self._latest, stale=True)
+
+    async def _refresh(self, key: str, attendance_data: Dict, engagement_trends: List[float]):
+        try:
+            # Unavailability raises, so fallback text is never cached
+            insight = await generate_student_report(attendance_data, engagement_trends, raise_errors=True)
+            self.cache.put(key, insight)
+            self._latest = self.cache.get(key)
+            self.refreshes += 1
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"Insight refresh failed: {str(e)}")
+        finally:
+            self._refreshing.pop(key, None)
+
+    @staticmethod
+    def _response(entry: Tuple[str, float], stale: bool) -> Dict:
+        return {"insight": entry[0], "age_seconds": round(time.time() - entry[1], 1), "stale": stale}
+
+    def stats(self) -> Dict:
+        return {
+            "cached": len(self.cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "in_flight": len(self._refreshing),
+        }
+
+
+# Initialize global instance
+insight_refresher = InsightRefresher()
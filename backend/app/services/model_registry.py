@@ -0,0 +1,100 @@
+"""
+Model Registry
+Vision models (dlib face recognition, MediaPipe FaceMesh and Pose, DeepFace)
+are created on first use instead of at import time, so the API process starts
+without them and each vision worker loads them in the background. The
+registry records per-model load state and timing for the /ready probe.
+"""
+
+import time
+import threading
+import traceback
+from typing import Any, Callable, Dict, Iterable, Optional
+
+PENDING, LOADING, READY, FAILED = "pending", "loading", "ready", "failed"
+
+
+class ModelLoadError(RuntimeError):
+    """Raised by get() when a model failed to load"""
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._loaders: Dict[str, Callable[[], Any]] = {}
+        self._models: Dict[str, Any] = {}
+        self._state: Dict[str, Dict] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+
+    def register(self, name: str, loader: Callable[[], Any]):
+        self._loaders[name] = loader
+        self._locks[name] = threading.Lock()
+        self._state[name] = {"state": PENDING, "load_seconds": None, "error": None}
+
+    @property
+    def names(self):
+        return list(self._loaders)
+
+    def get(self, name: str) -> Any:
+        """The model instance, loading it on first use (once, even under concurrent callers)"""
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        with self._locks[name]:
+            model = self._models.get(name)
+            if model is not None:
+                return model
+            state = self._state[name]
+            if state["state"] == FAILED:
+                raise ModelLoadError(f"{name}: {state['error']}")
+            state["state"] = LOADING
+            started = time.perf_counter()
+            try:
+                model = self._loaders[name]()
+            except Exception as e:
+                state.update(state=FAILED, error=str(e), load_seconds=round(time.perf_counter() - started, 3))
+                traceback.print_exc()
+                raise ModelLoadError(f"{name}: {e}") from e
+            self._models[name] = model
+            state.update(state=READY, load_seconds=round(time.perf_counter() - started, 3))
+            return model
+
+    def load_all(self, names: Optional[Iterable[str]] = None) -> Dict[str, Dict]:
+        """Loads the given (default: all) models, recording failures instead of raising"""
+        for name in names or self.names:
+            try:
+                self.get(name)
+            except ModelLoadError:
+                pass
+        return self.status()
+
+    def status(self) -> Dict[str, Dict]:
+        return {name: dict(state) for name, state in self._state.items()}
+
+
+# Loaders import their libraries only when called -------------------------------
+
+def _load_face_recognition():
+    import face_recognition
+    return face_recognition
+
+
+def _load_face_mesh():
+    from app.services.engagement import EngagementDetector
+    return EngagementDetector()
+
+
+def _load_pose():
+    from app.services.advanced_ai import PostureAnalyzer
+    return PostureAnalyzer()
+
+
+def _load_emotion():
+    from app.services.advanced_ai import EmotionRecognitionEngine
+    return EmotionRecognitionEngine()
+
+
+model_registry = ModelRegistry()
+model_registry.register("face_recognition", _load_face_recognition)
+model_registry.register("face_mesh", _load_face_mesh)
+model_registry.register("pose", _load_pose)
+model_registry.register("emotion", _load_emotion)
@@ -0,0 +1,117 @@
+"""
+Motion Gate
+Cheap per-camera change detector placed in front of the vision pipeline.
+Frames are decoded at 1/8 scale in grayscale (DCT-domain downscaling) and
+compared with the last analysed frame; static scenes reuse the previous result.
+"""
+
+import os
+import time
+import copy
+import cv2
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+# Mean absolute grey-level change (0-255) below which a frame counts as static
+MOTION_THRESHOLD = float(os.getenv("MOTION_THRESHOLD", "3.0"))
+# Force a full analysis at least this often, even for a static scene
+MOTION_MAX_SKIP_SECONDS = float(os.getenv("MOTION_MAX_SKIP_SECONDS", "10"))
+SIGNATURE_SIZE = (64, 36)
+
+
+class MotionGate:
+    """
+    Decides per frame whether the scene changed enough to re-run analysis,
+    and keeps the counters needed to tune the threshold.
+    """
+
+    def __init__(self, threshold: float = MOTION_THRESHOLD, max_skip_seconds: float = MOTION_MAX_SKIP_SECONDS):
+        self.threshold = threshold
+        self.max_skip_seconds = max_skip_seconds
+        self._reference: Optional[np.ndarray] = None
+        self._last_result: Optional[Dict] = None
+        self._last_analyzed_at = 0.0
+        self.analyzed = 0
+        self.skipped = 0
+        self.avg_analysis_ms = 0.0
+        self.last_change = 0.0
+
+    @staticmethod
+    def signature(data: bytes) -> Optional[np.ndarray]:
+        """Small brightness-normalised grayscale thumbnail of a JPEG frame"""
+        gray = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+        if gray is None:
+            return None
+        thumb = cv2.resize(gray, SIGNATURE_SIZE, interpolation=cv2.INTER_AREA).astype(np.float32)
+        # Remove global brightness so camera auto-exposure does not count as motion
+        return thumb - thumb.mean()
+
+    def check(self, signature: Optional[np.ndarray]) -> Tuple[bool, float]:
+        """Returns (should_analyze, change_score) for a frame signature"""
+        if signature is None or self._reference is None or self._last_result is None:
+            return True, float("inf")
+        change = float(np.mean(np.abs(signature - self._reference)))
+        self.last_change = change
+        if change >= self.threshold:
+            return True, change
+        if time.time() - self._last_analyzed_at >= self.max_skip_seconds:
+            return True, change
+        return False, change
+
+    @property
+    def has_result(self) -> bool:
+        return self._last_result is not None
+
+    def select(self, signatures: List[Optional[np.ndarray]], capture_times: List[float]) -> List[bool]:
+        """
+        check() over an ordered batch of frames: each frame is compared with the
+        last frame selected before it, and at least one frame per
+        max_skip_seconds of capture time is selected
+        """
+        reference = self._reference if self._last_result is not None else None
+        last_at = None
+        decisions = []
+        for signature, captured_at in zip(signatures, capture_times):
+            if last_at is None:
+                last_at = captured_at
+            if signature is None or reference is None:
+                analyze = True
+            else:
+                change = float(np.mean(np.abs(signature - reference)))
+                self.last_change = change
+                analyze = change >= self.threshold or captured_at - last_at >= self.max_skip_seconds
+            if analyze and signature is not None:
+                reference = signature
+                last_at = captured_at
+            decisions.append(analyze)
+        return decisions
+
+    def record(self, signature: Optional[np.ndarray], result: Dict, elapsed_ms: float):
+        """Stores an analysed frame as the new reference"""
+        self._reference = signature
+        self._last_result = result
+        self._last_analyzed_at = time.time()
+        self.analyzed += 1
+        # EWMA of analysis cost, used to estimate the work saved by skipping
+        self.avg_analysis_ms = elapsed_ms if self.analyzed == 1 else 0.9 * self.avg_analysis_ms + 0.1 * elapsed_ms
+
+    def reuse(self, timestamp: str) -> Dict:
+        """Last result with only its timestamp refreshed"""
+        self.skipped += 1
+        result = copy.deepcopy(self._last_result)
+        result["timestamp"] = timestamp
+        result["skipped"] = True
+        result["motion"] = self.stats()
+        return result
+
+    def stats(self) -> Dict:
+        total = self.analyzed + self.skipped
+        return {
+            "threshold": self.threshold,
+            "analyzed": self.analyzed,
+            "skipped": self.skipped,
+            "skip_rate": round(self.skipped / total, 3) if total else 0.0,
+            "last_change": round(self.last_change, 2),
+            "avg_analysis_ms": round(self.avg_analysis_ms, 1),
+            "saved_ms": round(self.skipped * self.avg_analysis_ms, 1),
+        }
@@ -1,36 +1,39 @@
-import requests
-import json
+from typing import AsyncIterator
 
-OLLAMA_URL = "http://localhost:11434/api/generate"
-MODEL_NAME = "mistral" # or deepseek-r1:7b
+from app.services.ai.ollama_client import ollama_client, OllamaUnavailableError
 
-def generate_student_report(attendance_data: dict, engagement_trends: list) -> str:
-    """
-    Generates an AI report for a student using local Ollama instance.
-    """
-    prompt = f"""
+UNAVAILABLE_MESSAGE = "AI analysis unavailable: local Ollama service is not responding."
+
+
+def build_report_prompt(attendance_data: dict, engagement_trends: list) -> str:
+    return f"""
     Analyze the following student performance data and provide a concise summary and recommendations.
-    
+
     Attendance: {attendance_data}
     Engagement Trends (last 5 sessions): {engagement_trends}
-    
+
     Structure the response as:
     1. Summary of Performance
     2. At-risk Status (High/Medium/Low)
     3. Specific Recommendations for the Teacher
     """
-    
-    payload = {
-        "model": MODEL_NAME,
-        "prompt": prompt,
-        "stream": False
-    }
-    
+
+
+async def generate_student_report(attendance_data: dict, engagement_trends: list, raise_errors: bool = False) -> str:
+    """
+    Generates an AI report for a student using local Ollama instance.
+    Returns a fallback message when Ollama is unavailable, unless raise_errors is set.
+    """
     try:
-        response = requests.post(OLLAMA_URL, json=payload, timeout=30)
-        if response.status_code == 200:
-            return response.json().get("response", "No response from AI")
-        else:
-            return f"Error from Ollama: {response.text}"
-    except Exception as e:
-        return f"Failed to connect to local Ollama service: {str(e)}"
+        return await ollama_client.generate(build_report_prompt(attendance_data, engagement_trends)) \
+            or "No response from AI"
+    except OllamaUnavailableError:
+        if raise_errors:
+            raise
+        return UNAVAILABLE_MESSAGE
+
+
+async def stream_student_report(attendance_data: dict, engagement_trends: list) -> AsyncIterator[str]:
+    """Report text fragments as the model generates them; raises OllamaUnavailableError"""
+    async for fragment in ollama_client.generate_stream(build_report_prompt(attendance_data, engagement_trends)):
+        yield fragment
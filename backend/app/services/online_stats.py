@@ -0,0 +1,174 @@
+"""
+Online Statistics
+Constant-memory accumulators for single-pass analysis of unbounded record
+streams: Welford mean/variance with min/max, the P² streaming quantile
+estimator, running per-hour sums and the endpoint moving averages used by
+trend classification.
+"""
+
+import math
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Values kept (and the quantile computed exactly) before switching to P² markers;
+# P² is noticeably off on small samples
+P2_EXACT_SAMPLES = 100
+
+
+class RunningStats:
+    """Welford mean and (population) variance plus min/max"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x: float):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (x - self.mean)
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+
+    @property
+    def variance(self) -> float:
+        return self._m2 / self.count if self.count else 0.0
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+
+class P2Quantile:
+    """
+    Jain & Chlamtac P² estimator: tracks one quantile with five markers.
+    Exact until exact_until values have been seen; the markers then start
+    from the sample quantiles of those values.
+    """
+
+    def __init__(self, p: float = 0.5, exact_until: int = P2_EXACT_SAMPLES):
+        self.p = p
+        self.exact_until = max(5, exact_until)
+        self._initial: List[float] = []
+        self._q: List[float] = []  # marker heights
+        self._n: List[int] = []  # marker positions
+        self._desired: List[float] = []
+        self._step = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+
+    def add(self, x: float):
+        if not self._q:
+            self._initial.append(x)
+            if len(self._initial) >= self.exact_until:
+                self._start_markers()
+            return
+
+        q, n = self._q, self._n
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self._desired[i] += self._step[i]
+
+        for i in (1, 2, 3):
+            d = self._desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                candidate = self._parabolic(i, d)
+                if q[i - 1] < candidate < q[i + 1]:
+                    q[i] = candidate
+                else:
+                    q[i] += d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                n[i] += d
+
+    def _start_markers(self):
+        values = sorted(self._initial)
+        count, p = len(values), self.p
+        self._desired = [1.0, 1 + (count - 1) * p / 2, 1 + (count - 1) * p, 1 + (count - 1) * (1 + p) / 2, float(count)]
+        n = [int(round(d)) for d in self._desired]
+        # Marker positions must stay strictly increasing
+        for i in (1, 2, 3):
+            n[i] = min(max(n[i], n[i - 1] + 1), count - (4 - i))
+        self._n = n
+        self._q = [values[i - 1] for i in n]
+        self._initial = []
+
+    def _parabolic(self, i: int, d: int) -> float:
+        q, n = self._q, self._n
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+
+    @property
+    def value(self) -> Optional[float]:
+        if self._q:
+            return self._q[2]
+        if not self._initial:
+            return None
+        return float(np.quantile(self._initial, self.p))
+
+
+class HourlyMeans:
+    """Running sum and count of values per hour of day"""
+
+    def __init__(self):
+        self.sums = [0.0] * 24
+        self.counts = [0] * 24
+
+    def add(self, hour: int, value: float):
+        self.sums[hour] += value
+        self.counts[hour] += 1
+
+    def means(self) -> Dict[int, float]:
+        return {hour: self.sums[hour] / self.counts[hour] for hour in range(24) if self.counts[hour]}
+
+
+class EndpointWindows:
+    """
+    First and last `window` values of a series: all a moving-average
+    first-vs-last comparison needs, in constant memory.
+    """
+
+    def __init__(self, window: int = 5):
+        self.head: List[float] = []
+        self.tail = deque(maxlen=window)
+        self.window = window
+
+    def add(self, x: float):
+        if len(self.head) < self.window:
+            self.head.append(x)
+        self.tail.append(x)
+
+    def series(self) -> List[float]:
+        """Shortest series with the same first and last windows as the full one"""
+        if len(self.tail) < self.window:
+            return list(self.head)
+        return self.head + list(self.tail)
+
+
+def hour_of(timestamp) -> Optional[int]:
+    """Hour of a datetime or ISO-8601 string; None if it is neither"""
+    if isinstance(timestamp, datetime):
+        return timestamp.hour
+    if isinstance(timestamp, str):
+        try:
+            return datetime.fromisoformat(timestamp).hour
+        except ValueError:
+            return None
+    return None
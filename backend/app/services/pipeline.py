@@ -0,0 +1,347 @@
+"""
+Per-Frame Vision Pipeline
+Decodes and colour-converts a frame once, detects face boxes once, and feeds
+the same boxes to encoding, FaceMesh, emotion and posture. Results are joined
+per face box, so every metric belongs to the face it was measured on.
+
+JPEG frames are decoded at the resolution each consumer needs: detection
+runs on a DCT-domain reduced decode (IMREAD_REDUCED_COLOR_2/4/8), and the
+full-resolution frame is decoded once, only when the detector finds faces,
+then shared by encoding, FaceMesh, emotion and (as a resized view) posture.
+Frames expected to contain faces (tracked boxes, or faces in the previous
+frame of a batch) are decoded at full resolution up front instead, so they
+are never decoded twice.
+"""
+
+import time
+import cv2
+import numpy as np
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.services.model_registry import model_registry
+from app.services.tracking import covered_by, iou, TRACK_IOU_THRESHOLD, TRACK_AMBIGUOUS_IOU, TRACK_REENCODE_EVERY
+
+Box = Tuple[int, int, int, int]  # (top, right, bottom, left) in full-frame pixels
+
+# Decode flag per reduction factor
+REDUCED_DECODE = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def reduction_for(scale: float) -> int:
+    """Largest decode reduction factor that still yields at least `scale` resolution"""
+    for factor in (8, 4, 2):
+        if 1.0 / factor >= scale - 1e-9:
+            return factor
+    return 1
+
+
+def jpeg_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """(height, width) from a JPEG's SOF header without decoding; None for other formats"""
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    i = 2
+    while i + 9 <= len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:  # standalone markers
+            i += 2
+            continue
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            return int.from_bytes(data[i + 5:i + 7], "big"), int.from_bytes(data[i + 7:i + 9], "big")
+        i += 2 + int.from_bytes(data[i + 2:i + 4], "big")
+    return None
+
+
+class FrameContext:
+    """Shared state handed from stage to stage for one frame"""
+
+    def __init__(self, data: Optional[bytes] = None, frame: Optional[np.ndarray] = None):
+        self.data = data
+        self.bgr = frame  # full resolution, decoded on demand (see full_bgr)
+        self.rgb: Optional[np.ndarray] = None
+        self.small_rgb: Optional[np.ndarray] = None
+        self.frame_shape: Optional[Tuple[int, int]] = None  # full-resolution (h, w)
+        self.scale = 1.0
+        self._views: Dict[int, np.ndarray] = {}  # reduction factor -> BGR frame
+        self.small_boxes: List[Box] = []
+        self.boxes: List[Box] = []
+        self.faces: List[Dict] = []
+        self.posture: List[Dict] = []
+        self.reuse_boxes: Sequence[Box] = ()
+        self.previous_faces: Sequence[Dict] = ()  # faces of the preceding frame in a batch
+        self.timings: Dict[str, float] = {}
+        self.error: Optional[str] = None
+
+    def view(self, factor: int) -> Optional[np.ndarray]:
+        """BGR frame at 1/factor resolution, decoded (or resized from the full frame) once"""
+        image = self._views.get(factor)
+        if image is not None:
+            return image
+        if self.bgr is not None:
+            image = self.bgr if factor == 1 else cv2.resize(
+                self.bgr, (0, 0), fx=1.0 / factor, fy=1.0 / factor, interpolation=cv2.INTER_AREA)
+        else:
+            image = cv2.imdecode(np.frombuffer(self.data, np.uint8), REDUCED_DECODE[factor])
+            if factor == 1:
+                self.bgr = image
+        if image is not None:
+            self._views[factor] = image
+        return image
+
+    def full_bgr(self) -> Optional[np.ndarray]:
+        return self.view(1)
+
+    def full_rgb(self) -> Optional[np.ndarray]:
+        if self.rgb is None:
+            bgr = self.full_bgr()
+            if bgr is not None:
+                self.rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+        return self.rgb
+
+
+def box_center(box: Box) -> Tuple[float, float]:
+    top, right, bottom, left = box
+    return (left + right) / 2.0, (top + bottom) / 2.0
+
+
+def box_contains(box: Box, point: Tuple[float, float]) -> bool:
+    top, right, bottom, left = box
+    x, y = point
+    return left <= x <= right and top <= y <= bottom
+
+
+class FramePipeline:
+    """
+    Ordered stage graph over a FrameContext.
+
+    Each stage declares the stages it depends on; run() executes the requested
+    stages (plus their dependencies) in order and records per-stage timings.
+    """
+
+    def __init__(self, detection_scale: float = 0.25, posture_scale: float = 0.5):
+        self.detection_scale = detection_scale
+        self.detection_reduction = reduction_for(detection_scale)
+        self.posture_reduction = reduction_for(posture_scale)
+        self.stages: Dict[str, Tuple[Callable[[FrameContext], None], Sequence[str]]] = {
+            "decode": (self._decode, ()),
+            "convert": (self._convert, ("decode",)),
+            "detect": (self._detect, ("convert",)),
+            "encode": (self._encode, ("detect",)),
+            "face_mesh": (self._face_mesh, ("detect",)),
+            "emotion": (self._emotion, ("detect",)),
+            "posture": (self._posture, ("detect",)),
+        }
+        self.default_stages = ("encode", "face_mesh", "emotion", "posture")
+
+    def run(self, data: Optional[bytes] = None, frame: Optional[np.ndarray] = None,
+            stages: Optional[Sequence[str]] = None, reuse_boxes: Optional[Sequence[Box]] = None) -> Dict:
+        """
+        Runs the pipeline on JPEG bytes (or an already decoded BGR frame).
+        Faces overlapping one of reuse_boxes (confident tracks) skip encoding.
+        Returns {"faces": [...], "frame_shape": (h, w), "timings": {...}}; each face has
+        bbox, encoding, engagement, emotion and posture (None where unavailable).
+        """
+        ctx = FrameContext(data=data, frame=frame)
+        ctx.reuse_boxes = reuse_boxes or ()
+        return self._execute(ctx, self._resolve(stages or self.default_stages))
+
+    def run_batch(self, frames: Sequence[bytes], reuse_boxes: Optional[Sequence[Box]] = None) -> List[Dict]:
+        """
+        Runs the pipeline over consecutive JPEG frames of one camera, in order.
+        reuse_boxes applies to the first frame as in run(); in later frames a face
+        continuing a face of the previous frame takes over its encoding, or its
+        tracked status if it was not encoded, instead of being re-encoded. This
+        way confident tracks stay unencoded across the whole batch. Returns one
+        run() result per frame.
+        """
+        order = self._resolve(self.default_stages)
+        results = []
+        previous: Sequence[Dict] = ()
+        for i, data in enumerate(frames):
+            ctx = FrameContext(data=data)
+            ctx.reuse_boxes = (reuse_boxes or ()) if i == 0 else ()
+            ctx.previous_faces = previous
+            result = self._execute(ctx, order)
+            results.append(result)
+            previous = result.get("faces", ())
+        return results
+
+    def _execute(self, ctx: FrameContext, order: Sequence[str]) -> Dict:
+        for name in order:
+            started = time.perf_counter()
+            self.stages[name][0](ctx)
+            ctx.timings[name] = round((time.perf_counter() - started) * 1000, 2)
+            if ctx.error:
+                return {"error": ctx.error, "timings": ctx.timings}
+
+        self._join_posture(ctx)
+        return {
+            "faces": ctx.faces,
+            "frame_shape": ctx.frame_shape,
+            "timings": ctx.timings,
+        }
+
+    def _resolve(self, requested: Sequence[str]) -> List[str]:
+        order: List[str] = []
+
+        def visit(name):
+            if name in order:
+                return
+            for dep in self.stages[name][1]:
+                visit(dep)
+            order.append(name)
+
+        for name in requested:
+            visit(name)
+        return order
+
+    # Stages ----------------------------------------------------------------
+
+    def _decode(self, ctx: FrameContext):
+        # Only the reduced detection frame, unless faces are likely and the full frame will be needed
+        factor = self.detection_reduction
+        if ctx.bgr is None and (ctx.reuse_boxes or ctx.previous_faces):
+            ctx.full_bgr()
+        small = ctx.view(factor)
+        if small is None:
+            ctx.error = "invalid_image"
+            return
+        if ctx.bgr is not None:
+            ctx.frame_shape = ctx.bgr.shape[:2]
+            return
+        header = jpeg_size(ctx.data)
+        sh, sw = small.shape[:2]
+        # The header size is ignored if EXIF orientation rotated the decoded frame
+        if header is not None and abs(header[0] / factor - sh) <= 1 and abs(header[1] / factor - sw) <= 1:
+            ctx.frame_shape = header
+        else:
+            ctx.frame_shape = (sh * factor, sw * factor)
+
+    def _convert(self, ctx: FrameContext):
+        small_rgb = cv2.cvtColor(ctx.view(self.detection_reduction), cv2.COLOR_BGR2RGB)
+        residual = self.detection_scale * self.detection_reduction
+        if abs(residual - 1.0) > 1e-6:
+            small_rgb = cv2.resize(small_rgb, (0, 0), fx=residual, fy=residual, interpolation=cv2.INTER_AREA)
+        ctx.small_rgb = small_rgb
+        ctx.scale = small_rgb.shape[1] / ctx.frame_shape[1]
+
+    def _detect(self, ctx: FrameContext):
+        h, w = ctx.frame_shape
+        small_boxes = model_registry.get("face_recognition").face_locations(ctx.small_rgb)
+        ctx.small_boxes = small_boxes
+        for (top, right, bottom, left) in small_boxes:
+            box = (
+                max(0, int(round(top / ctx.scale))),
+                min(w, int(round(right / ctx.scale))),
+                min(h, int(round(bottom / ctx.scale))),
+                max(0, int(round(left / ctx.scale))),
+            )
+            ctx.boxes.append(box)
+            ctx.faces.append({
+                "bbox": box,
+                "encoding": None,
+                "engagement": None,
+                "emotion": None,
+                "posture": None,
+            })
+        if ctx.boxes and ctx.full_rgb() is None:
+            ctx.error = "invalid_image"
+
+    def _encode(self, ctx: FrameContext):
+        # Faces continuing a confident track keep their identity without encoding
+        pending = []
+        for i, box in enumerate(ctx.boxes):
+            if covered_by(box, ctx.reuse_boxes):
+                ctx.faces[i]["tracked"] = True
+                ctx.faces[i]["encoding_age"] = 1
+            else:
+                pending.append(i)
+        if ctx.previous_faces:
+            pending = [i for i in pending if not self._carry_encoding(ctx, i)]
+        if not pending:
+            return
+        # Full-resolution crops; detection boxes are already scaled up to the full frame
+        encodings = model_registry.get("face_recognition").face_encodings(ctx.rgb, [ctx.boxes[i] for i in pending])
+        for i, encoding in zip(pending, encodings):
+            ctx.faces[i]["encoding"] = np.asarray(encoding, dtype=np.float32)
+            ctx.faces[i]["encoding_age"] = 0
+
+    @staticmethod
+    def _carry_encoding(ctx: FrameContext, i: int) -> bool:
+        """
+        Copies the encoding (or, for a face left to the caller's tracker, the tracked
+        flag) of the single previous-frame face that box i continues. Ambiguous boxes
+        and identities carried for TRACK_REENCODE_EVERY frames are re-encoded.
+        """
+        box = ctx.boxes[i]
+        if any(j != i and iou(box, other) > TRACK_AMBIGUOUS_IOU for j, other in enumerate(ctx.boxes)):
+            return False
+        sources = [f for f in ctx.previous_faces
+                   if (f.get("encoding") is not None or f.get("tracked")) and iou(box, f["bbox"]) >= TRACK_IOU_THRESHOLD]
+        if len(sources) != 1 or sources[0].get("encoding_age", 0) + 1 >= TRACK_REENCODE_EVERY:
+            return False
+        ctx.faces[i]["encoding"] = sources[0]["encoding"]
+        ctx.faces[i]["encoding_age"] = sources[0].get("encoding_age", 0) + 1
+        if sources[0].get("tracked"):
+            ctx.faces[i]["tracked"] = True
+        return True
+
+    def _face_mesh(self, ctx: FrameContext):
+        if not ctx.boxes:
+            return
+        for face, metrics in zip(ctx.faces, model_registry.get("face_mesh").detect_engagement_rois(ctx.rgb, ctx.boxes)):
+            face["engagement"] = metrics
+
+    def _emotion(self, ctx: FrameContext):
+        if not ctx.boxes:
+            return
+        for face, emotion in zip(ctx.faces, model_registry.get("emotion").analyze_emotions(ctx.bgr, ctx.boxes)):
+            face["emotion"] = emotion
+
+    def _posture(self, ctx: FrameContext):
+        # Poses are only kept when joined to a face, so faceless frames skip the extra view
+        if not ctx.boxes:
+            return
+        # MediaPipe Pose resizes its input internally, so a reduced view (of the full frame) loses nothing
+        bgr = ctx.view(self.posture_reduction)
+        rgb = ctx.rgb if self.posture_reduction == 1 and ctx.rgb is not None else cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+        ctx.posture = model_registry.get("pose").analyze_posture(bgr, rgb=rgb)
+        # Anchors come back in view pixels; boxes are in full-frame pixels
+        fx = ctx.frame_shape[1] / bgr.shape[1]
+        fy = ctx.frame_shape[0] / bgr.shape[0]
+        for pose in ctx.posture:
+            if pose.get("anchor") is not None:
+                x, y = pose["anchor"]
+                pose["anchor"] = (int(x * fx), int(y * fy))
+
+    # Joins -----------------------------------------------------------------
+
+    def _join_posture(self, ctx: FrameContext):
+        """Attach each pose to the face box containing its nose, else the nearest box"""
+        for pose in ctx.posture:
+            anchor = pose.get("anchor")
+            if anchor is None or not ctx.faces:
+                continue
+            owner = next((f for f in ctx.faces if box_contains(f["bbox"], anchor)), None)
+            if owner is None:
+                distances = [np.hypot(*np.subtract(box_center(f["bbox"]), anchor)) for f in ctx.faces]
+                nearest = int(np.argmin(distances))
+                top, right, bottom, left = ctx.faces[nearest]["bbox"]
+                # Only accept a pose whose nose is within two face widths of the box
+                if distances[nearest] <= 2 * (right - left):
+                    owner = ctx.faces[nearest]
+            if owner is not None and owner["posture"] is None:
+                owner["posture"] = pose
+
+
+# Initialize global instance (created inside vision workers)
+frame_pipeline = FramePipeline()
@@ -0,0 +1,198 @@
+"""
+Presence Matrix
+Bitset attendance store: one row per student, one bit per class session,
+with a second bitset marking which sessions each student was expected at
+(their class roster). Attendance rates, absent lists, streaks and
+consistency for any date range are popcounts over column masks instead of
+document counts. Columns are appended as sessions close, which is not start
+order when sessions overlap, so ranges select columns by mask and histories
+are sorted by start time.
+"""
+
+import logging
+import numpy as np
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint16)
+
+
+class PresenceMatrix:
+    def __init__(self, row_capacity: int = 64, column_capacity: int = 256):
+        self._present = np.zeros((row_capacity, column_capacity // 8), dtype=np.uint8)
+        self._expected = np.zeros_like(self._present)
+        self._rows: Dict[str, int] = {}
+        self._ids: List[str] = []
+        self._starts = np.empty(column_capacity, dtype="datetime64[s]")
+        self._session_ids: List[str] = []
+        self._column_classes: List[Optional[str]] = []
+        self._columns: Dict[str, int] = {}
+
+    @property
+    def n_students(self) -> int:
+        return len(self._ids)
+
+    @property
+    def n_sessions(self) -> int:
+        return len(self._session_ids)
+
+    # Building ----------------------------------------------------------------
+
+    async def load(self, db) -> int:
+        """Builds the matrix from closed, explicitly started class sessions and the student roster"""
+        students = await db.students.find({}, {"student_id": 1, "class": 1, "registered_at": 1}).to_list(None)
+        async for doc in db.class_sessions.find(
+                {"status": "closed", "auto": {"$ne": True}}, {"session_id": 1, "class_name": 1, "started_at": 1, "present_students": 1}
+        ).sort("started_at", 1):
+            started_at = doc["started_at"]
+            roster = [s["student_id"] for s in students
+                      if (not doc.get("class_name") or s.get("class") == doc["class_name"])
+                      and (s.get("registered_at") is None or s["registered_at"] <= started_at)]
+            self.add_session(doc["session_id"], doc.get("class_name"), started_at,
+                             doc.get("present_students", []), roster)
+        return self.n_sessions
+
+    def add_session(self, session_id: str, class_name: Optional[str], started_at: datetime,
+                    present: Iterable[str], roster: Iterable[str]):
+        """Appends one session column; present students are always counted as expected"""
+        if session_id in self._columns:
+            return
+        present = set(present)
+        col = self.n_sessions
+        if col >= len(self._starts):
+            self._grow_columns()
+        self._starts[col] = np.datetime64(started_at, "s")
+        self._session_ids.append(session_id)
+        self._column_classes.append(class_name)
+        self._columns[session_id] = col
+
+        byte, bit = divmod(col, 8)
+        flag = np.uint8(0x80 >> bit)  # np.packbits bit order
+        for student_id in present | set(roster):
+            row = self._row(student_id)
+            self._expected[row, byte] |= flag
+            if student_id in present:
+                self._present[row, byte] |= flag
+
+    def _row(self, student_id: str) -> int:
+        row = self._rows.get(student_id)
+        if row is None:
+            row = len(self._ids)
+            if row >= self._present.shape[0]:
+                extra = self._present.shape[0]
+                self._present = np.vstack([self._present, np.zeros((extra, self._present.shape[1]), np.uint8)])
+                self._expected = np.vstack([self._expected, np.zeros((extra, self._expected.shape[1]), np.uint8)])
+            self._rows[student_id] = row
+            self._ids.append(student_id)
+        return row
+
+    def _grow_columns(self):
+        width = self._present.shape[1]
+        self._present = np.hstack([self._present, np.zeros_like(self._present)])
+        self._expected = np.hstack([self._expected, np.zeros_like(self._expected)])
+        self._starts = np.concatenate([self._starts, np.empty(width * 8, dtype="datetime64[s]")])
+
+    # Queries -----------------------------------------------------------------
+
+    def _selected_columns(self, start: Optional[datetime], end: Optional[datetime],
+                          class_name: Optional[str] = None) -> np.ndarray:
+        """Boolean mask over session columns started in [start, end)"""
+        starts = self._starts[:self.n_sessions]
+        selected = np.ones(self.n_sessions, dtype=bool)
+        if start:
+            selected &= starts >= np.datetime64(start, "s")
+        if end:
+            selected &= starts < np.datetime64(end, "s")
+        if class_name is not None:
+            selected &= np.array([c == class_name for c in self._column_classes], dtype=bool)
+        return selected
+
+    def _column_mask(self, start: Optional[datetime], end: Optional[datetime],
+                     class_name: Optional[str]) -> np.ndarray:
+        selected = np.zeros(self._present.shape[1] * 8, dtype=bool)
+        selected[:self.n_sessions] = self._selected_columns(start, end, class_name)
+        return np.packbits(selected)
+
+    def _select_rows(self, student_ids: Optional[Iterable[str]]) -> Tuple[List[str], np.ndarray]:
+        if student_ids is None:
+            return list(self._ids), np.arange(self.n_students)
+        ids = [s for s in student_ids if s in self._rows]
+        return ids, np.array([self._rows[s] for s in ids], dtype=int)
+
+    def counts(self, student_ids: Optional[Iterable[str]] = None, start: Optional[datetime] = None,
+               end: Optional[datetime] = None, class_name: Optional[str] = None) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """(student_ids, attended, expected) session counts for the selected rows and range"""
+        ids, rows = self._select_rows(student_ids)
+        mask = self._column_mask(start, end, class_name)
+        attended = POPCOUNT[self._present[rows] & mask].sum(axis=1)
+        expected = POPCOUNT[self._expected[rows] & mask].sum(axis=1)
+        return ids, attended, expected
+
+    def attendance(self, student_ids: Optional[Iterable[str]] = None, start: Optional[datetime] = None,
+                   end: Optional[datetime] = None, class_name: Optional[str] = None) -> Dict:
+        """Per-student and overall attendance rates (percent) plus students absent from every session"""
+        ids, attended, expected = self.counts(student_ids, start, end, class_name)
+        has_sessions = expected > 0
+        rates = np.where(has_sessions, 100.0 * attended / np.maximum(expected, 1), np.nan)
+        total_expected = int(expected.sum())
+        return {
+            "sessions": int(POPCOUNT[self._column_mask(start, end, class_name)].sum()),
+            "attendance_rate": round(100.0 * int(attended.sum()) / total_expected, 2) if total_expected else None,
+            "students": {sid: round(float(r), 2) for sid, r, ok in zip(ids, rates, has_sessions) if ok},
+            "never_present": [sid for sid, a, ok in zip(ids, attended, has_sessions) if ok and a == 0],
+        }
+
+    def history(self, student_id: str, start: Optional[datetime] = None,
+                end: Optional[datetime] = None) -> np.ndarray:
+        """Chronological presence (bool) over the sessions the student was expected at"""
+        row = self._rows.get(student_id)
+        if row is None:
+            return np.zeros(0, dtype=bool)
+        columns = np.flatnonzero(self._selected_columns(start, end))
+        columns = columns[np.argsort(self._starts[columns], kind="stable")]
+        present = np.unpackbits(self._present[row])[columns].astype(bool)
+        expected = np.unpackbits(self._expected[row])[columns].astype(bool)
+        return present[expected]
+
+    def consistency(self, student_id: str, start: Optional[datetime] = None,
+                    end: Optional[datetime] = None) -> Dict:
+        """Streaks and variability of one student's presence history"""
+        seq = self.history(student_id, start, end)
+        if len(seq) == 0:
+            return {"sessions": 0, "attended": 0, "attendance_rate": None, "current_streak": 0,
+                    "longest_streak": 0, "longest_absence": 0, "attendance_variance": 0.0}
+        # Run lengths of equal values
+        edges = np.flatnonzero(np.diff(seq.astype(np.int8))) + 1
+        bounds = np.concatenate([[0], edges, [len(seq)]])
+        lengths = np.diff(bounds)
+        values = seq[bounds[:-1]]
+        return {
+            "sessions": int(len(seq)),
+            "attended": int(seq.sum()),
+            "attendance_rate": round(100.0 * float(seq.mean()), 2),
+            # Positive: consecutive sessions attended up to now; negative: consecutive absences
+            "current_streak": int(lengths[-1] if values[-1] else -lengths[-1]),
+            "longest_streak": int(lengths[values].max()) if values.any() else 0,
+            "longest_absence": int(lengths[~values].max()) if (~values).any() else 0,
+            # Share of consecutive sessions where presence flipped
+            "attendance_variance": float(len(edges) / (len(seq) - 1)) if len(seq) > 1 else 0.0,
+        }
+
+    def absent_from(self, session_id: str) -> List[str]:
+        """Students expected at a session but not seen"""
+        col = self._columns.get(session_id)
+        if col is None:
+            return []
+        byte, bit = divmod(col, 8)
+        flag = np.uint8(0x80 >> bit)
+        rows = np.flatnonzero((self._expected[:self.n_students, byte] & ~self._present[:self.n_students, byte]) & flag)
+        return [self._ids[r] for r in rows]
+
+    def stats(self) -> Dict:
+        return {
+            "students": self.n_students,
+            "sessions": self.n_sessions,
+            "bytes": int(self._present.nbytes + self._expected.nbytes),
+        }
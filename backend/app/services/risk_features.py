@@ -0,0 +1,142 @@
+"""
+Risk Features
+Per-student dropout-risk features maintained incrementally. Every closed
+class session updates each attending student's state in O(1): EWMA
+engagement, an exponentially weighted regression slope and the
+negative-emotion rate. Sessions that are still open (an implicit daily
+session closes only on the next day) are folded into a copy of the state at
+query time, so risk reflects today's detections before the session closes.
+Risk queries read this state, together with the presence matrix, instead of
+re-scanning attendance history.
+"""
+
+import os
+import copy
+import logging
+from typing import Dict, Iterable, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from app.services.write_behind import WriteBehindBuffer
+
+logger = logging.getLogger(__name__)
+
+# Weight of the newest session in the EWMA / weighted regression
+RISK_EWMA_ALPHA = float(os.getenv("RISK_EWMA_ALPHA", "0.1"))
+# The slope (points per session) is reported over this many sessions, matching
+# the newest-minus-oldest trend over the last 30 records used before
+TREND_HORIZON = 29
+NEGATIVE_EMOTIONS = ('sad', 'angry', 'fear')
+
+
+class StudentFeatures:
+    """O(1)-update feature state for one student"""
+
+    FIELDS = ('attended', 'ewma_engagement', 'ewma_negative', 'w', 'wx', 'wy', 'wxx', 'wxy')
+
+    def __init__(self, student_id: str):
+        self.student_id = student_id
+        self.attended = 0  # sessions attended, also the x coordinate of the regression
+        self.ewma_engagement: Optional[float] = None
+        self.ewma_negative = 0.0
+        # Exponentially weighted sums for the engagement regression
+        self.w = self.wx = self.wy = self.wxx = self.wxy = 0.0
+
+    def observe_session(self, engagement: float, negative_rate: float = 0.0, alpha: float = RISK_EWMA_ALPHA):
+        if self.ewma_engagement is None:
+            self.ewma_engagement = engagement
+            self.ewma_negative = negative_rate
+        else:
+            self.ewma_engagement += alpha * (engagement - self.ewma_engagement)
+            self.ewma_negative += alpha * (negative_rate - self.ewma_negative)
+
+        decay = 1.0 - alpha
+        x = float(self.attended)
+        self.w = decay * self.w + 1.0
+        self.wx = decay * self.wx + x
+        self.wy = decay * self.wy + engagement
+        self.wxx = decay * self.wxx + x * x
+        self.wxy = decay * self.wxy + x * engagement
+        self.attended += 1
+
+    @property
+    def slope(self) -> float:
+        """Weighted least-squares engagement change per attended session"""
+        denominator = self.w * self.wxx - self.wx * self.wx
+        if self.attended < 2 or denominator <= 1e-9:
+            return 0.0
+        return (self.w * self.wxy - self.wx * self.wy) / denominator
+
+    def risk_input(self) -> Dict:
+        """Engagement part of the PredictiveAnalytics.calculate_dropout_risk input"""
+        return {
+            'engagement_trend': self.slope * TREND_HORIZON,
+            'negative_emotion_rate': self.ewma_negative,
+        }
+
+    def to_dict(self) -> Dict:
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, doc: Dict) -> "StudentFeatures":
+        features = cls(doc["student_id"])
+        for field in cls.FIELDS:
+            if field in doc:
+                setattr(features, field, doc[field])
+        return features
+
+
+def session_observation(entry) -> Tuple[float, float]:
+    """(engagement, negative-emotion rate) of one student's presence entry in a session"""
+    negative = sum(entry.emotions[e] for e in NEGATIVE_EMOTIONS)
+    return entry.engagement_score, negative / entry.detections if entry.detections else 0.0
+
+
+class RiskFeatureStore:
+    """In-memory feature table, persisted to risk_features through a write-behind buffer"""
+
+    def __init__(self, db):
+        self.db = db
+        self.collection = db.risk_features
+        self.writer = WriteBehindBuffer(self.collection, bulk=True)
+        self.features: Dict[str, StudentFeatures] = {}
+
+    async def start(self):
+        self.writer.start()
+        try:
+            await self.collection.create_index("student_id", unique=True)
+            async for doc in self.collection.find({}, {"_id": 0}):
+                self.features[doc["student_id"]] = StudentFeatures.from_dict(doc)
+        except Exception as e:
+            logger.error(f"Risk feature restore failed: {str(e)}")
+
+    async def stop(self):
+        await self.writer.stop()
+
+    def get(self, student_id: str) -> Optional[StudentFeatures]:
+        return self.features.get(student_id)
+
+    def current(self, student_id: str, active_sessions: Iterable = ()) -> Optional[StudentFeatures]:
+        """Stored features plus the student's still-open sessions; the stored state is not modified"""
+        entries = [s.presence[student_id] for s in active_sessions if student_id in s.presence]
+        state = self.features.get(student_id)
+        if not entries:
+            return state
+        state = copy.copy(state) if state is not None else StudentFeatures(student_id)
+        for entry in sorted(entries, key=lambda e: e.first_seen):
+            state.observe_session(*session_observation(entry))
+        return state
+
+    async def session_closed(self, session):
+        """Folds a finished class session into the features of every student who attended"""
+        ops = []
+        for student_id, entry in session.presence.items():
+            features = self.features.get(student_id)
+            if features is None:
+                features = self.features[student_id] = StudentFeatures(student_id)
+            features.observe_session(*session_observation(entry))
+            ops.append(UpdateOne({"student_id": student_id}, {"$set": features.to_dict()}, upsert=True))
+        await self.writer.add_many(ops)
+
+    def stats(self) -> Dict:
+        return {"students": len(self.features), "writes": self.writer.stats()}
@@ -0,0 +1,285 @@
+"""
+Engagement Rollups
+Pre-aggregated engagement statistics (count, sum, sum of squares, min, max)
+per hour and per day, for the whole school, each class and each student.
+Maintained incrementally as samples are recorded so dashboard, forecast and
+trend endpoints read O(days) rows instead of scanning raw logs.
+"""
+
+import os
+import asyncio
+import logging
+import numpy as np
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from app.services.analytics_engine import PredictiveAnalytics, TrendAnalyzer
+from app.services.write_behind import WriteBehindBuffer
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_FLUSH_INTERVAL = float(os.getenv("ROLLUP_FLUSH_INTERVAL", "10"))
+GRAINS = ("hour", "day")
+# Scope/key of the school-wide rollup
+ALL_SCOPE = ("all", "*")
+
+
+def bucket_start(timestamp: datetime, grain: str) -> datetime:
+    if grain == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def row_stats(row: Dict) -> Dict:
+    """Mean and standard deviation from a rollup row's running sums"""
+    count = row["count"]
+    mean = row["sum"] / count if count else 0.0
+    variance = max(row["sumsq"] / count - mean * mean, 0.0) if count else 0.0
+    return {
+        "bucket": row["bucket"].isoformat(),
+        "count": count,
+        "mean": round(mean, 2),
+        "std": round(variance ** 0.5, 2),
+        "min": row["min"],
+        "max": row["max"],
+    }
+
+
+class RollupAccumulator:
+    """In-memory partial aggregates, turned into $inc/$min/$max upserts"""
+
+    def __init__(self):
+        # (scope, key, grain, bucket) -> [count, sum, sumsq, min, max]
+        self.cells: Dict[Tuple[str, str, str, datetime], List[float]] = {}
+
+    def __len__(self) -> int:
+        return len(self.cells)
+
+    def add(self, scopes: Iterable[Tuple[str, str]], timestamp: datetime, value: float):
+        for grain in GRAINS:
+            start = bucket_start(timestamp, grain)
+            for scope, key in scopes:
+                cell = self.cells.get((scope, key, grain, start))
+                if cell is None:
+                    self.cells[(scope, key, grain, start)] = [1, value, value * value, value, value]
+                else:
+                    cell[0] += 1
+                    cell[1] += value
+                    cell[2] += value * value
+                    cell[3] = min(cell[3], value)
+                    cell[4] = max(cell[4], value)
+
+    def add_array(self, scopes: Iterable[Tuple[str, str]], timestamps: np.ndarray, values: np.ndarray):
+        """Vectorised add for datetime64 timestamps, used by backfills over packed buckets"""
+        if len(values) == 0:
+            return
+        values = values.astype(np.float64)
+        scopes = list(scopes)
+        for grain, unit in (("hour", "h"), ("day", "D")):
+            starts = timestamps.astype(f"datetime64[{unit}]")
+            keys, inverse = np.unique(starts, return_inverse=True)
+            count = np.bincount(inverse)
+            total = np.bincount(inverse, weights=values)
+            sumsq = np.bincount(inverse, weights=values * values)
+            low = np.full(len(keys), np.inf)
+            high = np.full(len(keys), -np.inf)
+            np.minimum.at(low, inverse, values)
+            np.maximum.at(high, inverse, values)
+            for i, start in enumerate(keys.astype("datetime64[ms]").astype(datetime)):
+                for scope, key in scopes:
+                    cell = self.cells.get((scope, key, grain, start))
+                    if cell is None:
+                        self.cells[(scope, key, grain, start)] = [
+                            int(count[i]), float(total[i]), float(sumsq[i]), float(low[i]), float(high[i])]
+                    else:
+                        cell[0] += int(count[i])
+                        cell[1] += float(total[i])
+                        cell[2] += float(sumsq[i])
+                        cell[3] = min(cell[3], float(low[i]))
+                        cell[4] = max(cell[4], float(high[i]))
+
+    def drain(self) -> List[UpdateOne]:
+        ops = [
+            UpdateOne(
+                {"scope": scope, "key": key, "grain": grain, "bucket": start},
+                {
+                    "$inc": {"count": cell[0], "sum": cell[1], "sumsq": cell[2]},
+                    "$min": {"min": cell[3]},
+                    "$max": {"max": cell[4]},
+                },
+                upsert=True,
+            )
+            for (scope, key, grain, start), cell in self.cells.items()
+        ]
+        self.cells = {}
+        return ops
+
+
+class RollupStore:
+    """
+    Live rollup maintenance for recorded samples. Samples are folded into
+    an accumulator and flushed as one upsert per touched cell.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.collection = db.engagement_rollups
+        self.writer = WriteBehindBuffer(self.collection, bulk=True)
+        self.pending = RollupAccumulator()
+        self._classes: Dict[str, Optional[str]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self.writer.start()
+        try:
+            await ensure_indexes(self.db)
+        except Exception as e:
+            logger.error(f"Rollup index creation failed: {str(e)}")
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        await self.writer.stop()
+
+    async def add(self, logs: List[Dict], class_name: Optional[str] = None):
+        for log in logs:
+            scopes = [ALL_SCOPE, ("student", log["student_id"])]
+            cls = class_name or await self._student_class(log["student_id"])
+            if cls:
+                scopes.append(("class", cls))
+            self.pending.add(scopes, log["timestamp"], float(log["engagement_score"]))
+
+    async def flush(self):
+        if len(self.pending):
+            await self.writer.add_many(self.pending.drain())
+
+    async def _student_class(self, student_id: str) -> Optional[str]:
+        if student_id not in self._classes:
+            doc = await self.db.students.find_one({"student_id": student_id}, {"class": 1})
+            self._classes[student_id] = (doc or {}).get("class") or None
+        return self._classes[student_id]
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(ROLLUP_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Rollup flush failed: {str(e)}")
+
+    def stats(self) -> Dict:
+        return {"pending_cells": len(self.pending), "writes": self.writer.stats()}
+
+
+async def ensure_indexes(db):
+    await db.engagement_rollups.create_index(
+        [("scope", 1), ("key", 1), ("grain", 1), ("bucket", 1)], unique=True)
+    await db.engagement_rollups.create_index([("grain", 1), ("scope", 1), ("bucket", 1)])
+
+
+# Readers ---------------------------------------------------------------------
+
+async def latest_rows(db, scope: str = "all", key: str = "*", grain: str = "day", limit: int = 30) -> List[Dict]:
+    """The most recent `limit` rollup rows, returned oldest first"""
+    rows = await db.engagement_rollups.find(
+        {"scope": scope, "key": key, "grain": grain}, {"_id": 0}
+    ).sort("bucket", -1).limit(limit).to_list(limit)
+    rows.reverse()
+    return rows
+
+
+async def overall_average(db) -> float:
+    rows = await db.engagement_rollups.find(
+        {"scope": ALL_SCOPE[0], "key": ALL_SCOPE[1], "grain": "day"}, {"count": 1, "sum": 1}
+    ).to_list(None)
+    count = sum(r["count"] for r in rows)
+    return sum(r["sum"] for r in rows) / count if count else 0.0
+
+
+async def students_seen_on(db, day: datetime) -> int:
+    return await db.engagement_rollups.count_documents(
+        {"scope": "student", "grain": "day", "bucket": bucket_start(day, "day")})
+
+
+async def hourly_profile(db, scope: str = "all", key: str = "*", days: int = 30) -> Dict[int, float]:
+    """Mean engagement by hour of day over the last `days` days"""
+    since = bucket_start(datetime.now(), "day") - timedelta(days=days)
+    rows = await db.engagement_rollups.find(
+        {"scope": scope, "key": key, "grain": "hour", "bucket": {"$gte": since}},
+        {"bucket": 1, "count": 1, "sum": 1},
+    ).to_list(None)
+    counts = np.zeros(24)
+    sums = np.zeros(24)
+    for row in rows:
+        counts[row["bucket"].hour] += row["count"]
+        sums[row["bucket"].hour] += row["sum"]
+    return {hour: round(float(sums[hour] / counts[hour]), 2) for hour in range(24) if counts[hour]}
+
+
+async def engagement_trends(db, scope: str = "all", key: str = "*", days: int = 30) -> Dict:
+    """Daily statistics, trend direction and hour-of-day profile from rollups"""
+    daily = [row_stats(r) for r in await latest_rows(db, scope, key, "day", days)]
+    hourly = await hourly_profile(db, scope, key, days)
+    peak_hour = max(hourly, key=hourly.get) if hourly else None
+    low_hour = min(hourly, key=hourly.get) if hourly else None
+    return {
+        "scope": scope,
+        "key": key,
+        "daily": daily,
+        "trend": TrendAnalyzer._calculate_trend([d["mean"] for d in daily]),
+        "hourly_average": hourly,
+        "peak_hour": peak_hour,
+        "low_hour": low_hour,
+    }
+
+
+async def daily_matrix(db, scope: str = "student", days: int = 30) -> Tuple[List[str], List[datetime], np.ndarray, np.ndarray]:
+    """
+    Daily mean engagement of every key in a scope as a padded (keys x days)
+    matrix plus presence mask, from one rollup query
+    """
+    since = bucket_start(datetime.now(), "day") - timedelta(days=days - 1)
+    rows = await db.engagement_rollups.find(
+        {"scope": scope, "grain": "day", "bucket": {"$gte": since}},
+        {"_id": 0, "key": 1, "bucket": 1, "count": 1, "sum": 1},
+    ).to_list(None)
+    keys = sorted({r["key"] for r in rows})
+    key_index = {k: i for i, k in enumerate(keys)}
+    dates = [since + timedelta(days=d) for d in range(days)]
+    values = np.zeros((len(keys), days))
+    mask = np.zeros((len(keys), days), dtype=bool)
+    for row in rows:
+        day = (row["bucket"] - since).days
+        if row["count"] and 0 <= day < days:
+            values[key_index[row["key"]], day] = row["sum"] / row["count"]
+            mask[key_index[row["key"]], day] = True
+    return keys, dates, values, mask
+
+
+async def forecast_all(db, scope: str = "student", days: int = 30, periods: int = 7) -> Dict:
+    """Engagement forecast for every student (or class) of a scope in one vectorised fit"""
+    keys, dates, values, mask = await daily_matrix(db, scope, days)
+    result = PredictiveAnalytics.forecast_engagement_batch(values, mask, periods)
+    forecasts = {}
+    for i, key in enumerate(keys):
+        if result["trend"][i] == "insufficient_data":
+            forecasts[key] = {"trend": "insufficient_data", "n_points": int(result["n_points"][i])}
+            continue
+        forecasts[key] = {
+            "forecast": np.round(result["forecast"][i], 2).tolist(),
+            "confidence_lower": np.round(result["confidence_lower"][i], 2).tolist(),
+            "confidence_upper": np.round(result["confidence_upper"][i], 2).tolist(),
+            "trend": str(result["trend"][i]),
+            "r_squared": round(float(result["r_squared"][i]), 4),
+            "n_points": int(result["n_points"][i]),
+        }
+    return {"scope": scope, "days": days, "periods": periods, "series": len(keys), "forecasts": forecasts}
@@ -0,0 +1,131 @@
+"""
+Streaming Camera Sessions
+State for one long-lived WebSocket camera connection: its own camera session
+(tracker, motion gate, gallery snapshot), a latest-frame-wins slot and a
+frame-rate limit. Frames arriving
+while the previous one is still being analysed replace the waiting frame
+instead of queueing, so results never lag behind the live feed.
+"""
+
+import asyncio
+import os
+import time
+import logging
+from typing import Dict, Optional
+
+from fastapi import WebSocketDisconnect
+
+from app.services.camera_session import CameraSession
+from app.services.frame_processor import FrameProcessor, InvalidFrameError
+from app.services.vision_pool import PoolSaturatedError
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on analysed frames per second for one stream
+STREAM_MAX_FPS = float(os.getenv("STREAM_MAX_FPS", "10"))
+# Largest accepted frame, in bytes
+STREAM_MAX_FRAME_BYTES = int(os.getenv("STREAM_MAX_FRAME_BYTES", str(2 * 1024 * 1024)))
+
+
+class StreamSession:
+    def __init__(self, websocket, camera: CameraSession, processor: FrameProcessor,
+                 max_fps: float = STREAM_MAX_FPS):
+        self.websocket = websocket
+        self.camera = camera
+        self.processor = processor
+        self.min_interval = 1.0 / max_fps if max_fps > 0 else 0.0
+        self._latest: Optional[bytes] = None
+        self._latest_seq = 0
+        self._ready = asyncio.Event()
+        self._closed = False
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+
+    async def run(self):
+        """Receive frames and push results until the client disconnects or processing fails"""
+        receiver = asyncio.create_task(self._receive_loop())
+        worker = asyncio.create_task(self._process_loop())
+        try:
+            # Either side ending ends the stream, so a dead worker never leaves frames unanswered
+            await asyncio.wait({receiver, worker}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self._closed = True
+            self._ready.set()
+            receiver.cancel()
+            worker.cancel()
+            results = await asyncio.gather(receiver, worker, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception) and not isinstance(result, WebSocketDisconnect):
+                logger.error(f"Stream {self.camera.camera_id} ended with an error: {str(result)}")
+
+    async def _receive_loop(self):
+        while True:
+            message = await self.websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            data = message.get("bytes")
+            if data is None:
+                # Text messages are control pings; answer with session stats
+                await self.websocket.send_json({"type": "stats", **self.stats()})
+                continue
+            self.received += 1
+            if len(data) > STREAM_MAX_FRAME_BYTES:
+                self.dropped += 1
+                continue
+            if self._latest is not None:
+                # An unprocessed frame is superseded by a newer one
+                self.dropped += 1
+            self._latest = data
+            self._latest_seq = self.received
+            self._ready.set()
+
+    async def _process_loop(self):
+        last_started = 0.0
+        while not self._closed:
+            await self._ready.wait()
+            self._ready.clear()
+            if self._closed:
+                return
+
+            wait = self.min_interval - (time.monotonic() - last_started)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            data, seq = self._latest, self._latest_seq
+            self._latest = None
+            if data is None:
+                continue
+
+            last_started = time.monotonic()
+            self.camera.touch()
+            try:
+                result = await self.processor.process(data, self.camera)
+            except PoolSaturatedError:
+                self.dropped += 1
+                continue
+            except InvalidFrameError:
+                await self.websocket.send_json({"type": "error", "seq": seq, "detail": "Invalid image"})
+                continue
+            except Exception as e:
+                # Database or worker-pool failure: tell the client and end the stream instead of going silent
+                logger.error(f"Stream {self.camera.camera_id}: frame processing failed: {str(e)}")
+                await self._close_with_error(seq, "Frame processing failed")
+                return
+
+            self.processed += 1
+            await self.websocket.send_json({"type": "result", "seq": seq, **result})
+
+    async def _close_with_error(self, seq: int, detail: str):
+        try:
+            await self.websocket.send_json({"type": "error", "seq": seq, "detail": detail})
+            await self.websocket.close(code=1011)
+        except Exception:
+            pass  # the client is already gone
+
+    def stats(self) -> Dict:
+        return {
+            "camera_id": self.camera.camera_id,
+            "received": self.received,
+            "processed": self.processed,
+            "dropped": self.dropped,
+        }
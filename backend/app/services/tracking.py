@@ -0,0 +1,167 @@
+"""
+Cross-Frame Face Tracking
+Associates face boxes between consecutive frames of one camera by IoU, so a
+student's identity is carried forward and the expensive 128-d encoding only
+runs for new, decayed or ambiguous tracks.
+"""
+
+import os
+import itertools
+from typing import Dict, List, Optional, Sequence, Tuple
+
+Box = Tuple[int, int, int, int]  # (top, right, bottom, left)
+
+# Minimum IoU for a detection to continue an existing track
+TRACK_IOU_THRESHOLD = float(os.getenv("TRACK_IOU_THRESHOLD", "0.3"))
+# Tracks whose boxes overlap more than this are re-encoded to avoid identity swaps
+TRACK_AMBIGUOUS_IOU = float(os.getenv("TRACK_AMBIGUOUS_IOU", "0.15"))
+# Force a re-encode after this many frames without one
+TRACK_REENCODE_EVERY = int(os.getenv("TRACK_REENCODE_EVERY", "30"))
+# Re-encode once identity confidence decays below this
+TRACK_MIN_CONFIDENCE = float(os.getenv("TRACK_MIN_CONFIDENCE", "0.35"))
+# Per-frame multiplicative decay of identity confidence
+TRACK_CONFIDENCE_DECAY = 0.97
+# Drop a track after this many frames without a detection
+TRACK_MAX_MISSES = 5
+
+
+def iou(a: Box, b: Box) -> float:
+    """Intersection over union of two (top, right, bottom, left) boxes"""
+    top, right = max(a[0], b[0]), min(a[1], b[1])
+    bottom, left = min(a[2], b[2]), max(a[3], b[3])
+    inter = max(0, right - left) * max(0, bottom - top)
+    if inter == 0:
+        return 0.0
+    area_a = (a[1] - a[3]) * (a[2] - a[0])
+    area_b = (b[1] - b[3]) * (b[2] - b[0])
+    return inter / float(area_a + area_b - inter)
+
+
+def covered_by(box: Box, boxes: Sequence[Box], threshold: float = TRACK_IOU_THRESHOLD) -> bool:
+    """True if box overlaps any of boxes by at least threshold IoU"""
+    return any(iou(box, other) >= threshold for other in boxes)
+
+
+class Track:
+    def __init__(self, track_id: int, bbox: Box):
+        self.track_id = track_id
+        self.bbox = bbox
+        self.student_id: Optional[str] = None
+        self.distance: Optional[float] = None
+        self.confidence = 0.0
+        self.frames_since_encode = 0
+        self.misses = 0
+        self.hits = 0
+
+
+class FaceTracker:
+    """
+    IoU tracker for one camera.
+
+    reusable_boxes() tells the pipeline which detections may skip encoding;
+    update() associates the new detections with tracks, applies fresh matches
+    and carries identities forward for the faces that were not re-encoded.
+    """
+
+    def __init__(self, tolerance: float = 0.6):
+        self.tolerance = tolerance
+        self.tracks: Dict[int, Track] = {}
+        self._ids = itertools.count(1)
+        self.encoded = 0
+        self.reused = 0
+
+    def reusable_boxes(self) -> List[Box]:
+        """Boxes of identified tracks that are still confident and unambiguous"""
+        tracks = list(self.tracks.values())
+        boxes = []
+        for track in tracks:
+            if track.student_id is None or track.misses > 0:
+                continue
+            if track.confidence < TRACK_MIN_CONFIDENCE or track.frames_since_encode >= TRACK_REENCODE_EVERY:
+                continue
+            if any(other is not track and iou(track.bbox, other.bbox) > TRACK_AMBIGUOUS_IOU for other in tracks):
+                continue
+            boxes.append(track.bbox)
+        return boxes
+
+    def update(self, faces: List[Dict], matches: List[Optional[Dict]]) -> List[Dict]:
+        """
+        faces are pipeline face records; matches is aligned with faces and holds the
+        gallery match for every face that was encoded (None for reused faces).
+        Returns one identity per face: {track_id, student_id, distance, confidence, reused}.
+        """
+        assignments = self._associate([f["bbox"] for f in faces])
+        identities = []
+        seen = set()
+
+        for i, face in enumerate(faces):
+            track = assignments.get(i)
+            if track is None:
+                track = Track(next(self._ids), face["bbox"])
+                self.tracks[track.track_id] = track
+            seen.add(track.track_id)
+            track.bbox = face["bbox"]
+            track.misses = 0
+            track.hits += 1
+
+            match = matches[i]
+            if match is not None:
+                self.encoded += 1
+                track.frames_since_encode = 0
+                if match.get("student_id") is not None:
+                    track.student_id = match["student_id"]
+                    track.distance = match["distance"]
+                    track.confidence = max(0.0, 1.0 - match["distance"] / self.tolerance)
+                else:
+                    # Encoded but unknown: drop any inherited identity
+                    track.student_id = None
+                    track.distance = match.get("distance")
+                    track.confidence = 0.0
+            else:
+                self.reused += 1
+                track.frames_since_encode += 1
+                track.confidence *= TRACK_CONFIDENCE_DECAY
+
+            identities.append({
+                "track_id": track.track_id,
+                "student_id": track.student_id,
+                "distance": track.distance,
+                "confidence": round(track.confidence, 3),
+                "reused": match is None,
+            })
+
+        for track_id in list(self.tracks):
+            if track_id not in seen:
+                track = self.tracks[track_id]
+                track.misses += 1
+                if track.misses > TRACK_MAX_MISSES:
+                    del self.tracks[track_id]
+        return identities
+
+    def stats(self) -> Dict:
+        total = self.encoded + self.reused
+        return {
+            "tracks": len(self.tracks),
+            "encoded": self.encoded,
+            "reused": self.reused,
+            "reuse_rate": round(self.reused / total, 3) if total else 0.0,
+        }
+
+    def _associate(self, boxes: List[Box]) -> Dict[int, Track]:
+        """Greedy highest-IoU-first assignment of detections to tracks"""
+        pairs = []
+        for i, box in enumerate(boxes):
+            for track in self.tracks.values():
+                overlap = iou(box, track.bbox)
+                if overlap >= TRACK_IOU_THRESHOLD:
+                    pairs.append((overlap, i, track))
+        pairs.sort(key=lambda p: p[0], reverse=True)
+
+        assignments: Dict[int, Track] = {}
+        used_tracks = set()
+        for _, i, track in pairs:
+            if i in assignments or track.track_id in used_tracks:
+                continue
+            assignments[i] = track
+            used_tracks.add(track.track_id)
+        return assignments
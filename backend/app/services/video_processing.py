@@ -0,0 +1,287 @@
+"""
+Offline Video Processing
+Runs recorded lectures through the same vision pipeline as live cameras.
+Frames are read from the file as a generator, sampled at a fixed rate,
+JPEG-encoded and sent to the vision pool in chunks with several chunks in
+flight, so every worker stays busy. Results are persisted in frame order
+through the camera tracker and the attendance recorder, one recorder write
+per chunk, and the job's frame offset is saved after each chunk so an
+interrupted job resumes where it stopped.
+"""
+
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import cv2
+
+from app.services.camera_session import CameraSession
+from app.services.frame_processor import FrameProcessor
+from app.services.vision_pool import vision_pool, analyze_frames, PoolSaturatedError
+
+logger = logging.getLogger(__name__)
+
+# Frames analysed per second of video
+VIDEO_SAMPLE_FPS = float(os.getenv("VIDEO_SAMPLE_FPS", "1"))
+# Sampled frames per vision-pool job
+VIDEO_CHUNK_FRAMES = int(os.getenv("VIDEO_CHUNK_FRAMES", "16"))
+VIDEO_JPEG_QUALITY = int(os.getenv("VIDEO_JPEG_QUALITY", "90"))
+# Wait before re-submitting a chunk rejected by a saturated pool
+VIDEO_RETRY_SECONDS = 0.5
+# Jobs started through the API may only read files inside this directory
+VIDEO_UPLOAD_DIR = os.getenv("VIDEO_UPLOAD_DIR", "data/videos")
+
+Frame = Tuple[int, float, bytes]  # (frame index, offset in seconds, JPEG bytes)
+
+
+class VideoOpenError(ValueError):
+    """Raised when a video file cannot be opened"""
+
+
+class VideoReader:
+    """Sampled frames of a video file, decoded lazily as a generator"""
+
+    def __init__(self, path: str, sample_fps: float = VIDEO_SAMPLE_FPS, jpeg_quality: int = VIDEO_JPEG_QUALITY):
+        self.path = path
+        self.sample_fps = sample_fps
+        self.jpeg_quality = jpeg_quality
+        capture = cv2.VideoCapture(path)
+        if not capture.isOpened():
+            raise VideoOpenError(f"Cannot open video: {path}")
+        self.fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+        self.frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        capture.release()
+        # Every step-th frame is analysed
+        self.step = max(1, round(self.fps / sample_fps)) if sample_fps > 0 else 1
+
+    def frames(self, start_frame: int = 0) -> Iterator[Frame]:
+        capture = cv2.VideoCapture(self.path)
+        try:
+            if start_frame:
+                capture.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+            index = start_frame
+            params = [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality]
+            while True:
+                if index % self.step == 0:
+                    ok, frame = capture.read()
+                    if not ok:
+                        return
+                    ok, jpeg = cv2.imencode(".jpg", frame, params)
+                    if ok:
+                        yield index, index / self.fps, jpeg.tobytes()
+                elif not capture.grab():  # skipped frames are not decoded
+                    return
+                index += 1
+        finally:
+            capture.release()
+
+    def chunks(self, start_frame: int = 0, size: int = VIDEO_CHUNK_FRAMES) -> Iterator[List[Frame]]:
+        chunk: List[Frame] = []
+        for frame in self.frames(start_frame):
+            chunk.append(frame)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def upload_path(name: str, upload_dir: str = VIDEO_UPLOAD_DIR) -> str:
+    """
+    Resolves a client-supplied video path against the upload directory.
+    Anything outside it (absolute paths, '..', symlinks out, URLs, devices)
+    is rejected, so API clients cannot make OpenCV/FFmpeg open arbitrary sources.
+    """
+    root = os.path.realpath(upload_dir)
+    path = os.path.realpath(os.path.join(root, name))
+    if os.path.commonpath([root, path]) != root or not os.path.isfile(path):
+        raise VideoOpenError(f"No video named {name!r} in the upload directory")
+    return path
+
+
+def default_job_id(path: str) -> str:
+    """Stable id for a file, so re-running the same command resumes its job"""
+    stat = os.stat(path)
+    key = f"{os.path.abspath(path)}:{stat.st_size}:{int(stat.st_mtime)}"
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+class VideoJob:
+    """
+    One video file processed into a class session.
+
+    With session_id the results go to that active class session; otherwise a
+    session for class_name is started on a per-job camera and closed when the
+    job ends, whether it finished, failed or was cancelled; a resumed job
+    continues in a new session. Progress lives in the video_jobs collection.
+    """
+
+    def __init__(self, db, processor: FrameProcessor, path: str, job_id: Optional[str] = None,
+                 class_name: Optional[str] = None, session_id: Optional[str] = None,
+                 sample_fps: float = VIDEO_SAMPLE_FPS, recorded_at: Optional[datetime] = None,
+                 chunk_frames: int = VIDEO_CHUNK_FRAMES, parallel: Optional[int] = None):
+        self.db = db
+        self.processor = processor
+        self.path = path
+        self.job_id = job_id or default_job_id(path)
+        self.class_name = class_name
+        self.session_id = session_id
+        self.sample_fps = sample_fps
+        self.recorded_at = recorded_at
+        self.chunk_frames = chunk_frames
+        self.parallel = parallel or max(1, vision_pool.workers)
+        self.camera_id = f"video:{self.job_id}"
+        self.owns_session = session_id is None
+
+    async def run(self) -> Dict:
+        job, reader = await self._load_or_create()
+        if job["status"] == "done":
+            return job
+        self.recorded_at = job["recorded_at"]
+        self.owns_session = job["owns_session"]
+        started = time.perf_counter()
+        in_flight = deque()
+        try:
+            await self._attach_session(job)
+            camera = CameraSession(self.camera_id)
+            await self._update(status="running", error=None)
+            chunks = reader.chunks(job["next_frame"], self.chunk_frames)
+            while True:
+                # Decoding runs on a thread so an API-hosted job does not block the event loop
+                chunk = await asyncio.to_thread(next, chunks, None)
+                if chunk is None:
+                    break
+                in_flight.append((chunk, asyncio.create_task(self._analyze(chunk))))
+                if len(in_flight) >= self.parallel:
+                    await self._persist(camera, *in_flight.popleft())
+            while in_flight:
+                await self._persist(camera, *in_flight.popleft())
+        except BaseException as e:
+            for _, task in in_flight:
+                task.cancel()
+            cancelled = isinstance(e, asyncio.CancelledError)
+            await self._update(status="cancelled" if cancelled else "failed", error=None if cancelled else str(e))
+            raise
+        finally:
+            # The job's own session never outlives it
+            if self.owns_session and self.session_id:
+                await self.processor.recorder.sessions.stop_session(self.session_id)
+
+        elapsed = time.perf_counter() - started
+        await self._update(status="done", finished_at=datetime.now(), processing_seconds=round(elapsed, 1))
+        return await self.status()
+
+    async def status(self) -> Optional[Dict]:
+        return await self.db.video_jobs.find_one({"job_id": self.job_id}, {"_id": 0})
+
+    # Steps -------------------------------------------------------------------
+
+    async def _load_or_create(self) -> Tuple[Dict, VideoReader]:
+        job = await self.status()
+        if job is not None:
+            # A resumed job keeps its sampling, so frame offsets stay aligned
+            logger.info(f"Resuming video job {self.job_id} at frame {job['next_frame']}")
+            return job, VideoReader(self.path, job["sample_fps"])
+        reader = VideoReader(self.path, self.sample_fps)
+        job = {
+            "job_id": self.job_id,
+            "path": os.path.abspath(self.path),
+            "camera_id": self.camera_id,
+            "class_name": self.class_name,
+            "session_id": self.session_id,
+            "owns_session": self.owns_session,
+            "sample_fps": self.sample_fps,
+            "fps": reader.fps,
+            "total_frames": reader.frame_count,
+            # Without a recording time the video is taken to have just ended, so no sample is in the future
+            "recorded_at": self.recorded_at or datetime.now() - timedelta(seconds=reader.frame_count / reader.fps),
+            "next_frame": 0,
+            "frames_analyzed": 0,
+            "detections": 0,
+            "status": "pending",
+            "created_at": datetime.now(),
+        }
+        await self.db.video_jobs.insert_one(dict(job))
+        return job, reader
+
+    async def _attach_session(self, job: Dict):
+        sessions = self.processor.recorder.sessions
+        if not self.owns_session:
+            self.session_id = job.get("session_id") or self.session_id
+            session = next((s for s in sessions.active_sessions() if s.session_id == self.session_id), None)
+            if session is None:
+                raise ValueError(f"Class session {self.session_id} is not active")
+            self.camera_id = session.camera_id
+        else:
+            # The session of an interrupted run was closed with it
+            self.class_name = job.get("class_name") or self.class_name
+            session = await sessions.start_session(self.class_name, self.camera_id)
+            self.session_id = session.session_id
+            await self._update(session_id=self.session_id)
+
+    async def _analyze(self, chunk: List[Frame]) -> List[Dict]:
+        frames = [jpeg for _, _, jpeg in chunk]
+        while True:
+            try:
+                return await vision_pool.run(analyze_frames, frames)
+            except PoolSaturatedError:
+                # Live cameras keep priority; retry once they have drained
+                await asyncio.sleep(VIDEO_RETRY_SECONDS)
+
+    async def _persist(self, camera: CameraSession, chunk: List[Frame], task: asyncio.Task):
+        analyses = await task
+        # Gallery matching for a whole chunk runs on a thread, keeping an API-hosted job off the event loop
+        logs = await asyncio.to_thread(self._score_chunk, camera, chunk, analyses)
+        if logs:
+            await self.processor.recorder.record(self.camera_id, logs)
+        # Frames up to the end of this chunk are persisted; a restart continues after them
+        await self.db.video_jobs.update_one(
+            {"job_id": self.job_id},
+            {
+                "$set": {"next_frame": chunk[-1][0] + 1, "updated_at": datetime.now()},
+                "$inc": {"frames_analyzed": len(chunk), "detections": len(logs)},
+            },
+        )
+
+    def _score_chunk(self, camera: CameraSession, chunk: List[Frame], analyses: List[Dict]) -> List[Dict]:
+        logs = []
+        for (_, offset, _), analysis in zip(chunk, analyses):
+            if "error" in analysis:
+                continue
+            faces = analysis["faces"]
+            identities = camera.identify(faces)
+            recognized = [(face, ident["student_id"]) for face, ident in zip(faces, identities)
+                          if ident["student_id"] is not None]
+            frame_logs, _ = self.processor.score_faces(recognized, self.recorded_at + timedelta(seconds=offset))
+            logs.extend(frame_logs)
+        return logs
+
+    async def _update(self, **fields):
+        await self.db.video_jobs.update_one({"job_id": self.job_id}, {"$set": fields})
+
+
+# job_id -> task of video jobs started through the API
+running_jobs: Dict[str, asyncio.Task] = {}
+
+
+def start_background(job: VideoJob) -> bool:
+    """Runs a job as a background task; False if it is already running"""
+    task = running_jobs.get(job.job_id)
+    if task is not None and not task.done():
+        return False
+
+    async def run():
+        try:
+            await job.run()
+        except Exception as e:
+            logger.error(f"Video job {job.job_id} failed: {str(e)}")
+        finally:
+            running_jobs.pop(job.job_id, None)
+
+    running_jobs[job.job_id] = asyncio.create_task(run())
+    return True
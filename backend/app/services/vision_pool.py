@@ -0,0 +1,253 @@
+"""
+Vision Worker Pool
+Runs CPU-bound vision work (dlib, MediaPipe, DeepFace) in warm worker
+processes so frame analysis never blocks the asyncio event loop.
+"""
+
+import asyncio
+import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from app.services.model_registry import model_registry, READY
+
+# 0 runs analysis in a thread of the API process instead of a separate process
+VISION_WORKERS = int(os.getenv("VISION_WORKERS", "2"))
+# Threads each worker may use for OpenCV / BLAS / TensorFlow
+VISION_WORKER_THREADS = int(os.getenv("VISION_WORKER_THREADS", "1"))
+# Frames allowed in flight (running + queued) before the pool reports saturation
+VISION_MAX_PENDING = int(os.getenv("VISION_MAX_PENDING", str(max(1, VISION_WORKERS) * 2)))
+
+THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "TF_NUM_INTRAOP_THREADS",
+    "TF_NUM_INTEROP_THREADS",
+)
+
+
+class PoolSaturatedError(RuntimeError):
+    """Raised when the pool already has VISION_MAX_PENDING frames in flight"""
+
+
+# ---------------------------------------------------------------------------
+# Worker side
+# ---------------------------------------------------------------------------
+
+def _init_worker(threads: int, status_queue=None):
+    """
+    Pin thread counts and load every model once per worker process, then
+    report this worker's model status to the API process on status_queue.
+    """
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(threads)
+    import cv2
+    cv2.setNumThreads(threads)
+    try:
+        status = warm_up_models()
+    except Exception as e:
+        status = {"pid": os.getpid(), "models": model_registry.status(), "error": str(e)}
+    if status_queue is not None:
+        status_queue.put(status)
+
+
+def warm_up_models() -> Dict[str, Any]:
+    """
+    Loads every registered model and runs it once on a dummy frame so the
+    first real request is not slow. Returns this process's model status.
+    """
+    from app.services.pipeline import frame_pipeline
+
+    model_registry.load_all()
+    dummy = np.zeros((96, 96, 3), dtype=np.uint8)
+    try:
+        frame_pipeline.run(frame=dummy)
+        model_registry.get("emotion").analyze_emotions(dummy, [(0, 96, 96, 0)])
+    except Exception as e:
+        print(f"⚠️  Vision worker warm-up failed: {e}")
+    return _worker_status()
+
+
+def _worker_status() -> Dict[str, Any]:
+    return {"pid": os.getpid(), "models": model_registry.status()}
+
+
+def analyze_frame(data: bytes, reuse_boxes: Optional[list] = None) -> Dict[str, Any]:
+    """
+    Runs the per-frame vision pipeline on JPEG bytes. Returns one record per
+    face box (bbox, encoding, engagement, emotion, posture). Faces covered by
+    reuse_boxes are not encoded. Gallery matching is left to the caller, which
+    owns the in-memory face gallery.
+    """
+    from app.services.pipeline import frame_pipeline
+    return frame_pipeline.run(data, reuse_boxes=reuse_boxes)
+
+
+def analyze_frames(frames: List[bytes], reuse_boxes: Optional[list] = None) -> List[Dict[str, Any]]:
+    """analyze_frame over consecutive frames of one camera in a single pool job"""
+    from app.services.pipeline import frame_pipeline
+    return frame_pipeline.run_batch(frames, reuse_boxes=reuse_boxes)
+
+
+def encode_image(data: bytes) -> Optional[list]:
+    """Encodes the single face of a registration image"""
+    import cv2
+    from app.services.face_recog import detect_and_encode
+
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+    _, encodings = detect_and_encode(image, scale=1.0)
+    return encodings[0].tolist() if len(encodings) else None
+
+
+# ---------------------------------------------------------------------------
+# API side
+# ---------------------------------------------------------------------------
+
+class VisionPool:
+    """
+    Process pool with warm, thread-pinned workers.
+
+    Endpoints await run(); when the number of in-flight jobs reaches
+    max_pending, run() raises PoolSaturatedError so callers can shed load
+    (e.g. answer 503) instead of queueing frames that will arrive stale.
+    """
+
+    def __init__(self, workers: int = VISION_WORKERS, threads_per_worker: int = VISION_WORKER_THREADS,
+                 max_pending: int = VISION_MAX_PENDING):
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        self.max_pending = max_pending
+        self._executor: Optional[Executor] = None
+        self._pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self._started_at: Optional[float] = None
+        # pid -> model status reported by each warmed-up worker
+        self._warm: Dict[int, Dict[str, Any]] = {}
+        self._warm_errors: list = []
+        self._status_queue = None
+        self._status_thread: Optional[threading.Thread] = None
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    @property
+    def saturated(self) -> bool:
+        return self._pending >= self.max_pending
+
+    def start(self):
+        if self._executor is not None:
+            return
+        self._started_at = time.monotonic()
+        self._warm = {}
+        self._warm_errors = []
+        if self.workers <= 0:
+            # In-process fallback: models live in the API process, work runs on threads.
+            # Warming up on the vision thread keeps the event loop free meanwhile.
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vision")
+            self._executor.submit(warm_up_models).add_done_callback(self._warm_up_done)
+            return
+
+        # Children inherit the environment at spawn time, before numpy/BLAS load
+        for var in THREAD_ENV_VARS:
+            os.environ.setdefault(var, str(self.threads_per_worker))
+        context = multiprocessing.get_context("spawn")
+        # Workers report from their initializer: which worker picks up which task
+        # is up to the executor, so task replies cannot tell the workers apart
+        self._status_queue = context.SimpleQueue()
+        self._status_thread = threading.Thread(target=self._collect_status, args=(self._status_queue,),
+                                               name="vision-status", daemon=True)
+        self._status_thread.start()
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(self.threads_per_worker, self._status_queue),
+        )
+        # Spawn every worker now so model loading happens before the first frame
+        for _ in range(self.workers):
+            self._executor.submit(_worker_status)
+
+    def _collect_status(self, status_queue):
+        while True:
+            status = status_queue.get()
+            if status is None:
+                return
+            self._worker_warmed(status)
+
+    def _warm_up_done(self, future):
+        try:
+            self._worker_warmed(future.result())
+        except Exception as e:
+            self._warm_errors.append(str(e))
+
+    def _worker_warmed(self, status: Dict[str, Any]):
+        if "error" in status:
+            self._warm_errors.append(f"worker {status['pid']}: {status['error']}")
+        if self._started_at is not None:
+            status["ready_after_seconds"] = round(time.monotonic() - self._started_at, 3)
+        self._warm[status["pid"]] = status
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._status_queue is not None:
+            self._status_queue.put(None)  # stops the collector thread
+            self._status_queue = None
+            self._status_thread = None
+
+    async def run(self, fn: Callable, *args) -> Any:
+        if self.saturated:
+            self.rejected += 1
+            raise PoolSaturatedError(f"{self._pending} vision jobs in flight")
+        if self._executor is None:
+            self.start()
+
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self._pending -= 1
+            self.completed += 1
+
+    def readiness(self) -> Dict[str, Any]:
+        """Per-worker model load state; ready once every worker has loaded every model"""
+        expected = max(1, self.workers)
+        workers = list(self._warm.values())
+        ready = (self._executor is not None and len(workers) >= expected
+                 and all(m["state"] == READY for w in workers for m in w["models"].values()))
+        return {
+            "ready": ready,
+            "workers_expected": expected,
+            "workers_ready": len(workers),
+            "workers": workers,
+            "errors": self._warm_errors,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "threads_per_worker": self.threads_per_worker,
+            "pending": self._pending,
+            "max_pending": self.max_pending,
+            "saturated": self.saturated,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+
+# Initialize global instance
+vision_pool = VisionPool()
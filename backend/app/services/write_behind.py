@@ -0,0 +1,148 @@
+"""
+Write-Behind Buffer
+Collects documents (or bulk write operations) in memory and writes them to
+MongoDB in batches with insert_many / bulk_write, flushing on a size or time
+threshold. Callers only wait on the database when the buffer is full
+(backpressure), never per record.
+"""
+
+import asyncio
+import os
+import logging
+from collections import deque
+from typing import Deque, Dict, Iterable, Optional
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "500"))
+WRITE_FLUSH_INTERVAL = float(os.getenv("WRITE_FLUSH_INTERVAL", "1.0"))
+WRITE_MAX_PENDING = int(os.getenv("WRITE_MAX_PENDING", "20000"))
+
+
+class WriteBehindBuffer:
+    """
+    Batched, asynchronous writer for one collection.
+
+    add() returns immediately while fewer than max_pending documents are
+    buffered; beyond that it waits until a flush frees space. A failed flush
+    puts the batch back at the front of the queue and retries with backoff.
+    With bulk=True the queued items are pymongo write models (UpdateOne, ...)
+    and are sent with bulk_write.
+    """
+
+    def __init__(self, collection, batch_size: int = WRITE_BATCH_SIZE,
+                 flush_interval: float = WRITE_FLUSH_INTERVAL, max_pending: int = WRITE_MAX_PENDING,
+                 bulk: bool = False):
+        self.collection = collection
+        self.bulk = bulk
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._queue: Deque[Dict] = deque()
+        self._wakeup = asyncio.Event()
+        self._space = asyncio.Condition()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._flush_lock = asyncio.Lock()
+        self.written = 0
+        self.batches = 0
+        self.failures = 0
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    async def add(self, doc: Dict):
+        await self.add_many([doc])
+
+    async def add_many(self, docs: Iterable[Dict]):
+        for doc in docs:
+            if len(self._queue) >= self.max_pending:
+                # Backpressure: wait for the flusher instead of growing without bound
+                self._wakeup.set()
+                async with self._space:
+                    await self._space.wait_for(lambda: len(self._queue) < self.max_pending)
+            self._queue.append(doc)
+        if len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background flusher and write out everything still buffered"""
+        if self._task is not None:
+            # Let an in-flight flush finish rather than cancelling it mid-write
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+            self._stopping = False
+        while self._queue:
+            if not await self.flush():
+                logger.error(f"Dropping {len(self._queue)} buffered documents for {self.collection.name}")
+                break
+
+    async def flush(self) -> bool:
+        """Writes up to one batch. Returns False if the write failed"""
+        async with self._flush_lock:
+            if not self._queue:
+                return True
+            batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            try:
+                if self.bulk:
+                    await self.collection.bulk_write(batch, ordered=False)
+                else:
+                    await self.collection.insert_many(batch, ordered=False)
+            except asyncio.CancelledError:
+                self._queue.extendleft(reversed(batch))
+                raise
+            except BulkWriteError as e:
+                # Unordered write: everything not listed in writeErrors was written.
+                # For inserts, duplicate keys mean an earlier attempt already stored the
+                # document; for upserts they are a lost race and worth retrying.
+                failed = [batch[err["index"]] for err in e.details.get("writeErrors", [])
+                          if self.bulk or err.get("code") != 11000]
+                self.failures += 1
+                self.written += len(batch) - len(failed)
+                logger.error(f"Write-behind flush to {self.collection.name}: {len(failed)} document(s) failed")
+                self._queue.extendleft(reversed(failed))
+                return not failed
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Write-behind flush to {self.collection.name} failed: {str(e)}")
+                self._queue.extendleft(reversed(batch))
+                return False
+            self.written += len(batch)
+            self.batches += 1
+        async with self._space:
+            self._space.notify_all()
+        return True
+
+    async def _run(self):
+        backoff = self.flush_interval
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=backoff)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._stopping:
+                return
+
+            ok = True
+            while ok and self._queue:
+                ok = await self.flush()
+                # Only drain back-to-back while full batches are waiting
+                if len(self._queue) < self.batch_size:
+                    break
+            backoff = self.flush_interval if ok else min(backoff * 2, 30.0)
+
+    def stats(self) -> Dict:
+        return {
+            "pending": len(self._queue),
+            "written": self.written,
+            "batches": self.batches,
+            "failures": self.failures,
+        }
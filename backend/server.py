@@ -1,22 +1,29 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 import uvicorn
 import cv2
 import numpy as np
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import List, Optional
 from motor.motor_asyncio import AsyncIOMotorClient
 
 # AI Services (Imported from existing structure)
 import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from app.services.face_recog import recognize_faces, encode_face
-from app.services.engagement import engagement_detector
-from app.services.ollama_ai import generate_student_report
-from app.services.advanced_ai import emotion_engine, posture_analyzer
-from app.services.analytics_engine import engagement_scorer, predictive_analytics
+from app.services.face_gallery import face_gallery
+from app.services.face_encoding import encoding_fields
+from app.services.camera_session import CameraSession, camera_sessions
+from app.services.frame_processor import FrameProcessor, InvalidFrameError, MAX_BATCH_FRAMES
+from app.services.stream_session import StreamSession
+from app.services.vision_pool import vision_pool, encode_image, PoolSaturatedError
+from app.services.video_processing import VideoJob, VideoReader, VideoOpenError, VIDEO_SAMPLE_FPS, running_jobs, start_background, upload_path
+from app.services.ai.ollama_client import ollama_client
+from app.services.insight_cache import insight_refresher, PLACEHOLDER_INSIGHT
+from app.services.analytics_engine import predictive_analytics, trend_analyzer
+from app.services import rollups
+from app.services.risk import bulk_risk, student_risk_input
 
 app = FastAPI(title="SmartView AI - MongoDB Backend")
 
@@ -25,15 +32,31 @@ MONGO_URI = "mongodb://localhost:27017"
 DB_NAME = "attendance_app"
 client = AsyncIOMotorClient(MONGO_URI)
 db = client[DB_NAME]
+frame_processor = FrameProcessor(db)
 
 @app.on_event("startup")
 async def startup_event():
+    vision_pool.start()
+    await frame_processor.start()
+    try:
+        loaded = await face_gallery.load(db.students)
+        print(f"🧠 Face gallery loaded: {loaded} encoding(s)")
+    except Exception as e:
+        print(f"⚠️  Face gallery load failed: {e}")
+
     print("\n" + "="*50)
-    print("🚀 SMARTVIEW AI BACKEND IS ONLINE & READY")
+    print("🚀 SMARTVIEW AI BACKEND IS ONLINE (vision models warming up, see /ready)")
     print(f"📍 API BASE: http://127.0.0.1:8000/api/v1")
     print(f"📊 DATABASE: MongoDB (Local)")
     print("="*50 + "\n")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await frame_processor.stop()
+    face_gallery.save_index()
+    vision_pool.shutdown()
+    await ollama_client.aclose()
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -47,9 +70,18 @@ app.add_middleware(
 async def health():
     try:
         await client.admin.command('ping')
-        return {"status": "ready", "db": "MongoDB Connected"}
+        return {"status": "ready", "db": "MongoDB Connected", "vision_pool": vision_pool.stats(),
+                "writes": frame_processor.recorder.stats(), "insights": insight_refresher.stats(),
+                "ollama": ollama_client.stats()}
     except Exception as e:
-        return {"status": "error", "db": f"MongoDB Connection Failed: {str(e)}"}
+        return {"status": "error", "db": f"MongoDB Connection Failed: {str(e)}", "vision_pool": vision_pool.stats(),
+                "writes": frame_processor.recorder.stats()}
+
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 200 once every vision worker has loaded and warmed its models, 503 until then"""
+    readiness = vision_pool.readiness()
+    return JSONResponse(readiness, status_code=200 if readiness["ready"] else 503)
 
 @app.post("/api/v1/students/register")
 async def register_student(
@@ -57,126 +89,176 @@ async def register_student(
     name: str = Form(...),
     image: UploadFile = File(...)
 ):
-    # Save temp image to encode
-    temp_path = f"temp_{student_id}.jpg"
-    with open(temp_path, "wb") as f:
-        f.write(await image.read())
-    
-    encoding = encode_face(temp_path)
-    if os.path.exists(temp_path):
-        os.remove(temp_path)
-    
+    try:
+        encoding = await vision_pool.run(encode_image, await image.read())
+    except PoolSaturatedError:
+        raise HTTPException(status_code=503, detail="Vision workers busy, retry shortly", headers={"Retry-After": "1"})
+
     if encoding is None:
         raise HTTPException(status_code=400, detail="No face detected in registration image")
     
     try:
         await db.students.update_one(
             {"student_id": student_id},
-            {"$set": {"student_id": student_id, "name": name, "face_encoding": encoding}},
+            {"$set": {"student_id": student_id, "name": name, **encoding_fields(encoding)}},
             upsert=True
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    
+
+    face_gallery.upsert(student_id, encoding)
+    return {"status": "ok", "student_id": student_id}
+
+@app.delete("/api/v1/students/{student_id}")
+async def delete_student(student_id: str):
+    try:
+        result = await db.students.delete_one({"student_id": student_id})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    face_gallery.remove(student_id)
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Student not found")
     return {"status": "ok", "student_id": student_id}
 
 @app.post("/api/v1/attendance/process-frame")
-async def process_frame(image: UploadFile = File(...)):
+async def process_frame(image: UploadFile = File(...), camera_id: str = Form("default")):
     contents = await image.read()
-    nparr = np.frombuffer(contents, np.uint8)
-    frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-    # Fetch known faces
-    students_cursor = db.students.find({}, {"student_id": 1, "face_encoding": 1})
-    known_ids = []
-    known_encodings = []
-    async for student in students_cursor:
-        known_ids.append(student["student_id"])
-        known_encodings.append(student["face_encoding"])
-
-    if not known_encodings:
-        return {"recognized_students": [], "count": 0, "message": "No students registered"}
-
-    # Recognize
-    found_ids = recognize_faces(frame, known_encodings, known_ids)
-    
-    print(f"[{datetime.now().strftime('%H:%M:%S')}] 🔍 Analyzed frame: {len(found_ids)} student(s) detected.")
-
-    # Engagement
-    engagement_metrics = engagement_detector.detect_engagement(frame)
-    # Advanced AI Analysis
-    emotions = emotion_engine.analyze_emotions(frame, []) # TODO: Pass face locations if available
-    posture_data = posture_analyzer.analyze_posture(frame)
-
-    # Log in DB
-    results = []
-    for i, student_id in enumerate(found_ids):
-        # Base engagement score
-        base_score = engagement_metrics[i]["engagement_score"] if i < len(engagement_metrics) else 100.0
-        
-        # Comprehensive Enterprise Score
-        metrics = {
-            'eye_aspect_ratio': base_score / 100,
-            'head_pose': engagement_metrics[i].get('head_pose', 0) if i < len(engagement_metrics) else 0,
-            'emotion': emotions[i]['dominant_emotion'] if i < len(emotions) else 'neutral',
-            'posture_score': posture_data[i]['posture_score'] if i < len(posture_data) else 70,
-            'attention_duration': 10  # Placeholder for session tracking
-        }
-        comprehensive_score = engagement_scorer.calculate_comprehensive_score(metrics)
-
-        timestamp = datetime.now()
-        log = {
-            "student_id": student_id, 
-            "timestamp": timestamp, 
-            "engagement_score": comprehensive_score,
-            "base_score": base_score,
-            "emotion": metrics['emotion'],
-            "posture_score": metrics['posture_score'],
-            "is_present": True
-        }
-        await db.attendance.insert_one(log)
-        results.append({
-            "student_id": student_id, 
-            "score": comprehensive_score, 
-            "emotion": metrics['emotion']
-        })
+    # Per-camera tracker lets confident faces skip re-encoding
+    session = camera_sessions.get(camera_id)
+    try:
+        return await frame_processor.process(contents, session)
+    except PoolSaturatedError:
+        raise HTTPException(status_code=503, detail="Vision workers busy, frame dropped", headers={"Retry-After": "1"})
+    except InvalidFrameError:
+        raise HTTPException(status_code=400, detail="Invalid image")
+
+@app.post("/api/v1/attendance/process-batch")
+async def process_batch(images: List[UploadFile] = File(...), captured_at: Optional[List[datetime]] = Form(None),
+                        camera_id: str = Form("default")):
+    """
+    Buffered frames of one camera (e.g. a lecture recorder catching up), one
+    captured_at per image; without timestamps the upload order is used.
+    """
+    if len(images) > MAX_BATCH_FRAMES:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_FRAMES} frames per batch")
+    if captured_at and len(captured_at) != len(images):
+        raise HTTPException(status_code=400, detail="captured_at must have one entry per image")
+    now = datetime.now()
+    times = [t.astimezone().replace(tzinfo=None) if t.tzinfo else t for t in captured_at] if captured_at else [now] * len(images)
+    frames = [(await image.read(), t) for image, t in zip(images, times)]
+    session = camera_sessions.get(camera_id)
+    try:
+        return await frame_processor.process_batch(frames, session)
+    except PoolSaturatedError:
+        raise HTTPException(status_code=503, detail="Vision workers busy, batch dropped", headers={"Retry-After": "1"})
+
+@app.post("/api/v1/attendance/sessions/start")
+async def start_class_session(class_name: str = Form(...), camera_id: str = Form("default")):
+    """Starts a class session for a camera; detections are attributed to it until stopped"""
+    session = await frame_processor.recorder.sessions.start_session(class_name, camera_id)
+    return session.to_dict()
+
+@app.post("/api/v1/attendance/sessions/{session_id}/stop")
+async def stop_class_session(session_id: str):
+    session = await frame_processor.recorder.sessions.stop_session(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="No active session with this id")
+    return session.to_dict()
+
+@app.get("/api/v1/attendance/sessions")
+async def list_class_sessions():
+    return [s.to_dict() for s in frame_processor.recorder.sessions.active_sessions()]
 
-    return {"recognized_students": found_ids, "count": len(found_ids), "details": results}
+@app.post("/api/v1/attendance/video-jobs")
+async def start_video_job(path: str = Form(...), class_name: Optional[str] = Form(None),
+                          session_id: Optional[str] = Form(None), sample_fps: float = Form(VIDEO_SAMPLE_FPS),
+                          recorded_at: Optional[datetime] = Form(None), job_id: Optional[str] = Form(None)):
+    """
+    Processes a recorded lecture from the upload directory (VIDEO_UPLOAD_DIR,
+    path is relative to it) in the background, into the given active session
+    or a new session for class_name. Starting a job id that was interrupted
+    resumes it; poll GET /video-jobs/{job_id} for progress.
+    """
+    if not (class_name or session_id):
+        raise HTTPException(status_code=400, detail="class_name or session_id is required")
+    if recorded_at is not None and recorded_at.tzinfo:
+        recorded_at = recorded_at.astimezone().replace(tzinfo=None)
+    try:
+        path = upload_path(path)
+        job = VideoJob(db, frame_processor, path, job_id=job_id, class_name=class_name, session_id=session_id,
+                       sample_fps=sample_fps, recorded_at=recorded_at)
+        VideoReader(path, sample_fps)  # an unreadable video fails the request, not the background task
+    except (OSError, VideoOpenError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not start_background(job):
+        raise HTTPException(status_code=409, detail="Video job is already running")
+    return {"job_id": job.job_id, "started": True}
+
+@app.get("/api/v1/attendance/video-jobs/{job_id}")
+async def get_video_job(job_id: str):
+    job = await db.video_jobs.find_one({"job_id": job_id}, {"_id": 0})
+    if job is None:
+        raise HTTPException(status_code=404, detail="Video job not found")
+    job["running"] = job_id in running_jobs
+    return job
+
+@app.get("/api/v1/attendance/sessions/{session_id}/absent")
+async def list_absent_students(session_id: str):
+    """Rostered students not seen in a closed session"""
+    return {"session_id": session_id, "absent": frame_processor.recorder.presence.absent_from(session_id)}
+
+@app.get("/api/v1/attendance/presence")
+async def get_presence(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                       class_name: Optional[str] = None, student_id: Optional[str] = None):
+    """Attendance rates over closed sessions in [start, end), optionally for one class or student"""
+    presence = frame_processor.recorder.presence
+    if student_id:
+        return {"student_id": student_id, **presence.consistency(student_id, start, end)}
+    return presence.attendance(start=start, end=end, class_name=class_name)
+
+@app.websocket("/api/v1/attendance/stream")
+async def attendance_stream(websocket: WebSocket, camera_id: str = "default"):
+    """Long-lived camera feed: binary JPEG frames in, JSON results out"""
+    await websocket.accept()
+    # Per-connection tracker and gallery snapshot, not shared with HTTP frames from the same camera_id
+    stream = StreamSession(websocket, CameraSession(camera_id), frame_processor)
+    try:
+        await stream.run()
+    except WebSocketDisconnect:
+        pass
 
 @app.get("/api/v1/analytics/overview")
 async def get_overview():
     try:
         total_students = await db.students.count_documents({})
         
-        # Aggregate average engagement
-        pipeline = [
-            {"$group": {"_id": None, "avg_engage": {"$avg": "$engagement_score"}}}
-        ]
-        agg_result = await db.attendance.aggregate(pipeline).to_list(1)
-        avg_engagement = agg_result[0]["avg_engage"] if agg_result else 0.0
-        
-        # Today's attendance
-        today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        today_attendance = await db.attendance.distinct("student_id", {"timestamp": {"$gte": today_start}})
+        # Average engagement and today's attendance from the daily rollups
+        avg_engagement = await rollups.overall_average(db)
+        today_attendance = await rollups.students_seen_on(db, datetime.now())
+        attendance_30d = frame_processor.recorder.presence.attendance(start=datetime.now() - timedelta(days=30))
         
-        # Get last 10 engagement points for AI analysis
-        recent_logs = await db.attendance.find({}, {"engagement_score": 1}).sort("timestamp", -1).to_list(10)
-        trends = [l["engagement_score"] for l in recent_logs]
+        # Last 10 hourly engagement points for AI analysis
+        recent_rows = await rollups.latest_rows(db, grain="hour", limit=10)
+        trends = [rollups.row_stats(r)["mean"] for r in recent_rows]
         
-        # Generate AI Insight (Fast, non-blocking-ish or with default)
-        ai_insight = "System gathering data for analysis..."
+        # AI insight comes from the background refresher and never waits on Ollama
+        insight = {"insight": PLACEHOLDER_INSIGHT, "age_seconds": None, "stale": True}
         if len(trends) >= 3:
             # We use a summarized version for the main dashboard
-            ai_insight = generate_student_report(
-                attendance_data={"total": total_students, "present_today": len(today_attendance)},
+            insight = insight_refresher.get(
+                attendance_data={"total": total_students, "present_today": today_attendance},
                 engagement_trends=trends
             )
 
         return {
             "total_students": total_students,
             "avg_engagement": round(avg_engagement, 2),
-            "today_attendance": len(today_attendance),
-            "ai_insight": ai_insight,
+            "today_attendance": today_attendance,
+            "attendance_rate": attendance_30d["attendance_rate"],
+            "ai_insight": insight["insight"],
+            "ai_insight_age_seconds": insight["age_seconds"],
+            "ai_insight_stale": insight["stale"],
             "status": "Online (MongoDB + Ollama)"
         }
     except Exception as e:
@@ -186,7 +268,8 @@ async def get_overview():
 @app.get("/api/v1/students")
 async def list_students():
     try:
-        students_cursor = db.students.find({}, {"_id": 0, "face_encoding": 0})
+        students_cursor = db.students.find({}, {"_id": 0, "face_encoding": 0, "face_encoding_v": 0,
+                                               "face_encoding_model": 0})
         students = await students_cursor.to_list(100)
         return students
     except Exception as e:
@@ -210,45 +293,35 @@ async def list_attendance_logs():
 @app.get("/api/v1/students/{student_id}/risk-analysis")
 async def get_student_risk(student_id: str):
     try:
-        logs = await db.attendance.find({"student_id": student_id}).sort("timestamp", -1).limit(30).to_list(30)
-        logs_list = []
-        for l in logs:
-            l["timestamp"] = l["timestamp"].isoformat() if isinstance(l.get("timestamp"), datetime) else l.get("timestamp")
-            logs_list.append(l)
-
-        if not logs_list:
-             return {"risk_score": 0, "level": "Unknown", "factors": []}
-
-        # Calculate metrics for prediction
-        engagement_scores = [l.get('engagement_score', 0) for l in logs_list]
-        neg_emotions = sum(1 for l in logs_list if l.get('emotion') in ['sad', 'angry', 'fear'])
-        
-        student_data = {
-            'attendance_rate': 100, # Simplified for now
-            'engagement_trend': (engagement_scores[0] - engagement_scores[-1]) if len(engagement_scores) > 1 else 0,
-            'negative_emotion_rate': neg_emotions / len(logs_list) if logs_list else 0,
-            'attendance_variance': 0.1
-        }
-        
+        # Precomputed features and presence bitsets: constant time regardless of history
+        recorder = frame_processor.recorder
+        student_data = student_risk_input(recorder.features, recorder.presence, student_id,
+                                          recorder.sessions.active_sessions())
+        if student_data is None:
+            return {"risk_score": 0, "level": "Unknown", "factors": []}
+
         analysis = predictive_analytics.calculate_dropout_risk(student_data)
         return analysis
     except Exception as e:
         print(f"Risk analysis error: {str(e)}")
         return {"error": str(e)}
 
+@app.get("/api/v1/analytics/risk")
+async def get_bulk_risk(class_name: Optional[str] = None, page: int = 1, page_size: int = 50, order: str = "desc"):
+    """Dropout risk for every student (or one class) from precomputed features, sorted by risk score"""
+    try:
+        recorder = frame_processor.recorder
+        return await bulk_risk(db, recorder.features, recorder.presence, class_name, page, page_size,
+                               descending=order != "asc", active_sessions=recorder.sessions.active_sessions())
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/v1/analytics/forecast")
 async def get_engagement_forecast():
     try:
-        pipeline = [
-            {"$group": {
-                "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp"}},
-                "avg_engagement": {"$avg": "$engagement_score"}
-            }},
-            {"$sort": {"_id": 1}},
-            {"$limit": 30}
-        ]
-        daily_data = await db.attendance.aggregate(pipeline).to_list(30)
-        historical = [d['avg_engagement'] for d in daily_data]
+        # Latest 30 days, oldest first
+        daily_data = await rollups.latest_rows(db, grain="day", limit=30)
+        historical = [rollups.row_stats(d)["mean"] for d in daily_data]
         
         if len(historical) < 3:
              return {"forecast": [], "msg": "Insufficient data"}
@@ -258,5 +331,36 @@ async def get_engagement_forecast():
     except Exception as e:
          return {"error": str(e)}
 
+@app.get("/api/v1/analytics/forecast/all")
+async def get_engagement_forecast_all(scope: str = "student", days: int = 30, periods: int = 7):
+    """Forecast for every student (scope=student) or class (scope=class) in one batched fit"""
+    try:
+        return await rollups.forecast_all(db, scope, days, periods)
+    except Exception as e:
+        return {"error": str(e)}
+
+@app.get("/api/v1/analytics/trends")
+async def get_engagement_trends(scope: str = "all", key: str = "*", days: int = 30):
+    """Daily engagement statistics for the school, a class (scope=class) or a student (scope=student)"""
+    try:
+        return await rollups.engagement_trends(db, scope, key, days)
+    except Exception as e:
+        return {"error": str(e)}
+
+@app.get("/api/v1/analytics/class-trends")
+async def get_class_trends(class_name: Optional[str] = None, start: Optional[datetime] = None,
+                           end: Optional[datetime] = None):
+    """Engagement/attendance statistics over attendance records, streamed from the cursor in one pass"""
+    try:
+        query = {"class_name": class_name} if class_name else {}
+        if start or end:
+            query["timestamp"] = {**({"$gte": start} if start else {}), **({"$lt": end} if end else {})}
+        cursor = db.attendance.find(
+            query, {"_id": 0, "engagement_score": 1, "is_present": 1, "timestamp": 1}
+        ).sort("timestamp", 1).batch_size(1000)
+        return await trend_analyzer.analyze_class_trends_async(cursor)
+    except Exception as e:
+        return {"error": str(e)}
+
 if __name__ == "__main__":
     uvicorn.run("server:app", host="0.0.0.0", port=8000, reload=True)
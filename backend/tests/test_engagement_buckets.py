@@ -0,0 +1,50 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app.services.engagement_buckets import EngagementBucketStore, OpenBucket, MAX_DELTA_DS, decode_bucket
+
+
+class FakeCollection:
+    name = "engagement_buckets"
+
+    async def find_one(self, *args, **kwargs):
+        return None
+
+
+class FakeDB:
+    engagement_buckets = FakeCollection()
+
+
+def log(student_id, timestamp, score=50.0):
+    return {"student_id": student_id, "timestamp": timestamp, "engagement_score": score}
+
+
+def test_fits_rejects_out_of_order_and_overflowing_samples():
+    start = datetime(2024, 3, 4, 9, 0)
+    bucket = OpenBucket("s1", "sess", 0, start)
+    assert not bucket.fits(start - timedelta(seconds=1))
+    bucket.append(log("s1", start + timedelta(seconds=10)))
+    assert bucket.fits(start + timedelta(seconds=11))
+    assert not bucket.fits(start + timedelta(seconds=9))
+    assert not bucket.fits(start + timedelta(seconds=10) + timedelta(milliseconds=100) * (MAX_DELTA_DS + 1))
+
+
+def test_out_of_order_sample_starts_new_bucket_and_keeps_its_timestamp():
+    async def run():
+        store = EngagementBucketStore(FakeDB())
+        start = datetime(2024, 3, 4, 9, 0)
+        times = [start, start + timedelta(seconds=20), start + timedelta(seconds=5)]
+        await store.add("sess", [log("s1", t) for t in times])
+        return store
+
+    store = asyncio.run(run())
+    sealed = [op._doc["$set"] for op in store.writer._queue]
+    open_bucket = store._open[("s1", "sess")]
+    assert len(sealed) == 1 and sealed[0]["count"] == 2
+    assert open_bucket.seq == 1 and open_bucket.timestamps == [datetime(2024, 3, 4, 9, 0, 5)]
+
+    decoded = decode_bucket(sealed[0])
+    expected = np.array(["2024-03-04T09:00:00", "2024-03-04T09:00:20"], dtype="datetime64[ms]")
+    assert (decoded["timestamp"] == expected).all()
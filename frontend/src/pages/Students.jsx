@@ -33,19 +33,18 @@ export default function Students() {
 
     useEffect(() => {
         const fetchRiskData = async () => {
-            const risks = {};
-            await Promise.all(
-                students.map(async (s) => {
-                    try {
-                        const res = await fetch(`http://127.0.0.1:8000/api/v1/students/${s.student_id}/risk-analysis`);
-                        const data = await res.json();
-                        risks[s.student_id] = data;
-                    } catch (e) {
-                        console.log("Risk fetch error", e);
-                    }
-                })
-            );
-            setStudentRisks(risks);
+            try {
+                // One bulk request for the whole roster instead of one per student
+                const res = await fetch(`http://127.0.0.1:8000/api/v1/analytics/risk?page_size=${students.length}`);
+                const data = await res.json();
+                const risks = {};
+                (data.items || []).forEach((item) => {
+                    risks[item.student_id] = item;
+                });
+                setStudentRisks(risks);
+            } catch (e) {
+                console.log("Risk fetch error", e);
+            }
         };
         if (students.length > 0) fetchRiskData();
     }, [students]);